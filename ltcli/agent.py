@@ -0,0 +1,150 @@
+import atexit
+import hashlib
+import io
+import json
+import os
+from threading import Lock
+
+from ltcli import net, utils
+from ltcli.log import logger
+from ltcli.exceptions import AgentError
+
+
+AGENT_ENV = 'LTCLI_AGENT'
+SERVER_PATH = os.path.join(os.path.dirname(__file__), 'agent_server.py')
+# requests sent before reading responses. ssh channel window is limited
+BATCH_SIZE = 64
+
+
+def is_enabled():
+    """Agent is used if env LTCLI_AGENT is set. ex) export LTCLI_AGENT=1"""
+    return os.environ.get(AGENT_ENV, '').lower() in ['1', 'true', 'yes']
+
+
+def _server_source():
+    with open(SERVER_PATH, 'rb') as fd:
+        source = fd.read()
+    return source, hashlib.sha1(source).hexdigest()[:12]
+
+
+class Agent(object):
+    """Client of agent on a remote host
+
+    agent_server.py is uploaded to home directory of remote host once per
+    version and runs as long as the ssh channel is open. Requests are
+    written to stdin of the channel and responses are read from stdout,
+    a json per line.
+    """
+
+    def __init__(self, client):
+        """
+        :param client: SSHClient
+        """
+        self.host = client.hostname
+        self._lock = Lock()
+        self._next_id = 0
+        source, digest = _server_source()
+        remote_path = '.ltcli_agent_{}.py'.format(digest)
+        sftp = net.get_sftp(client)
+        try:
+            sftp.stat(remote_path)
+        except IOError:
+            sftp.putfo(io.BytesIO(source), remote_path)
+        finally:
+            sftp.close()
+        command = 'exec $(command -v python3 || command -v python) -u {}'
+        command = command.format(remote_path)
+        logger.debug('[agent] {}: {}'.format(self.host, command))
+        self.channel = client.get_transport().open_session()
+        self.channel.exec_command(command)
+        self.stdin = self.channel.makefile('wb')
+        self.stdout = self.channel.makefile('rb')
+        self.call('ping')
+
+    def _read(self, op):
+        line = self.stdout.readline()
+        if not line:
+            stderr = utils.to_str(self.channel.recv_stderr(4096))
+            raise AgentError(self.host, op, stderr or 'channel closed')
+        return json.loads(utils.to_str(line))
+
+    def call_many(self, requests):
+        """Send requests in a round trip
+
+        :param requests: list of (op, args dict)
+        :return: list of result in the same order
+        """
+        ret = []
+        with self._lock:
+            for i in range(0, len(requests), BATCH_SIZE):
+                batch = requests[i:i + BATCH_SIZE]
+                lines = []
+                for op, args in batch:
+                    self._next_id += 1
+                    req = {'id': self._next_id, 'op': op, 'args': args}
+                    lines.append(json.dumps(req))
+                self.stdin.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                self.stdin.flush()
+                responses = [self._read(op) for op, _ in batch]
+                for (op, _), res in zip(batch, responses):
+                    if not res['ok']:
+                        raise AgentError(self.host, op, res['error'])
+                    ret.append(res['result'])
+        return ret
+
+    def call(self, op, **args):
+        return self.call_many([(op, args)])[0]
+
+    @property
+    def active(self):
+        return not self.channel.closed and not self.channel.exit_status_ready()
+
+    def close(self):
+        self.channel.close()
+
+
+class AgentPool(object):
+    """Share an Agent per host between threads"""
+
+    def __init__(self):
+        self.ssh_pool = net.SSHPool()
+        self._agents = {}
+        self._host_locks = {}
+        self._lock = Lock()
+
+    def get(self, host):
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host, Lock())
+        with host_lock:
+            agent = self._agents.get(host)
+            if agent is not None and agent.active:
+                return agent
+            agent = Agent(self.ssh_pool.get(host))
+            self._agents[host] = agent
+            return agent
+
+    def close(self):
+        with self._lock:
+            agents = list(self._agents.values())
+            self._agents = {}
+        for agent in agents:
+            agent.close()
+        self.ssh_pool.close()
+
+
+_pool = None
+_pool_lock = Lock()
+
+
+def get(host):
+    """Get Agent of host. Agents are closed at exit
+
+    :param host: host
+    :return: Agent
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AgentPool()
+            atexit.register(_pool.close)
+    return _pool.get(host)
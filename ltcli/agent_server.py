@@ -0,0 +1,349 @@
+"""ltcli agent
+
+Run on a remote host by ltcli over ssh (see ltcli.agent). It reads a
+request per line from stdin and writes a response per line to stdout.
+
+request: {"id": 1, "op": "mkdir", "args": {"paths": ["/a", "/b"]}}
+response: {"id": 1, "ok": true, "result": ...}
+          {"id": 1, "ok": false, "error": "..."}
+
+This file must not import ltcli, and must work with python 2 and 3.
+"""
+import errno
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+
+
+VERSION = 1
+
+# state of /proc/net/tcp
+TCP_LISTEN = '0A'
+
+ENV_PATTERN = re.compile(r'\$(\w+)|\$\{(\w+)\}')
+
+
+def op_ping():
+    return {'version': VERSION, 'pid': os.getpid(), 'host': socket.gethostname()}
+
+
+def _cmdline(pid):
+    with open('/proc/{}/cmdline'.format(pid), 'rb') as fd:
+        args = fd.read().decode('utf-8', 'replace').split('\0')
+    return ' '.join(arg for arg in args if arg)
+
+
+def _uid(pid):
+    return os.stat('/proc/{}'.format(pid)).st_uid
+
+
+def op_ps(pattern=None, mine=False):
+    """Processes whose command line matches pattern(regex)
+
+    :return: list of {pid, uid, cmdline}
+    """
+    regex = re.compile(pattern) if pattern else None
+    uid = os.getuid()
+    ret = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            cmdline = _cmdline(name)
+            owner = _uid(name)
+        except (IOError, OSError):
+            # process exited
+            continue
+        if not cmdline or int(name) == os.getpid():
+            continue
+        if mine and owner != uid:
+            continue
+        if regex is not None and not regex.search(cmdline):
+            continue
+        ret.append({'pid': int(name), 'uid': owner, 'cmdline': cmdline})
+    return ret
+
+
+def op_kill(pids, sig=signal.SIGTERM):
+    """
+    :return: list of pid signaled
+    """
+    ret = []
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+            ret.append(pid)
+        except OSError as ex:
+            if ex.errno != errno.ESRCH:
+                raise
+    return ret
+
+
+def op_manifest(path):
+    """Files under path
+
+    :return: dict {relative path: {size, mtime, mode}}
+    """
+    ret = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            try:
+                st = os.lstat(file_path)
+            except OSError:
+                continue
+            ret[os.path.relpath(file_path, path)] = {
+                'size': st.st_size,
+                'mtime': int(st.st_mtime),
+                'mode': st.st_mode & 0o7777,
+            }
+    return ret
+
+
+def op_mkdir(paths):
+    for path in paths:
+        try:
+            os.makedirs(path)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST or not os.path.isdir(path):
+                raise
+    return len(paths)
+
+
+def op_rm(paths):
+    """Remove files or directories. Not existing path is ignored"""
+    count = 0
+    for path in paths:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+        else:
+            continue
+        count += 1
+    return count
+
+
+def op_mv(pairs):
+    """
+    :param pairs: list of [src, dst]
+    """
+    for src, dst in pairs:
+        shutil.move(src, dst)
+    return len(pairs)
+
+
+def op_rotate(paths, keep=5):
+    """Rotate log files. file -> file.1 -> file.2 ... -> file.<keep>
+
+    :return: number of rotated files
+    """
+    count = 0
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        for i in range(keep - 1, 0, -1):
+            src = '{}.{}'.format(path, i)
+            if os.path.exists(src):
+                os.rename(src, '{}.{}'.format(path, i + 1))
+        if keep > 0:
+            os.rename(path, '{}.1'.format(path))
+        else:
+            os.remove(path)
+        count += 1
+    return count
+
+
+def parse_tcp_table(text):
+    """Listening sockets of /proc/net/tcp or /proc/net/tcp6
+
+    :param text: content of the file
+    :return: dict {port: (uid, inode)}
+    """
+    ret = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 10 or fields[3] != TCP_LISTEN:
+            continue
+        port = int(fields[1].rsplit(':', 1)[1], 16)
+        ret[port] = (int(fields[7]), int(fields[9]))
+    return ret
+
+
+def parse_netstat_listen(text):
+    """Listening tcp ports of 'netstat -an', for hosts without /proc/net/tcp
+
+    :param text: output of netstat
+    :return: set of port
+    """
+    ret = set()
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 6 or not fields[0].startswith('tcp'):
+            continue
+        if fields[-1] != 'LISTEN':
+            continue
+        # 0.0.0.0:6379, :::6379 or *.6379 of BSD
+        port = re.split('[:.]', fields[3])[-1]
+        if port.isdigit():
+            ret.add(int(port))
+    return ret
+
+
+def parse_socket_owners(lines):
+    """
+    :param lines: list of '<fd dir> <link>' like
+        '/proc/123/fd socket:[4567]'
+    :return: dict {inode: pid}
+    """
+    ret = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 2 or not fields[1].startswith('socket:['):
+            continue
+        pid = fields[0].split('/')[2]
+        if pid.isdigit():
+            ret[int(fields[1][8:-1])] = int(pid)
+    return ret
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as fd:
+            return fd.read()
+    except IOError:
+        return ''
+
+
+def _socket_owners():
+    lines = []
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        fd_dir = '/proc/{}/fd'.format(pid)
+        try:
+            for fd in os.listdir(fd_dir):
+                link = os.readlink(os.path.join(fd_dir, fd))
+                lines.append('{} {}'.format(fd_dir, link))
+        except OSError:
+            # process exited or owned by other user
+            continue
+    return parse_socket_owners(lines)
+
+
+def _user(uid):
+    try:
+        import pwd
+        return pwd.getpwuid(uid).pw_name
+    except (ImportError, KeyError):
+        return str(uid)
+
+
+def op_ports(ports=None, owner=False):
+    """Listening tcp ports
+
+    :param ports: ports to check. If not set, all listening ports
+    :param owner: If true, find pid and user of each port
+    :return: sorted list of port. If owner, list of [port, pid, user].
+        pid is null if the process is not visible
+    """
+    if os.path.exists('/proc/net/tcp'):
+        listen = parse_tcp_table(_read('/proc/net/tcp'))
+        listen.update(parse_tcp_table(_read('/proc/net/tcp6')))
+    else:
+        out = subprocess.check_output(['netstat', '-an'])
+        out = out.decode('utf-8', 'replace')
+        listen = dict((port, None) for port in parse_netstat_listen(out))
+    found = sorted(listen.keys())
+    if ports is not None:
+        found = sorted(set(found) & set(ports))
+    if not owner:
+        return found
+    owners = _socket_owners() if os.path.isdir('/proc') else {}
+    ret = []
+    for port in found:
+        if listen[port] is None:
+            # owner is not known from netstat
+            ret.append([port, None, '-'])
+            continue
+        uid, inode = listen[port]
+        ret.append([port, owners.get(inode), _user(uid)])
+    return ret
+
+
+def render(text, values):
+    """Substitute $VAR and ${VAR} like envsubst
+
+    Undefined variable becomes empty string.
+    """
+    def _sub(match):
+        name = match.group(1) or match.group(2)
+        return values.get(name, os.environ.get(name, ''))
+    return ENV_PATTERN.sub(_sub, text)
+
+
+def op_render(template, targets):
+    """Render template file to files
+
+    :param template: path of template
+    :param targets: list of [path, values]
+    """
+    with open(template, 'r') as fd:
+        text = fd.read()
+    for path, values in targets:
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'w') as fd:
+            fd.write(render(text, values))
+        os.rename(tmp_path, path)
+    return len(targets)
+
+
+OPS = {
+    'ping': op_ping,
+    'ps': op_ps,
+    'kill': op_kill,
+    'manifest': op_manifest,
+    'mkdir': op_mkdir,
+    'rm': op_rm,
+    'mv': op_mv,
+    'rotate': op_rotate,
+    'ports': op_ports,
+    'render': op_render,
+}
+
+
+def handle(line):
+    req_id = None
+    try:
+        req = json.loads(line)
+        req_id = req.get('id')
+        func = OPS[req['op']]
+        result = func(**req.get('args', {}))
+        return {'id': req_id, 'ok': True, 'result': result}
+    except Exception as ex:
+        error = '{}: {}'.format(type(ex).__name__, ex)
+        return {'id': req_id, 'ok': False, 'error': error}
+
+
+def main():
+    stdin = sys.stdin
+    stdout = sys.stdout
+    while True:
+        line = stdin.readline()
+        if not line:
+            # ssh channel is closed
+            break
+        line = line.strip()
+        if not line:
+            continue
+        stdout.write(json.dumps(handle(line)) + '\n')
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
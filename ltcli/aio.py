@@ -0,0 +1,432 @@
+"""asyncio execution core. Python 3.5 or later
+
+Thousands of instances are handled as tasks of an event loop instead of
+threads. Redis is spoken natively with an async RESP client over the
+hiredis reader. ssh (paramiko) is blocking, so it runs on a bounded
+thread pool behind an async adapter.
+
+This module has syntax of python 3. Import it like below and fall back
+to threads if it is None.
+
+    try:
+        from ltcli import aio
+    except (ImportError, SyntaxError):
+        aio = None
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import hiredis
+
+from ltcli import net
+from ltcli.log import logger
+from ltcli.parallel import Result
+from ltcli.redistrib2.connection import ENCODING, squash_commands
+
+
+DEFAULT_LIMIT = 256
+SSH_THREADS = 32
+
+# status of ping. same as exit code of 'timeout redis-cli ping'
+PING_OK = 0
+PING_REFUSED = 1
+PING_TIMEOUT = 124
+
+
+def _decode(reply):
+    if isinstance(reply, list):
+        return [_decode(i) for i in reply]
+    if isinstance(reply, bytes):
+        return reply.decode(ENCODING)
+    return reply
+
+
+class RedisConnection(object):
+    """Async RESP connection"""
+
+    def __init__(self, host, port, reader, writer):
+        self.host = host
+        self.port = port
+        self._reader = reader
+        self._writer = writer
+        self._parser = hiredis.Reader()
+
+    @classmethod
+    async def open(cls, host, port, timeout=5):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port),
+            timeout
+        )
+        return cls(host, port, reader, writer)
+
+    async def _read_replies(self, n):
+        replies = []
+        while len(replies) < n:
+            reply = self._parser.gets()
+            if reply is not False:
+                replies.append(reply)
+                continue
+            data = await self._reader.read(16384)
+            if not data:
+                raise ConnectionError(
+                    'connection closed: {}:{}'.format(self.host, self.port)
+                )
+            self._parser.feed(data)
+        return replies
+
+    async def execute_bulk(self, commands):
+        """Pipeline commands
+
+        :param commands: list of command(list of args)
+        :return: list of reply. Error reply is hiredis.ReplyError in list
+        """
+        for chunk in squash_commands(commands):
+            self._writer.write(chunk)
+        await self._writer.drain()
+        return _decode(await self._read_replies(len(commands)))
+
+    async def execute(self, *args):
+        reply = (await self.execute_bulk([args]))[0]
+        if isinstance(reply, hiredis.ReplyError):
+            raise reply
+        return reply
+
+    def close(self):
+        self._writer.close()
+
+
+class RedisPool(object):
+    """Idle connections per address for reuse in a loop"""
+
+    def __init__(self, timeout=5, max_idle=1):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = {}
+
+    async def execute(self, host, port, *args):
+        """See execute_bulk"""
+        reply = (await self.execute_bulk(host, port, [args]))[0]
+        if isinstance(reply, hiredis.ReplyError):
+            raise reply
+        return reply
+
+    async def execute_bulk(self, host, port, commands):
+        """Pipeline commands. Timeout covers connect and all replies"""
+        idle = self._idle.setdefault((host, port), [])
+        if idle:
+            conn = idle.pop()
+        else:
+            conn = await RedisConnection.open(host, port, self.timeout)
+        try:
+            ret = await asyncio.wait_for(
+                conn.execute_bulk(commands),
+                self.timeout
+            )
+        except BaseException:
+            # reply of cancelled command may be left in stream
+            conn.close()
+            raise
+        if len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+        return ret
+
+    def close(self):
+        idle_lists = list(self._idle.values())
+        self._idle = {}
+        for idle in idle_lists:
+            for conn in idle:
+                conn.close()
+
+
+class SSHAdapter(object):
+    """Run blocking ssh commands from coroutines
+
+    Commands run on a thread pool of fixed size, so the number of threads
+    does not grow with the number of tasks. Connections are shared per
+    host (see net.SSHPool).
+    """
+
+    def __init__(self, loop, max_threads=SSH_THREADS):
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=max_threads)
+        self.ssh_pool = net.SSHPool()
+
+    def _execute(self, host, command, allow_status):
+        client = self.ssh_pool.get(host)
+        return net.ssh_execute(client, command, allow_status)
+
+    async def execute(self, host, command, allow_status=(0,)):
+        """
+        :return: (exit status, stdout, stderr). See net.ssh_execute
+        """
+        return await self.loop.run_in_executor(
+            self.executor,
+            self._execute,
+            host,
+            command,
+            list(allow_status)
+        )
+
+    async def call(self, func, *args):
+        """Run other blocking function on the thread pool"""
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.ssh_pool.close()
+
+
+async def _run_one(coro_func, args, semaphore, timeout, result):
+    async with semaphore:
+        start = time.time()
+        try:
+            if timeout:
+                result.value = await asyncio.wait_for(coro_func(*args),
+                                                      timeout)
+            else:
+                result.value = await coro_func(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            result.error = ex
+        result.elapsed = time.time() - start
+
+
+async def gather(coro_func, args_list, limit=DEFAULT_LIMIT, timeout=None):
+    """Async version of parallel.run
+
+    :param coro_func: coroutine function
+    :param args_list: list of arguments (tuple or single value)
+    :param limit: maximum number of concurrent calls
+    :param timeout: timeout(sec) of each call. TimeoutError is stored in
+        Result.error
+    :return: list of parallel.Result, in the same order as args_list
+    """
+    semaphore = asyncio.Semaphore(limit)
+    results = []
+    tasks = []
+    for args in args_list:
+        if not isinstance(args, tuple):
+            args = (args,)
+        result = Result(args)
+        results.append(result)
+        tasks.append(_run_one(coro_func, args, semaphore, timeout, result))
+    if tasks:
+        await asyncio.gather(*tasks)
+    return results
+
+
+class TaskGraph(object):
+    """Coroutines with dependencies
+
+    A task starts when all tasks it depends on succeed. If one of them
+    fails, the task is not run and fails with the same error.
+
+    ex)
+        graph = TaskGraph(limit=64)
+        graph.add('stop', stop_all)
+        graph.add('clean', clean_all, deps=['stop'])
+        graph.add('start', start_all, deps=['clean'])
+        results = run(graph.run(timeout=600))
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        """
+        :param limit: maximum number of tasks running at the same time
+        """
+        self.limit = limit
+        self._nodes = []
+
+    def add(self, name, coro_func, args=(), deps=()):
+        """
+        :param name: name of task. Used in deps of other tasks
+        :param coro_func: coroutine function
+        :param args: arguments of coro_func
+        :param deps: names of tasks to wait for
+        """
+        self._nodes.append((name, coro_func, tuple(args), tuple(deps)))
+
+    async def run(self, timeout=None):
+        """
+        :param timeout: timeout(sec) of whole graph. Running tasks are
+            cancelled when it expires
+        :return: dict {name: parallel.Result}
+        """
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(self.limit)
+        futures = {name: loop.create_future() for name, _, _, _ in self._nodes}
+        results = {}
+
+        async def _run(name, coro_func, args, deps):
+            result = Result((name,) + args)
+            results[name] = result
+            for dep in deps:
+                dep_result = await futures[dep]
+                if not dep_result.ok:
+                    result.error = dep_result.error
+                    futures[name].set_result(result)
+                    return
+            await _run_one(coro_func, args, semaphore, None, result)
+            futures[name].set_result(result)
+
+        tasks = [loop.create_task(_run(*node)) for node in self._nodes]
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+        except asyncio.TimeoutError:
+            for name, future in futures.items():
+                if not future.done():
+                    results.setdefault(name, Result((name,)))
+                    results[name].error = asyncio.TimeoutError(name)
+        return results
+
+
+def run_graph(build, limit=SSH_THREADS, timeout=None):
+    """Build a TaskGraph of blocking calls and run it
+
+    :param build: function(graph, adapter) adding tasks to graph. Tasks
+        may use SSHAdapter.execute and SSHAdapter.call of adapter
+    :param limit: number of threads and of tasks running at the same time
+    :param timeout: timeout(sec) of whole graph
+    :return: dict {name: parallel.Result}
+    """
+    async def _main():
+        adapter = SSHAdapter(asyncio.get_event_loop(), limit)
+        graph = TaskGraph(limit)
+        build(graph, adapter)
+        try:
+            return await graph.run(timeout)
+        finally:
+            adapter.executor.shutdown(wait=timeout is None)
+            adapter.ssh_pool.close()
+
+    return run(_main())
+
+
+def run(coro, timeout=None):
+    """Run coroutine on a new event loop and close it
+
+    :param coro: coroutine
+    :param timeout: timeout(sec). Pending tasks are cancelled if expired
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        if timeout:
+            coro = asyncio.wait_for(coro, timeout)
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+async def _ping(pool, host, port, timeout, count):
+    status = PING_REFUSED
+    for _ in range(count):
+        try:
+            await asyncio.wait_for(pool.execute(host, port, 'ping'), timeout)
+            return PING_OK
+        except hiredis.ReplyError:
+            # LOADING, ... server is answering
+            return PING_OK
+        except asyncio.TimeoutError:
+            status = PING_TIMEOUT
+        except (OSError, ConnectionError) as ex:
+            logger.debug('ping {}:{}: {}'.format(host, port, ex))
+            status = PING_REFUSED
+    return status
+
+
+def ping_all(addrs, timeout=3, count=3, limit=DEFAULT_LIMIT):
+    """Ping redis instances concurrently
+
+    :param addrs: list of address(host:port)
+    :param timeout: timeout(sec) of a ping
+    :param count: number of tries until PONG
+    :return: dict {addr: PING_OK / PING_REFUSED / PING_TIMEOUT}
+    """
+    async def _main():
+        pool = RedisPool(timeout=timeout)
+        try:
+            results = await gather(
+                lambda addr: _ping(pool, addr.rsplit(':', 1)[0],
+                                   int(addr.rsplit(':', 1)[1]),
+                                   timeout, count),
+                addrs,
+                limit=limit
+            )
+        finally:
+            pool.close()
+        return {r.args[0]: r.value for r in results}
+
+    return run(_main())
+
+
+def call_all(func, args_list, limit=SSH_THREADS, timeout=None):
+    """Call blocking func (ssh, redistrib2, ...) on a bounded thread pool
+
+    :param func: callable
+    :param args_list: list of arguments (tuple or single value)
+    :param limit: number of threads
+    :param timeout: timeout(sec) of each call. A call timed out keeps
+        running on its thread, but is not waited for
+    :return: list of parallel.Result
+    """
+    async def _main():
+        adapter = SSHAdapter(asyncio.get_event_loop(), limit)
+        try:
+            return await gather(
+                lambda *args: adapter.call(func, *args),
+                args_list,
+                limit=limit,
+                timeout=timeout
+            )
+        finally:
+            adapter.executor.shutdown(wait=timeout is None)
+            adapter.ssh_pool.close()
+
+    return run(_main())
+
+
+def execute_all(addrs, args, timeout=3, limit=DEFAULT_LIMIT):
+    """Send a command to redis instances concurrently
+
+    :param addrs: list of (host, port)
+    :param args: command and arguments
+    :return: list of parallel.Result. args is (host, port)
+    """
+    async def _main():
+        pool = RedisPool(timeout=timeout)
+
+        async def _execute(host, port):
+            return await pool.execute(host, port, *args)
+
+        try:
+            return await gather(_execute, addrs, limit=limit)
+        finally:
+            pool.close()
+
+    return run(_main())
+
+
+def execute_bulk_all(addrs, commands, timeout=3, limit=DEFAULT_LIMIT):
+    """Pipeline commands to redis instances concurrently
+
+    :param addrs: list of (host, port)
+    :param commands: list of command and arguments
+    :return: list of parallel.Result. value is list of replies
+    """
+    async def _main():
+        pool = RedisPool(timeout=timeout)
+
+        async def _execute(host, port):
+            return await pool.execute_bulk(host, port, commands)
+
+        try:
+            return await gather(_execute, addrs, limit=limit)
+        finally:
+            pool.close()
+
+    return run(_main())
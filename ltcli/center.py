@@ -5,9 +5,12 @@ import socket
 import subprocess
 import shutil
 
+import hiredis
 from terminaltables import AsciiTable
 
-from ltcli import config, net, utils, ask_util, color, message
+from ltcli import agent, config, net, parallel, utils, ask_util, color, message
+from ltcli import instrument
+from ltcli.conf_store import ConfStore
 from ltcli.log import logger
 from ltcli.rediscli_util import RedisCliUtil
 from ltcli.redistrib2 import command as trib
@@ -20,6 +23,43 @@ from ltcli.exceptions import (
     ClusterNotExistError,
 )
 
+try:
+    from ltcli import aio
+except (ImportError, SyntaxError):
+    # python 2
+    aio = None
+
+
+def _print_host_results(results):
+    """Print result of parallel.run per host with elapsed time
+
+    If value of result is bytes, throughput is printed.
+
+    :param results: list of parallel.Result. args[0] is host
+    :return: True if all success
+    """
+    meta = [['HOST', 'RESULT', 'TIME(s)', 'SIZE', 'MB/s']]
+    for result in results:
+        state = color.green('OK') if result.ok else color.red('FAIL')
+        size = '-'
+        throughput = '-'
+        if result.ok and isinstance(result.value, int):
+            size = utils.int_2_bytes(result.value)
+            if result.elapsed > 0:
+                mb = result.value / 1024.0 / 1024.0
+                throughput = '{:.1f}'.format(mb / result.elapsed)
+        meta.append([
+            result.args[0],
+            state,
+            '{:.2f}'.format(result.elapsed),
+            size,
+            throughput,
+        ])
+        if not result.ok:
+            logger.error('{}: {}'.format(result.args[0], result.error))
+    utils.print_table(meta)
+    return all(result.ok for result in results)
+
 
 def get_ps_list_command(port_list):
     port_filter = '|'.join(':{}'.format(x) for x in port_list)
@@ -57,6 +97,7 @@ class Center(object):
         self.slave_port_list = []
         self.all_host_list = []
 
+    @instrument.traced
     def sync_conf(self, show_result=False):
         msg = message.get('sync_conf')
         logger.info('sync conf')
@@ -87,7 +128,8 @@ class Center(object):
                 continue
             client = net.get_ssh(host)
             try:
-                net.copy_dir_to_remote(client, conf_path, conf_path)
+                with instrument.span(host, 'host'):
+                    net.copy_dir_to_remote(client, conf_path, conf_path)
                 meta.append([host, color.green('OK')])
             except BaseException as ex:
                 logger.debug(ex)
@@ -135,6 +177,7 @@ class Center(object):
         logger.info('OK')
         return True
 
+    @instrument.traced
     def configure_redis(self, master=True, slave=True):
         logger.debug('configure redis')
         path_of_fb = config.get_path_of_fb(self.cluster_id)
@@ -145,13 +188,9 @@ class Center(object):
         sr2_redis_conf = path_of_fb['sr2_redis_conf']
         if not os.path.exists(sr2_redis_conf):
             os.mkdir(sr2_redis_conf)
-        props_path = path_of_fb['redis_properties']
-        prefix_srd = config.get_props(props_path, 'sr2_redis_data')
-        prefix_sfdp = config.get_props(props_path, 'sr2_flash_db_path')
-        ssd_count = config.get_props(props_path, 'ssd_count')
+        table = config.get_instance_table(self.cluster_id)
         sr2_redis_conf_temp = path_of_fb['sr2_redis_conf_temp']
         conf_path = path_of_fb['conf_path']
-        user = os.environ['USER']
         command = []
         count = 0
         if master:
@@ -166,14 +205,9 @@ class Center(object):
                     command = []
                     count = 0
                 count += 1
-                ssd_no = config.get_sata_ssd_no(port, ssd_count)
-                sr2_redis_data = '{}{}/nvkvs/{}'.format(prefix_srd, ssd_no, user)
-                sr2_flash_db_path = '{}{}/nvkvs/{}/db/db-{}'.format(
-                    prefix_sfdp,
-                    ssd_no,
-                    user,
-                    port
-                )
+                instance = table.paths(port)
+                sr2_redis_data = instance.redis_data
+                sr2_flash_db_path = instance.flash_db_path
                 file_name = 'redis-{}.conf'.format(port)
                 export_envs = ' '.join([
                     'export SR2_REDIS_PORT={}'.format(port),
@@ -198,14 +232,9 @@ class Center(object):
                     command = []
                     count = 0
                 count += 1
-                ssd_no = config.get_sata_ssd_no(port, ssd_count)
-                sr2_redis_data = '{}{}/nvkvs/{}'.format(prefix_srd, ssd_no, user)
-                sr2_flash_db_path = '{}{}/nvkvs/{}/db/db-{}'.format(
-                    prefix_sfdp,
-                    ssd_no,
-                    user,
-                    port
-                )
+                instance = table.paths(port)
+                sr2_redis_data = instance.redis_data
+                sr2_flash_db_path = instance.flash_db_path
                 file_name = 'redis-{}.conf'.format(port)
                 export_envs = ' '.join([
                     'export SR2_REDIS_PORT={}'.format(port),
@@ -228,6 +257,7 @@ class Center(object):
         subprocess.check_output(command, shell=True)
         logger.debug('subprocess: {}'.format(command))
 
+    @instrument.traced
     def backup_server_logs(self, master=True, slave=True):
         """ Backup server logs
 
@@ -261,29 +291,38 @@ class Center(object):
         sr2_redis_log = path_of_fb['sr2_redis_log']
         for host in hosts:
             logger.info(' - {}'.format(host))
-            command = ['mkdir -p {};'.format(backup_path)]
-            count = 0
-            for port in ports:
-                # depence: [Errno 7] Argument list too long
-                if count > 100:
-                    command = ' '.join(command)
-                    client = net.get_ssh(host)
-                    net.ssh_execute(client, command, allow_status=[0, 1])
-                    client.close()
-                    command = []
-                    count = 0
-                count += 1
-                command.append('mv {0}/*{1}.log {2} &> /dev/null'.format(
-                    sr2_redis_log,
-                    port,
-                    backup_path
-                ))
-            command = ' '.join(command)
-            client = net.get_ssh(host)
-            net.ssh_execute(client, command, allow_status=[0, 1])
-            client.close()
+            with instrument.span(host, 'host'):
+                self._backup_host_logs(host, ports, backup_path, sr2_redis_log)
+
+    @staticmethod
+    def _backup_host_logs(host, ports, backup_path, sr2_redis_log):
+        command = ['mkdir -p {};'.format(backup_path)]
+        count = 0
+        for port in ports:
+            # depence: [Errno 7] Argument list too long
+            if count > 100:
+                command = ' '.join(command)
+                client = net.get_ssh(host)
+                net.ssh_execute(client, command, allow_status=[0, 1])
+                client.close()
+                command = []
+                count = 0
+            count += 1
+            command.append('mv {0}/*{1}.log {2} &> /dev/null'.format(
+                sr2_redis_log,
+                port,
+                backup_path
+            ))
+        command = ' '.join(command)
+        client = net.get_ssh(host)
+        net.ssh_execute(client, command, allow_status=[0, 1])
+        client.close()
 
     def conf_backup(self, host, cluster_id, tag):
+        """Backup conf directory of host to conf backup store
+
+        A file is stored only if it is not in store. See ConfStore
+        """
         logger.debug('conf_backup')
         msg = message.get('backup_conf').format(cluster_id=cluster_id)
         logger.info(msg)
@@ -291,21 +330,25 @@ class Center(object):
         path_of_fb = config.get_path_of_fb(cluster_id)
         conf_path = path_of_fb['conf_path']
         path_of_cli = config.get_path_of_cli(cluster_id)
-        conf_backup_path = path_of_cli['conf_backup_path']
-        conf_backup_tag_path = os.path.join(conf_backup_path, tag)
-
-        if not os.path.isdir(conf_backup_path):
-            os.mkdir(conf_backup_path)
+        store = ConfStore(path_of_cli['conf_backup_path'])
 
         # back up conf
-        os.mkdir(conf_backup_tag_path)
         client = net.get_ssh(host)
-        net.copy_dir_from_remote(client, conf_path, conf_backup_tag_path)
+        stat = store.backup_remote(client, conf_path, tag)
         client.close()
 
-        logger.info('OK, {}'.format(tag))
+        logger.info('OK, {} ({} files, {} new, {})'.format(
+            tag,
+            stat['files'],
+            stat['new'],
+            utils.int_2_bytes(stat['bytes'])
+        ))
+
+    def cluster_backup(self, host, cluster_id, tag, client=None):
+        """Move cluster directory to backup directory
 
-    def cluster_backup(self, host, cluster_id, tag):
+        :param client: SSHClient of host. If set, it is not closed
+        """
         logger.debug('cluster_backup')
         msg = message.get('backup_cluster')
         msg = msg.format(cluster_id=cluster_id, host=host)
@@ -317,20 +360,70 @@ class Center(object):
         cluster_backup_tag_path = os.path.join(cluster_backup_path, tag)
 
         # back up cluster
-        client = net.get_ssh(host)
-        if not net.is_dir(client, cluster_backup_path):
-            sftp = net.get_sftp(client)
+        ssh = client or net.get_ssh(host)
+        if not net.is_dir(ssh, cluster_backup_path):
+            sftp = net.get_sftp(ssh)
             sftp.mkdir(cluster_backup_path)
             sftp.close()
-        if net.is_dir(client, cluster_path):
+        if net.is_dir(ssh, cluster_path):
             command = 'mv {} {}'.format(cluster_path, cluster_backup_tag_path)
-            net.ssh_execute(client=client, command=command)
+            net.ssh_execute(client=ssh, command=command)
             logger.info('OK, {}'.format(tag))
         else:
             msg = message.get('skip_backup')
             msg = msg.format(host=host, file=cluster_path)
             logger.warning(msg)
-        client.close()
+        if client is None:
+            ssh.close()
+
+    def cluster_backup_all(self, hosts, cluster_id, tag):
+        """Backup cluster of hosts concurrently. See cluster_backup
+
+        :return: True if all success
+        """
+        with net.SSHPool() as ssh_pool:
+            results = parallel.run(
+                lambda host: self.cluster_backup(
+                    host,
+                    cluster_id,
+                    tag,
+                    client=ssh_pool.get(host)
+                ),
+                hosts
+            )
+        return _print_host_results(results)
+
+    def cluster_restore_all(self, hosts, backup_path, restore_path):
+        """Copy backup to restore path at hosts concurrently
+
+        Copy-on-write clone is used if filesystem supports it.
+
+        :param hosts: list of host
+        :param backup_path: backup directory
+        :param restore_path: restore directory
+        :return: True if all success
+        """
+        # hardlink is not used, because restored conf and log files are
+        # modified in place and the change would go into backup as well
+        command = ' '.join([
+            '(cp -a --reflink=auto {0} {1}',
+            '|| (rm -rf {1} && cp -R {0} {1}))',
+            '&& du -sk {1} | cut -f1',
+        ]).format(backup_path, restore_path)
+
+        def _restore(host):
+            msg = message.get('restore_cluster')
+            msg = msg.format(tag=os.path.basename(backup_path), host=host)
+            logger.info(msg)
+            client = ssh_pool.get(host)
+            _, stdout, _ = net.ssh_execute(client, command)
+            size = int(stdout.strip() or 0) * 1024
+            logger.info(' - {} OK'.format(host))
+            return size
+
+        with net.SSHPool() as ssh_pool:
+            results = parallel.run(_restore, hosts)
+        return _print_host_results(results)
 
     def conf_restore(self, host, cluster_id, tag):
         logger.debug('conf_restore')
@@ -342,16 +435,27 @@ class Center(object):
         conf_path = path_of_fb['conf_path']
         conf_backup_path = path_of_cli['conf_backup_path']
         conf_backup_tag_path = os.path.join(conf_backup_path, tag)
+        store = ConfStore(conf_backup_path)
 
         # restore conf
         client = net.get_ssh(host)
-        net.copy_dir_to_remote(client, conf_backup_tag_path, conf_path)
+        if store.has(tag):
+            store.restore_remote(client, tag, conf_path)
+        else:
+            # directory of old version or edited props of deploy
+            net.copy_dir_to_remote(client, conf_backup_tag_path, conf_path)
         client.close()
         logger.debug('OK')
 
     def get_alive_redis_count(self, hosts, ports, check_owner=False):
         logger.debug('get_alive_redis_count')
         logger.debug('hosts={}, ports={}'.format(hosts, ports))
+        if agent.is_enabled():
+            return self._get_alive_redis_count_by_agent(
+                hosts,
+                ports,
+                check_owner
+            )
         if check_owner:
             ps_list_command = get_my_ps_list_command(ports, self.cluster_id)
         else:
@@ -374,6 +478,25 @@ class Center(object):
         total += redis_rdb_count
         return total
 
+    def _get_alive_redis_count_by_agent(self, hosts, ports, check_owner):
+        port_filter = '|'.join(':{}'.format(x) for x in ports)
+        pattern = 'redis-server.*({})'.format(port_filter)
+        if check_owner:
+            pattern = 'redis-server.*cluster_{}.*({})'.format(
+                self.cluster_id,
+                port_filter
+            )
+        requests = [
+            ('ps', {'pattern': pattern, 'mine': check_owner}),
+            ('ps', {'pattern': 'redis-rdb-to-slaves'}),
+        ]
+        total = 0
+        for host in hosts:
+            servers, rdb = agent.get(host).call_many(requests)
+            total += len(servers) + len(rdb)
+        logger.debug('redis-server total={}'.format(total))
+        return total
+
     def get_alive_master_redis_count(self, check_owner=False):
         logger.debug('get_alive_master_redis_count')
         hosts = self.master_host_list
@@ -396,6 +519,7 @@ class Center(object):
         total_s = self.get_alive_slave_redis_count(check_owner)
         return total_m + total_s
 
+    @instrument.traced
     def create_cluster(self, yes=False):
         """Create cluster
         """
@@ -445,17 +569,20 @@ class Center(object):
         yes = ask_util.askBool(msg, ['y', 'n'])
         return yes
 
-    def stop_redis_process(self, host, ports, force=False):
+    def stop_redis_process(self, host, ports, force=False, client=None):
         """Stop redis process
+
+        :param client: SSHClient of host. If set, it is not closed
         """
         logger.debug('stop_redis_process')
         signal = 'SIGKILL' if force else 'SIGINT'
         ps_list_command = get_ps_list_command(ports)
         pid_list = "{} | awk '{{print $2}}'".format(ps_list_command)
         command = 'kill -s {} $({})'.format(signal, pid_list)
-        client = net.get_ssh(host)
-        net.ssh_execute(client, command, allow_status=[-1, 0, 1, 2, 123, 130])
-        client.close()
+        ssh = client or net.get_ssh(host)
+        net.ssh_execute(ssh, command, allow_status=[-1, 0, 1, 2, 123, 130])
+        if client is None:
+            ssh.close()
 
     def stop_redis(self, force=False, master=True, slave=True):
         """Stop redis
@@ -536,12 +663,17 @@ class Center(object):
             )
 
     def _create_redis_data_directory(self, hosts, ports):
-        path_of_fb = config.get_path_of_fb(self.cluster_id)
-        props_path = path_of_fb['redis_properties']
-        prefix_srd = config.get_props(props_path, 'sr2_redis_data')
-        prefix_sfdp = config.get_props(props_path, 'sr2_flash_db_path')
-        ssd_count = config.get_props(props_path, 'ssd_count')
-        user = os.environ['USER']
+        table = config.get_instance_table(self.cluster_id)
+        if agent.is_enabled():
+            paths = []
+            for port in ports:
+                instance = table.paths(port)
+                paths.append(instance.redis_data)
+                paths.append(instance.flash_db_path)
+            for host in hosts:
+                logger.info(' - {}'.format(host))
+                agent.get(host).call('mkdir', paths=paths)
+            return
         for host in hosts:
             logger.info(' - {}'.format(host))
             command = ['mkdir -p']
@@ -556,25 +688,15 @@ class Center(object):
                     command = ['mkdir -p']
                     count = 0
                 count += 1
-                ssd_no = config.get_sata_ssd_no(port, ssd_count)
-                sr2_redis_data = '{}{}/nvkvs/{}'.format(
-                    prefix_srd,
-                    ssd_no,
-                    user
-                )
-                sr2_flash_db_path = '{}{}/nvkvs/{}/db/db-{}'.format(
-                    prefix_sfdp,
-                    ssd_no,
-                    user,
-                    port
-                )
-                command.append(sr2_redis_data)
-                command.append(sr2_flash_db_path)
+                instance = table.paths(port)
+                command.append(instance.redis_data)
+                command.append(instance.flash_db_path)
             command = ' '.join(command)
             client = net.get_ssh(host)
             net.ssh_execute(client, command)
             client.close()
 
+    @instrument.traced
     def wait_until_all_redis_process_up(self, master=True, slave=True):
         """Wait until all redis process up
         """
@@ -706,12 +828,7 @@ class Center(object):
 
     def _remove_data(self, client, port_list):
         logger.debug('_remove_data')
-        path_of_fb = config.get_path_of_fb(self.cluster_id)
-        props_path = path_of_fb['redis_properties']
-        prefix_srd = config.get_props(props_path, 'sr2_redis_data')
-        prefix_sfdp = config.get_props(props_path, 'sr2_flash_db_path')
-        ssd_count = config.get_props(props_path, 'ssd_count')
-        user = os.environ['USER']
+        table = config.get_instance_table(self.cluster_id)
         command = ['rm -rf']
         count = 0
         for port in port_list:
@@ -721,19 +838,9 @@ class Center(object):
                 command = ['rm -rf']
                 count = 0
             count += 1
-            ssd_no = config.get_sata_ssd_no(port, ssd_count)
-            sr2_redis_data = '{}{}/nvkvs/{}'.format(
-                prefix_srd,
-                ssd_no,
-                user
-            )
-            sr2_flash_db_path = '{}{}/nvkvs/{}/db/db-{}'.format(
-                prefix_sfdp,
-                ssd_no,
-                user,
-                port
-            )
-            command.append(sr2_flash_db_path)
+            instance = table.paths(port)
+            sr2_redis_data = instance.redis_data
+            command.append(instance.flash_db_path)
             command.append('{}/appendonly-{}*.aof'.format(
                 sr2_redis_data,
                 port
@@ -747,11 +854,7 @@ class Center(object):
 
     def _remove_node_conf(self, client, port_list):
         logger.debug('_remove_node_conf')
-        path_of_fb = config.get_path_of_fb(self.cluster_id)
-        props_path = path_of_fb['redis_properties']
-        prefix_srd = config.get_props(props_path, 'sr2_redis_data')
-        ssd_count = config.get_props(props_path, 'ssd_count')
-        user = os.environ['USER']
+        table = config.get_instance_table(self.cluster_id)
         command = ['rm -f']
         count = 0
         for port in port_list:
@@ -761,10 +864,8 @@ class Center(object):
                 command = ['rm -f']
                 count = 0
             count += 1
-            ssd_no = config.get_sata_ssd_no(port, ssd_count)
-            sr2_redis_data = '{}{}/nvkvs/{}'.format(prefix_srd, ssd_no, user)
             file_name = 'nodes-{}.conf'.format(port)
-            file_path = os.path.join(sr2_redis_data, file_name)
+            file_path = os.path.join(table.paths(port).redis_data, file_name)
             command.append(file_path)
         command = ' '.join(command)
         net.ssh_execute(client, command)
@@ -795,10 +896,11 @@ class Center(object):
     def update_ip_port(self):
         logger.debug('update ip port')
         self.cluster_id = config.get_cur_cluster_id()
-        self.master_host_list = config.get_master_host_list(self.cluster_id)
-        self.slave_host_list = config.get_slave_host_list(self.cluster_id)
-        self.master_port_list = config.get_master_port_list(self.cluster_id)
-        self.slave_port_list = config.get_slave_port_list(self.cluster_id)
+        table = config.get_instance_table(self.cluster_id)
+        self.master_host_list = list(table.master_hosts)
+        self.slave_host_list = list(table.slave_hosts)
+        self.master_port_list = list(table.master_ports)
+        self.slave_port_list = list(table.slave_ports)
         m_host_list = self.master_host_list
         s_host_list = self.slave_host_list
         self.all_host_list = list(set(m_host_list + s_host_list))
@@ -827,6 +929,7 @@ class Center(object):
                 msg = message.get('error_conf_not_exist').format(host)
                 raise ClusterRedisError(msg)
 
+    @instrument.traced
     def start_redis_process(self, profile=False, master=True, slave=True):
         """ Start redis process
         """
@@ -849,7 +952,8 @@ class Center(object):
                 stringfied_ports = '|'.join(list(map(str, m_port))) 
                 msg = msg.format(host=host, ports=stringfied_ports)
                 logger.info(msg)
-                self.run_redis_process(host, m_port, profile, current_time)
+                with instrument.span(host, 'host'):
+                    self.run_redis_process(host, m_port, profile, current_time)
         if slave:
             s_port = self.slave_port_list
             for host in self.slave_host_list:
@@ -857,9 +961,115 @@ class Center(object):
                 stringfied_ports = '|'.join(list(map(str, s_port))) 
                 msg = msg.format(host=host, ports=stringfied_ports)
                 logger.info(msg)
-                self.run_redis_process(host, s_port, profile, current_time)
+                with instrument.span(host, 'host'):
+                    self.run_redis_process(host, s_port, profile, current_time)
+
+    def configure_and_start(self, profile=False, master=True, slave=True):
+        """configure_redis, sync_conf, start_redis_process and wait
 
-    def run_redis_process(self, host, ports, profile, current_time):
+        On python 3, it runs as a task graph. See _configure_and_start_async
+        """
+        if aio is not None:
+            return self._configure_and_start_async(profile, master, slave)
+        self.configure_redis(master=master, slave=slave)
+        self.sync_conf(show_result=True)
+        self.start_redis_process(profile, master=master, slave=slave)
+        return self.wait_until_all_redis_process_up(master=master, slave=slave)
+
+    def _configure_and_start_async(self, profile, master, slave):
+        """Conf of a host is copied when configure is done and its cluster
+        directory is checked. Redis of the host starts right after, without
+        waiting for other hosts
+        """
+        path_of_fb = config.get_path_of_fb(self.cluster_id)
+        conf_path = path_of_fb['conf_path']
+        cluster_path = path_of_fb['cluster_path']
+        my_address = config.get_local_ip_list()
+        current_time = time.strftime("%Y%m%d-%H%M", time.gmtime())
+        targets = []
+        if master:
+            msg = message.get('start_redis_of_master_cluster')
+            for host in self.master_host_list:
+                targets.append((host, self.master_port_list, msg))
+        if slave and self.slave_port_list:
+            msg = message.get('start_redis_of_slave_cluster')
+            for host in self.slave_host_list:
+                targets.append((host, self.slave_port_list, msg))
+
+        def _copy_conf(host, ssh_pool):
+            client = ssh_pool.get(host)
+            net.copy_dir_to_remote(client, conf_path, conf_path)
+
+        def _start(host, ports, msg, ssh_pool):
+            client = ssh_pool.get(host)
+            ports_text = '|'.join(map(str, ports))
+            logger.info(msg.format(host=host, ports=ports_text))
+            self.check_conf_file_exist([host], ports)
+            with instrument.span(host, 'host'):
+                self.run_redis_process(host, ports, profile, current_time,
+                                       client=client)
+
+        def _build(graph, adapter):
+            graph.add(
+                'configure',
+                lambda: adapter.call(self.configure_redis, master, slave)
+            )
+            for host in self.all_host_list:
+                graph.add(
+                    'check {}'.format(host),
+                    adapter.execute,
+                    (host, 'test -d {}'.format(cluster_path))
+                )
+                if net.get_ip(host) in my_address:
+                    continue
+                graph.add(
+                    'sync {}'.format(host),
+                    lambda h: adapter.call(_copy_conf, h, adapter.ssh_pool),
+                    (host,),
+                    deps=['configure', 'check {}'.format(host)]
+                )
+            starts = []
+            for i, (host, ports, msg) in enumerate(targets):
+                deps = ['configure', 'check {}'.format(host)]
+                if net.get_ip(host) not in my_address:
+                    deps.append('sync {}'.format(host))
+                name = 'start {} {}'.format(host, i)
+                graph.add(
+                    name,
+                    lambda *args: adapter.call(_start, *args),
+                    (host, ports, msg, adapter.ssh_pool),
+                    deps=deps
+                )
+                starts.append(name)
+            graph.add(
+                'wait',
+                lambda: adapter.call(
+                    self.wait_until_all_redis_process_up,
+                    master,
+                    slave
+                ),
+                deps=starts
+            )
+
+        results = aio.run_graph(_build)
+        failed = [r for r in results.values() if not r.ok]
+        if failed:
+            meta = [['TASK', 'RESULT']]
+            for result in failed:
+                meta.append([result.args[0], color.red('FAIL')])
+                logger.debug('{}: {}'.format(result.args[0], result.error))
+            utils.print_table(meta)
+            # 'wait' may succeed while other task fails, ex) check of a host
+            # of which redis is not started
+            raise failed[0].error
+        return results['wait'].value
+
+    def run_redis_process(self, host, ports, profile, current_time,
+                          client=None):
+        """Run redis process
+
+        :param client: SSHClient of host. If set, it is not closed
+        """
         logger.debug('run_redis_process')
         path_of_fb = config.get_path_of_fb(self.cluster_id)
         sr2_redis_bin = path_of_fb['sr2_redis_bin']
@@ -869,9 +1079,9 @@ class Center(object):
         lib_path = config.get_ld_library_path(self.cluster_id)
 
         # create log directory
-        client = net.get_ssh(host)
+        ssh = client or net.get_ssh(host)
         command = 'mkdir -p {}'.format(sr2_redis_log)
-        net.ssh_execute(client, command)
+        net.ssh_execute(ssh, command)
 
         # make env
         env_cmd = [
@@ -899,9 +1109,7 @@ class Center(object):
         for port in ports:
             if count > 100:
                 command = ' '.join(command)
-                client = net.get_ssh(host)
-                net.ssh_execute(client, command)
-                client.close()
+                net.ssh_execute(ssh, command)
                 command = [' '.join(env_cmd)]
                 count = 0
             count += 1
@@ -913,9 +1121,9 @@ class Center(object):
                 '$SR2_REDIS_LOG/{}'.format(log_file_name),
             ))
         command = ' '.join(command)
-        client = net.get_ssh(host)
-        net.ssh_execute(client, command)
-        client.close()
+        net.ssh_execute(ssh, command)
+        if client is None:
+            ssh.close()
 
     def ensure_cluster_exist(self):
         logger.debug('ensure_cluster_exist')
@@ -974,16 +1182,20 @@ class Center(object):
         msg = msg.format(master_addr=m_addr, slave_addr=s_addr)
         logger.info(msg)
         try:
-            m_ip = net.get_ip(m_ip)
-            s_ip = net.get_ip(s_ip)
-            trib.replicate(m_ip, m_port, s_ip, s_port)
+            with instrument.span(s_addr, 'host', master=m_addr):
+                m_ip = net.get_ip(m_ip)
+                s_ip = net.get_ip(s_ip)
+                trib.replicate(m_ip, m_port, s_ip, s_port)
         except Exception as ex:
             msg = message.get('error_replicate')
             msg = msg.format(master_addr=m_addr, slave_addr=s_addr)
             logger.error('\n'.join([msg, str(ex)]))
             fail_list.append((m_ip, m_port, s_ip, s_port))
 
+    @instrument.traced
     def replicate(self):
+        if aio is not None:
+            return self._replicate_async()
         threads = []
         fail_list = []
         pair_list = self._get_master_slave_pair_list()
@@ -1004,6 +1216,24 @@ class Center(object):
         msg = msg.format(success=success_count, total=total_count)
         logger.info(msg)
 
+    def _replicate_async(self, limit=64):
+        """Replicate all pairs on a bounded pool without staggered threads
+
+        :param limit: maximum number of pairs replicated at the same time
+        """
+        pair_list = self._get_master_slave_pair_list()
+        fail_list = []
+        aio.call_all(
+            Center._replicate_thread,
+            [tuple(pair) + (fail_list,) for pair in pair_list],
+            limit=limit
+        )
+        msg = message.get('complete_replicate')
+        total_count = len(pair_list)
+        success_count = total_count - len(fail_list)
+        msg = msg.format(success=success_count, total=total_count)
+        logger.info(msg)
+
     def cli_config_get(self, key, host, port):
         logger.debug('cli_config_get')
         lib_path = config.get_ld_library_path(self.cluster_id)
@@ -1110,6 +1340,21 @@ class Center(object):
             for port in self.slave_port_list:
                 host_port_list.append((host, port))
         output = []
+        if aio is not None:
+            results = aio.execute_all(
+                host_port_list,
+                ['cluster', 'nodes'],
+                timeout=t
+            )
+            for result in results:
+                if result.ok:
+                    output.append(result.value)
+                elif isinstance(result.error, hiredis.ReplyError):
+                    # ex) LOADING Redis is loading the dataset in memory
+                    output.append(str(result.error))
+                else:
+                    logger.debug(result.error)
+            host_port_list = []
         threads = []
         for host, port in host_port_list:
             command = '{} timeout {} {} -h {} -p {} {}'.format(
@@ -1276,12 +1521,22 @@ class Center(object):
             msg = message.get('error_need_to_cluster')
             raise ClusterRedisError(msg)
 
+        ping = self.ping
+        if aio is not None:
+            # ip:port@cport
+            addrs = [
+                line.split()[1].split('@')[0]
+                for line in nodes_info if line.split()
+            ]
+            statuses = aio.ping_all(addrs)
+            ping = lambda addr: statuses.get(addr.split('@')[0])
+
         master_node_list = []
         threads = []
         for line in master_nodes_info:
             thread = Thread(
                 target=_check_master_node,
-                args=(master_node_list, line, self.ping)
+                args=(master_node_list, line, ping)
             )
             threads.append(thread)
         for thread in threads:
@@ -1294,7 +1549,7 @@ class Center(object):
         for line in slave_nodes_info:
             thread = Thread(
                 target=_check_slave_node,
-                args=(master_node_list, line, self.ping)
+                args=(master_node_list, line, ping)
             )
             threads.append(thread)
         for thread in threads:
@@ -1324,17 +1579,34 @@ class Center(object):
         return slaves_for_failover
 
     def check_port_is_enable(self, host_ports_list):
-        command = 'netstat -tnlp | grep LISTEN | awk \'{print $4}\''
-        conflict = []
-        for host, ports in host_ports_list:
-            client = net.get_ssh(host)
-            _, stdout, _ = net.ssh_execute(client, command)
-            in_use_list = utils.to_str(stdout.strip()).split()
-            in_use_ports = set(map(lambda x: x.split(':')[-1], in_use_list))
+        """Find ports already in use. Hosts are checked concurrently
+
+        :param host_ports_list: list of (host, ports)
+        :return: list of [host, port, pid, user]. pid is '-' if the
+            process is not visible
+        """
+        def _in_use(host, ports):
+            ports = [int(port) for port in ports]
+            if agent.is_enabled():
+                rows = agent.get(host).call('ports', ports=ports, owner=True)
+                return [[host, port, pid, user] for port, pid, user in rows]
+            listen = net.get_listen_ports(ssh_pool.get(host))
+            rows = []
             for port in ports:
-                port = str(port)
-                if port in in_use_ports:
-                    conflict.append([host, port])
+                if port in listen:
+                    pid, user = listen[port]
+                    rows.append([host, port, pid, user])
+            return rows
+
+        with net.SSHPool() as ssh_pool:
+            results = parallel.run(_in_use, host_ports_list)
+        conflict = []
+        for result in results:
+            if not result.ok:
+                raise result.error
+            for host, port, pid, user in result.value:
+                pid = '-' if pid is None else pid
+                conflict.append([host, str(port), str(pid), user])
         return conflict
 
     def stop_current_nodes(self, master=True, slave=True, force=False):
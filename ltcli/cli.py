@@ -1,9 +1,14 @@
-from ltcli import utils, color, message
+import sys
+
+from ltcli import utils, color, message, stats
 from ltcli.log import logger
+from ltcli.scan import ClusterScanner, write_ndjson
 from ltcli.rediscli import (
     RedisCliCluster,
     RedisCliConfig,
     RedisCliInfo,
+    RedisCliLatency,
+    RedisCliSlowlog,
     RedisCliUtil
 )
 
@@ -109,6 +114,82 @@ def relmodeltest(host='localhost', port=7379):
     _command(sub_cmd, False, host, port)
 
 
+# pylint: disable=redefined-builtin
+# need to parameter type for scan options
+def scan(
+        match=None,
+        count=1000,
+        type=None,
+        count_only=False,
+        sample=1.0,
+        limit=0,
+        output=None
+):
+    """Scan keys of all masters concurrently
+
+    Keys are written as NDJSON ({"addr": ..., "key": ...} per line).
+    :param match: glob-style pattern of key
+    :param count: hint of number of keys per SCAN
+    :param type: type of key (redis 6 or later)
+    :param count_only: If true, print number of keys per node only
+    :param sample: ratio(0.0 ~ 1.0) of keys to print
+    :param limit: maximum number of keys to print. 0 means no limit
+    :param output: file path to write keys. If not set, print to screen
+    """
+    if not isinstance(count_only, bool):
+        msg = message.get('error_option_type_not_boolean')
+        msg = msg.format(option='count_only')
+        logger.error(msg)
+        return
+    if not isinstance(count, int):
+        msg = message.get('error_option_type_not_number')
+        msg = msg.format(option='count')
+        logger.error(msg)
+        return
+    if not isinstance(limit, int):
+        msg = message.get('error_option_type_not_number')
+        msg = msg.format(option='limit')
+        logger.error(msg)
+        return
+    if not isinstance(sample, (int, float)):
+        msg = message.get('error_option_type_not_float')
+        msg = msg.format(option='sample')
+        logger.error(msg)
+        return
+    scanner = ClusterScanner(
+        stats.get_targets(slave=False),
+        match=match,
+        count=count,
+        type=type,
+        sample=sample
+    )
+    try:
+        if count_only:
+            node_counts = scanner.count_keys()
+            meta = []
+            for addr in sorted(node_counts.keys()):
+                cnt = node_counts[addr]
+                if addr in scanner.errors:
+                    cnt = color.red('FAIL')
+                meta.append([addr, cnt])
+            utils.print_table([['ADDR', 'KEYS']] + meta)
+            total = sum(node_counts.values())
+            logger.info('total: {}'.format(total))
+            return
+        if output:
+            with open(output, 'w') as fd:
+                written = write_ndjson(scanner.keys(), fd, limit)
+            msg = message.get('complete_scan').format(
+                count=written,
+                path=output
+            )
+            logger.info(msg)
+        else:
+            write_ndjson(scanner.keys(), sys.stdout, limit)
+    finally:
+        scanner.close()
+
+
 class Cli(object):
     """Command wrapper of redis-cli
     """
@@ -117,8 +198,11 @@ class Cli(object):
         self.info = RedisCliInfo()
         self.config = RedisCliConfig()
         self.cluster = RedisCliCluster()
+        self.slowlog = RedisCliSlowlog()
+        self.latency = RedisCliLatency()
         self.ping = ping
         self.reset_oom = reset_oom
         self.reset_info = reset_info
         self.metakeys = metakeys
+        self.scan = scan
         self.relmodeltest = relmodeltest
@@ -7,6 +7,7 @@ import time
 import shutil
 import socket
 import subprocess as sp
+from threading import Thread
 
 import click
 import fire
@@ -29,15 +30,29 @@ from ltcli import (
     ask_util,
     cluster_util,
     editor,
-    message
+    instrument,
+    message,
+    parallel,
+    stats
 )
 from ltcli.log import logger
 from ltcli.cli import Cli
 from ltcli.cluster import Cluster
 from ltcli.center import Center
 from ltcli.conf import Conf
+from ltcli.monitor import Dashboard
+from ltcli.server_log import ServerLog
+from ltcli.exporter import Exporter
 from ltcli.thriftserver import ThriftServer
-from ltcli.deploy_util import DeployUtil, DEPLOYED, PENDING
+from ltcli.deploy_util import (
+    DeployCheckpoint,
+    DeployUtil,
+    DEPLOYED,
+    PENDING,
+    STAGE_CONFIGURED,
+    STAGE_INSTALLED
+)
+from ltcli.rolling import RollingRestart
 from ltcli.rediscli import RedisCliConfig
 from ltcli.exceptions import (
     SSHConnectionError,
@@ -63,11 +78,14 @@ user_info = {
 }
 
 
-def run_monitor(n=10, t=2):
-    """Monitoring logs of redis.
+def run_monitor(n=10, t=2, mode='log'):
+    """Monitoring logs or metrics of redis.
 
-    :param n: number of lines to print log
+    :param n: number of lines to print log (top-N nodes for dashboard)
     :param t: renewal cycle(sec)
+    :param mode:
+        log(default): tail logs of redis,
+        dashboard: metrics of all redis
     """
     if not isinstance(n, int):
         msg = message.get('error_option_type_not_number').format(option='n')
@@ -77,6 +95,18 @@ def run_monitor(n=10, t=2):
         msg = message.get('error_option_type_not_float').format(option='t')
         logger.error(msg)
         return
+    mode_list = ['log', 'dashboard']
+    if mode not in mode_list:
+        msg = message.get('error_monitor_mode').format(
+            value=mode,
+            list=mode_list
+        )
+        logger.error(msg)
+        return
+    if mode == 'dashboard':
+        targets = stats.get_targets()
+        Dashboard(targets, interval=t, top=n).run()
+        return
     try:
         sp.check_output('which tail', shell=True)
     except Exception:
@@ -107,12 +137,47 @@ def run_monitor(n=10, t=2):
         net.ssh_execute_async(client, command)
 
 
+def run_exporter(port=9121, bind='127.0.0.1', t=5):
+    """Export metrics of redis for Prometheus.
+
+    :param port: port of http server ('/metrics')
+    :param bind: address of http server
+    :param t: minimum interval(sec) between collections. Scrapes in
+        interval share the cached result
+    """
+    if not isinstance(port, int):
+        msg = message.get('error_option_type_not_number').format(option='port')
+        logger.error(msg)
+        return
+    if not isinstance(t, int) and not isinstance(t, float):
+        msg = message.get('error_option_type_not_float').format(option='t')
+        logger.error(msg)
+        return
+    cluster_id = config.get_cur_cluster_id()
+    targets = stats.get_targets(cluster_id)
+    exporter = Exporter(
+        targets,
+        cluster_id,
+        bind=bind,
+        port=port,
+        min_interval=t
+    )
+    msg = message.get('start_exporter').format(bind=bind, port=port)
+    logger.info(msg)
+    logger.info(message.get('message_for_exit'))
+    try:
+        exporter.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
 # def run_deploy_v3(cluster_id=None, history_save=True, force=False):
 def run_deploy(
         cluster_id=None,
         history_save=True,
         clean=False,
-        strategy="none"
+        strategy="none",
+        width=1
 ):
     """Install LightningDB package.
 
@@ -122,6 +187,7 @@ def run_deploy(
     :param strategy:
         none(default): normal deploy,
         zero-downtime: re-deploy without stop
+    :param width: number of redis restarted at once in zero-downtime deploy
     """
     # validate cluster id
     if cluster_id is None:
@@ -156,12 +222,43 @@ def run_deploy(
         return
     if strategy == "zero-downtime":
         run_cluster_use(cluster_id)
-        _deploy_zero_downtime(cluster_id)
+        _deploy_zero_downtime(cluster_id, width)
         return
     _deploy(cluster_id, history_save, clean)
 
 
-def _deploy_zero_downtime(cluster_id):
+def _install_on_host(center, host, cluster_id, installer_path, backup_dir):
+    """Backup cluster and install package on a host
+
+    Installer is transferred while the cluster directory is backed up.
+    """
+    path_of_fb = config.get_path_of_fb(cluster_id)
+    cluster_path = path_of_fb['cluster_path']
+    errors = []
+
+    def _transfer():
+        try:
+            DeployUtil().transfer_installer(host, cluster_id, installer_path)
+        except Exception as ex:
+            errors.append(ex)
+
+    transfer = Thread(target=_transfer)
+    transfer.daemon = True
+    transfer.start()
+    center.cluster_backup(host, cluster_id, backup_dir)
+    transfer.join()
+    if errors:
+        raise errors[0]
+    client = net.get_ssh(host)
+    cmd = 'mkdir -p {0} && touch {0}/.deploy.state'.format(cluster_path)
+    net.ssh_execute(client=client, command=cmd)
+    client.close()
+    DeployUtil().install(host, cluster_id, os.path.basename(installer_path))
+    logger.info(' - {} OK'.format(host))
+
+
+@instrument.traced
+def _deploy_zero_downtime(cluster_id, width=1):
     logger.debug("zero downtime update cluster {}".format(cluster_id))
     center = Center()
     center.update_ip_port()
@@ -171,117 +268,134 @@ def _deploy_zero_downtime(cluster_id):
     s_ports = center.slave_port_list
     path_of_fb = config.get_path_of_fb(cluster_id)
     cluster_path = path_of_fb['cluster_path']
+    hosts = sorted(set(m_hosts + s_hosts))
+
+    checkpoint = DeployCheckpoint(cluster_id)
+    data = {}
+    if checkpoint.exists():
+        data = checkpoint.load()
+        msg = message.get('ask_resume_deploy').format(
+            installer=data.get('installer'),
+            stage=data.get('stage')
+        )
+        if not ask_util.askBool(msg, ['y', 'n']):
+            checkpoint.remove()
+            checkpoint.data = {}
+            data = {}
+
+    if not data:
+        # check master alive
+        m_count = len(m_hosts) * len(m_ports)
+        alive_m_count = center.get_alive_master_redis_count()
+        if alive_m_count < m_count:
+            logger.error(message.get('error_exist_disconnected_master'))
+            return
 
-    # check master alive
-    m_count = len(m_hosts) * len(m_ports)
-    alive_m_count = center.get_alive_master_redis_count()
-    if alive_m_count < m_count:
-        logger.error(message.get('error_exist_disconnected_master'))
-        return
-
-    if not config.is_slave_enabled:
-        logger.error(message.get('error_need_to_slave'))
-        return
-
-    # select installer
-    installer_path = ask_util.installer()
-    installer_name = os.path.basename(installer_path)
-
-    # backup info
-    current_time = time.strftime("%Y%m%d%H%M%S", time.gmtime())
-    conf_backup_dir = 'cluster_{}_conf_bak_{}'.format(cluster_id, current_time)
-    cluster_backup_dir = 'cluster_{}_bak_{}'.format(cluster_id, current_time)
-    local_ip = config.get_local_ip()
+        if not config.is_slave_enabled:
+            logger.error(message.get('error_need_to_slave'))
+            return
 
-    # backup conf
-    center.conf_backup(local_ip, cluster_id, conf_backup_dir)
+        # select installer
+        installer_path = ask_util.installer()
 
-    # backup cluster
-    for host in s_hosts:
-        client = net.get_ssh(host)
-        center.cluster_backup(host, cluster_id, cluster_backup_dir)
-        client.close()
+        # backup info
+        current_time = time.strftime("%Y%m%d%H%M%S", time.gmtime())
+        conf_backup_dir = 'cluster_{}_conf_bak_{}'.format(
+            cluster_id,
+            current_time
+        )
+        cluster_backup_dir = 'cluster_{}_bak_{}'.format(
+            cluster_id,
+            current_time
+        )
+        local_ip = config.get_local_ip()
+
+        # backup conf
+        center.conf_backup(local_ip, cluster_id, conf_backup_dir)
+
+        # backup cluster, transfer & install on all hosts concurrently
+        logger.info(message.get('transfer_and_execute_installer'))
+        def _install(host):
+            with instrument.span(host, 'host'):
+                _install_on_host(
+                    center,
+                    host,
+                    cluster_id,
+                    installer_path,
+                    cluster_backup_dir
+                )
 
-    # transfer & install
-    logger.info(message.get('transfer_and_execute_installer'))
-    for host in m_hosts:
-        logger.info(' - {}'.format(host))
-        client = net.get_ssh(host)
-        cmd = 'mkdir -p {0} && touch {0}/.deploy.state'.format(cluster_path)
-        net.ssh_execute(client=client, command=cmd)
-        client.close()
-        DeployUtil().transfer_installer(host, cluster_id, installer_path)
-        try:
-            DeployUtil().install(host, cluster_id, installer_name)
-        except SSHCommandError as ex:
-            msg = message.get('error_execute_installer')
-            msg = msg.format(installer=installer_path)
-            logger.error(msg)
-            logger.exception(ex)
+        results = parallel.run(_install, hosts)
+        for result in results:
+            if not result.ok:
+                msg = message.get('error_execute_installer')
+                msg = msg.format(installer=installer_path)
+                logger.error('{} ({})'.format(msg, result.args[0]))
+                logger.exception(result.error)
+        if not all(result.ok for result in results):
             return
 
-    # restore conf
-    center.conf_restore(local_ip, cluster_id, conf_backup_dir)
+        # restore conf
+        center.conf_restore(local_ip, cluster_id, conf_backup_dir)
 
-    # set deploy state complete
-    for node in m_hosts:
-        path_of_fb = config.get_path_of_fb(cluster_id)
-        cluster_path = path_of_fb['cluster_path']
-        client = net.get_ssh(node)
-        cmd = 'rm -rf {}'.format(os.path.join(cluster_path, '.deploy.state'))
-        net.ssh_execute(client=client, command=cmd)
-        client.close()
-
-    # restart slave
-    center.stop_current_nodes(master=False, slave=True)
-    center.configure_redis()
-    center.sync_conf()
-    center.start_current_nodes(master=False, slave=True)
-
-    center.wait_until_all_redis_process_up()
-    slaves_for_failover = center.get_slave_nodes()
+        # set deploy state complete
+        for host in hosts:
+            client = net.get_ssh(host)
+            cmd = 'rm -rf {}'.format(os.path.join(cluster_path, '.deploy.state'))
+            net.ssh_execute(client=client, command=cmd)
+            client.close()
+        checkpoint.save(
+            installer=installer_path,
+            stage=STAGE_INSTALLED,
+            done_waves=[]
+        )
+        data = checkpoint.data
+
+    if data['stage'] == STAGE_INSTALLED:
+        center.configure_redis()
+        center.sync_conf()
+        key = 'cluster-node-timeout'
+        rolling = RollingRestart(center, width=width)
+        checkpoint.save(
+            stage=STAGE_CONFIGURED,
+            plan=rolling.plan(),
+            origin_m_timeout=center.cli_config_get(key, m_hosts[0], m_ports[0]),
+            origin_s_timeout=center.cli_config_get(key, s_hosts[0], s_ports[0])
+        )
+        data = checkpoint.data
 
+    # restart shards in waves. slaves are promoted before masters restart
     key = 'cluster-node-timeout'
-    origin_m_value = center.cli_config_get(key, m_hosts[0], m_ports[0])
-    origin_s_value = center.cli_config_get(key, s_hosts[0], s_ports[0])
     logger.debug('config set: cluster-node-timeout 2000')
     RedisCliConfig().set(key, '2000', all=True)
-
-    # cluster failover (with no option)
     logger.info(message.get('failover_on_deploy'))
-    logger.debug(slaves_for_failover)
-    try_count = 0
-    while try_count < 10:
-        try_count += 1
-        success = True
-        for slave_addr in slaves_for_failover:
-            host, port = slave_addr.split(':')
-            stdout = center.run_failover("{}:{}".format(host, port))
-            logger.debug("failover {}:{} {}".format(host, port, stdout))
-            if stdout != "ERR You should send CLUSTER FAILOVER to a slave":
-                # In some cases, the cluster failover is not complete
-                # even if stdout is OK
-                # If redis changed to master completely,
-                # return 'ERR You should send CLUSTER FAILOVER to a slave'
-                success = False
-        if success:
-            break
-        msg = message.get('retry').format(try_count=try_count)
-        logger.info(msg)
-        time.sleep(5)
-    logger.debug('restore config: cluster-node-timeout')
-    center.cli_config_set_all(key, origin_m_value, m_hosts, m_ports)
-    center.cli_config_set_all(key, origin_s_value, s_hosts, s_ports)
-    if not success:
-        logger.error(message.get('error_redis_failover'))
+    try:
+        with instrument.span('rolling_restart'):
+            RollingRestart(center, width=width).run(
+                plan=data['plan'],
+                done=data.get('done_waves', []),
+                on_wave_done=checkpoint.add_done_wave
+            )
+    except ClusterRedisError as ex:
+        logger.error(ex)
+        logger.info(message.get('resume_deploy'))
         return
+    finally:
+        logger.debug('restore config: cluster-node-timeout')
+        center.cli_config_set_all(
+            key,
+            data['origin_m_timeout'],
+            m_hosts,
+            m_ports
+        )
+        center.cli_config_set_all(
+            key,
+            data['origin_s_timeout'],
+            s_hosts,
+            s_ports
+        )
+    checkpoint.remove()
 
-    # restart master (current slave)
-    center.stop_current_nodes(master=False, slave=True)
-    center.configure_redis(slave=False)
-    center.sync_conf()
-    center.start_current_nodes(master=False, slave=True)
-    center.wait_until_all_redis_process_up()
 
 def _deploy(cluster_id, history_save, clean):
     deploy_state = DeployUtil().get_state(cluster_id)
@@ -397,7 +511,7 @@ def _deploy(cluster_id, history_save, clean):
         if not conflict:
             logger.info("OK")
             break
-        utils.print_table([["HOST", "PORT"]] + conflict)
+        utils.print_table([["HOST", "PORT", "PID", "USER"]] + conflict)
         msg = message.get('ask_port_collision')
         msg = color.yellow(msg)
         yes = ask_util.askBool(msg)
@@ -498,11 +612,14 @@ def _deploy(cluster_id, history_save, clean):
         backup_hosts += set(pre_hosts)
     # if force:
     #     backup_hosts += added_hosts
-    for host in backup_hosts:
-        cluster_path = path_of_fb['cluster_path']
-        client = net.get_ssh(host)
-        Center().cluster_backup(host, cluster_id, cluster_backup_dir)
-        client.close()
+    if backup_hosts:
+        success = Center().cluster_backup_all(
+            backup_hosts,
+            cluster_id,
+            cluster_backup_dir
+        )
+        if not success:
+            return
 
     # transfer & install
     msg = message.get('transfer_and_execute_installer')
@@ -674,7 +791,9 @@ for automatically generating CLIs
     - cluster: Command Wrapper of trib.rb
     - cli: Command wrapper of redis-cli
     - conf: Edit conf file
-    - monitor: Monitoring logs of redis
+    - monitor: Monitoring logs or metrics of redis
+    - log: Logs of redis on all hosts
+    - exporter: Export metrics of redis for Prometheus
     - thriftserver: Thriftserver command
     - ths: Alias of thriftserver
     - ll: Change log level
@@ -694,6 +813,8 @@ for automatically generating CLIs
         self.cli = Cli()
         self.conf = Conf()
         self.monitor = run_monitor
+        self.log = ServerLog()
+        self.exporter = run_exporter
         self.thriftserver = ThriftServer()
         self.ths = ThriftServer()
         self.ll = log.set_level
@@ -711,6 +832,7 @@ def _handle(text):
     text = text.replace('--help', '?')
     text = text.replace('?', '-- --help')
     err_flg = True
+    instrument.begin(text)
     try:
         fire.Fire(
             component=Command,
@@ -760,6 +882,7 @@ def _handle(text):
     except BaseException as ex:
         logger.exception(ex)
     finally:
+        instrument.end()
         return err_flg
 
 
@@ -817,10 +940,20 @@ def print_version():
 @click.option('-c', '--cluster_id', default=None, help='ClusterId.')
 @click.option('-d', '--debug', default=False, help='Debug.')
 @click.option('-v', '--version', is_flag=True, help='Version.')
-def main(cluster_id, debug, version):
+@click.option('--profile', is_flag=True,
+              help='Print time of ssh, redis, ... of each command.')
+@click.option('--profile-file', default=None,
+              help='Append profile of each command to file as json.')
+@click.option('--trace', default=None,
+              help='Write timeline of each command to file as chrome trace.')
+def main(cluster_id, debug, version, profile, profile_file, trace):
     if version:
         print_version()
         return
+    if profile or profile_file:
+        instrument.enable(profile_file)
+    if trace:
+        instrument.enable_trace(trace)
     _initial_check()
     if debug:
         log.set_mode('debug')
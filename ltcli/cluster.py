@@ -4,8 +4,16 @@ from functools import reduce
 import subprocess
 import time
 
-from ltcli import color, config, cluster_util, net, utils, message
+from ltcli import color, config, cluster_util, net, parallel, utils, message
+from ltcli import instrument
 from ltcli.center import Center
+from ltcli.failover import failover as failover_nodes
+from ltcli.failover import print_results as print_failover_results
+from ltcli.failover import ReadinessTracker, reattach_replicas
+from ltcli.rolling import RollingRestart
+from ltcli import snapshot as snapshot_util
+from ltcli.stats import get_targets
+from ltcli.hotspot import HotspotAnalyzer, WEIGHT_SCALE, print_report
 from ltcli.log import logger
 from ltcli.rediscli_util import RedisCliUtil
 from ltcli.redistrib2.custom_trib import rebalance_cluster_cmd
@@ -117,13 +125,10 @@ class Cluster(object):
         center.backup_server_logs(master=master, slave=slave)
         center.create_redis_data_directory()
 
-        # equal to cluster.configure()
-        center.configure_redis()
-        center.sync_conf(show_result=True)
-
-        center.start_redis_process(profile, master=master, slave=slave)
-        center.wait_until_all_redis_process_up(master=master, slave=slave)
+        # configure, sync conf, start and wait
+        center.configure_and_start(profile, master=master, slave=slave)
 
+    @instrument.traced
     def create(self, yes=False):
         """Create cluster
 
@@ -250,6 +255,8 @@ class Cluster(object):
         cluster=False,
         profile=False,
         yes=False,
+        rolling=False,
+        width=1,
     ):
         """Restart cluster
 
@@ -257,6 +264,9 @@ class Cluster(object):
         :param reset: Delete redis config, data, node configuration
         :param cluster: Create cluster after cluster start
         :param yes: Skip confirm information when cluster create
+        :param rolling: Restart in waves without downtime. A slave is
+            promoted before its master restarts
+        :param width: Maximum number of redis restarted in a wave of rolling
         """
         if not isinstance(force_stop, bool):
             msg = message.get('error_option_type_not_boolean')
@@ -289,11 +299,29 @@ class Cluster(object):
             msg = msg.format(option='yes')
             logger.error(msg)
             return
+        if not isinstance(rolling, bool):
+            msg = message.get('error_option_type_not_boolean')
+            msg = msg.format(option='rolling')
+            logger.error(msg)
+            return
+        if rolling and reset:
+            msg = message.get('error_option_not_use_with')
+            msg = msg.format(option='reset', with_option='rolling')
+            logger.error(msg)
+            return
+        if not isinstance(width, int) or width < 1:
+            msg = message.get('error_option_type_not_number')
+            msg = msg.format(option='width')
+            logger.error(msg)
+            return
         center = Center()
         center.update_ip_port()
         success = center.check_hosts_connection()
         if not success:
             return
+        if rolling:
+            RollingRestart(center, width=width, force=force_stop).run()
+            return
         center.stop_redis(force=force_stop)
         if reset:
             self.clean()
@@ -853,13 +881,64 @@ class Cluster(object):
 
 
 
-    def rebalance(self, ip, port):
+    @instrument.traced
+    def rebalance(self, ip, port, hotspot=False, t=5):
         """Rebalance cluster
 
         :param ip: rebalance target ip
         :param port: rebalance target port
+        :param hotspot: If true, weight nodes by load (see 'cluster hotspot')
+            instead of number of slots
+        :param t: time(sec) to measure command rate, used with hotspot
         """
-        rebalance_cluster_cmd(ip, port)
+        if not isinstance(hotspot, bool):
+            msg = message.get('error_option_type_not_boolean')
+            msg = msg.format(option='hotspot')
+            logger.error(msg)
+            return
+        weights = None
+        if hotspot:
+            analyzer = HotspotAnalyzer(ip, port)
+            try:
+                report = analyzer.analyze(interval=t)
+            finally:
+                analyzer.close()
+            print_report(report)
+            weights = report.weights()
+        # master not in weights, ex) failed while analyzed, is weighted
+        # as average
+        rebalance_cluster_cmd(
+            ip,
+            port,
+            weights=weights,
+            default_weight=WEIGHT_SCALE
+        )
+
+    def hotspot(self, ip, port, t=5, n=10, sample=0):
+        """Find hot slots and nodes
+
+        :param ip: ip of any node in cluster
+        :param port: port of the node
+        :param t: time(sec) to measure command rate
+        :param n: number of hot slots and keys to print
+        :param sample: number of keys to sample per master with OBJECT FREQ
+            (needs LFU maxmemory-policy)
+        """
+        if not isinstance(n, int):
+            msg = message.get('error_option_type_not_number').format(option='n')
+            logger.error(msg)
+            return
+        if not isinstance(sample, int):
+            msg = message.get('error_option_type_not_number')
+            msg = msg.format(option='sample')
+            logger.error(msg)
+            return
+        analyzer = HotspotAnalyzer(ip, port)
+        try:
+            report = analyzer.analyze(interval=t, samples=sample)
+        finally:
+            analyzer.close()
+        print_report(report, n=n)
 
     def check(self, ip, port):
         """Check that all slots are allocated to the surviving node
@@ -869,6 +948,7 @@ class Cluster(object):
         """
         check_cluster_cmd(ip,port)
 
+    @instrument.traced
     def add_slave(self, yes=False):
         """Add slave of cluster
 
@@ -950,32 +1030,44 @@ class Cluster(object):
         center.update_ip_port()
         master_obj_list = center.get_master_obj_list()
         msg = color.yellow(message.get('error_no_alive_slave_for_failover'))
-        all_alive = True
+        # candidates: [(master addr, [alive slave addr, ...])]
+        candidates = []
         for node in master_obj_list:
-            if node['status'] != 'connected':
-                all_alive = False
-                success = False
-                for slave in node['slaves']:
-                    if slave['status'] == 'connected':
-                        msg2 = message.get('redis_failover').format(
-                            slave_addr=slave['addr'],
-                            master_addr=node['addr']
-                        )
-                        logger.info(msg2)
-                        stdout = center.run_failover(
-                            slave['addr'],
-                            take_over=True
-                        )
-                        if stdout != 'OK':
-                            continue
-                        logger.info('OK')
-                        success = True
-                        break
-                if not success:
-                    logger.info(msg.format(node['addr']))
-        if all_alive:
+            if node['status'] == 'connected':
+                continue
+            slaves = []
+            for slave in node['slaves']:
+                if slave['status'] == 'connected':
+                    slaves.append(slave['addr'])
+            candidates.append((node['addr'], slaves))
+        if not candidates:
             msg = message.get('already_all_master_alive')
             logger.info(msg)
+            return
+        # try next slave of master only if failover of previous slave failed
+        results = []
+        index = 0
+        while True:
+            targets = {}
+            for master_addr, slaves in candidates:
+                if index < len(slaves):
+                    targets[slaves[index]] = master_addr
+            if not targets:
+                break
+            for slave_addr, master_addr in targets.items():
+                msg2 = message.get('redis_failover').format(
+                    slave_addr=slave_addr,
+                    master_addr=master_addr
+                )
+                logger.info(msg2)
+            ret = failover_nodes(list(targets.keys()), takeover=True, retry=0)
+            results += ret
+            succeeded = [targets[r.addr] for r in ret if r.ok]
+            candidates = [c for c in candidates if c[0] not in succeeded]
+            index += 1
+        print_failover_results(results)
+        for master_addr, _ in candidates:
+            logger.info(msg.format(host=master_addr))
 
     def failback(self):
         """Restart disconnected redis
@@ -1007,21 +1099,66 @@ class Cluster(object):
             if host not in classified_paused_list:
                 classified_paused_list[host] = []
             classified_paused_list[host].append(port)
-        current_time = time.strftime("%Y%m%d-%H%M", time.gmtime())
-        for host, ports in classified_disconnected_list.items():
-            msg = message.get('redis_run')
-            msg = msg.format(host=host, ports='|'.join(ports))
-            logger.info(msg)
-            center.run_redis_process(host, ports, False, current_time)
-        for host, ports in classified_paused_list.items():
-            msg = message.get('redis_restart')
-            msg = msg.format(host=host, ports='|'.join(ports))
-            logger.info(msg)
-            center.stop_redis_process(host, ports)
-            center.run_redis_process(host, ports, False, current_time)
         if not classified_disconnected_list and not classified_paused_list:
             msg = message.get('already_all_redis_alive')
             logger.info(msg)
+            return
+        current_time = time.strftime("%Y%m%d-%H%M", time.gmtime())
+        hosts = set(classified_disconnected_list.keys())
+        hosts.update(classified_paused_list.keys())
+        ssh_pool = net.SSHPool()
+
+        def _restart(host):
+            client = ssh_pool.get(host)
+            paused_ports = classified_paused_list.get(host, [])
+            if paused_ports:
+                msg = message.get('redis_restart')
+                msg = msg.format(host=host, ports='|'.join(paused_ports))
+                logger.info(msg)
+                center.stop_redis_process(host, paused_ports, client=client)
+            ports = classified_disconnected_list.get(host, []) + paused_ports
+            if classified_disconnected_list.get(host):
+                msg = message.get('redis_run')
+                msg = msg.format(
+                    host=host,
+                    ports='|'.join(classified_disconnected_list[host])
+                )
+                logger.info(msg)
+            center.run_redis_process(
+                host,
+                ports,
+                False,
+                current_time,
+                client=client
+            )
+
+        try:
+            results = parallel.run(_restart, sorted(hosts))
+        finally:
+            ssh_pool.close()
+        for result in results:
+            if not result.ok:
+                logger.error('{}: {}'.format(result.args[0], result.error))
+        restarted = disconnected_list + paused_list
+        if not ReadinessTracker(restarted).wait():
+            msg = [
+                message.get('error_max_try_start_redis'),
+                message.get('command_recommendation').format(cmd='monitor')
+            ]
+            raise ClusterRedisError('\n'.join(msg))
+        pairs = {}
+        for m_host, m_port, s_host, s_port in \
+                center._get_master_slave_pair_list():
+            m_addr = '{}:{}'.format(net.get_ip(m_host), m_port)
+            s_addr = '{}:{}'.format(net.get_ip(s_host), s_port)
+            pairs[m_addr] = s_addr
+            pairs[s_addr] = m_addr
+        for addr, partner in reattach_replicas(restarted, pairs):
+            msg = message.get('try_replicate').format(
+                master_addr=partner,
+                slave_addr=addr
+            )
+            logger.info(msg)
 
     def tree(self):
         """The results of 'cli cluster nodes' are displayed in tree format
@@ -1133,41 +1270,108 @@ class Cluster(object):
         # check all host tag folder: OK / NOT FOUND
         msg = message.get('check_backup_info')
         logger.info(msg)
+        with net.SSHPool() as ssh_pool:
+            results = parallel.run(
+                lambda host: net.is_dir(ssh_pool.get(host), backup_path),
+                hosts
+            )
         buf = []
-        for host in hosts:
-            client = net.get_ssh(host)
-            if not net.is_dir(client, backup_path):
+        for result in results:
+            if not result.ok or not result.value:
                 logger.debug('cannot find backup dir: {}-{}'.format(
-                    host,
+                    result.args[0],
                     cluster_restore_dir
                 ))
-                buf.append([host, color.red('NOT FOUND')])
-            client.close()
+                buf.append([result.args[0], color.red('NOT FOUND')])
         if buf:
-            utils.print_table([['HOST', 'RESULT'] + buf])
+            utils.print_table([['HOST', 'RESULT']] + buf)
             return
         logger.info('OK')
 
+        center = Center()
         # backup cluster
         new_tag = time.strftime("%Y%m%d%H%M%S", time.gmtime())
         cluster_backup_dir = 'cluster_{}_bak_{}'.format(cluster_id, new_tag)
-        for host in hosts:
-            Center().cluster_backup(host, cluster_id, cluster_backup_dir)
+        if not center.cluster_backup_all(hosts, cluster_id, cluster_backup_dir):
+            return
 
         # restore cluster
-        command = "cp -r {} {}/cluster_{}".format(
-            backup_path,
+        restore_path = '{}/cluster_{}'.format(
             path_of_fb['base_directory'],
             cluster_id
         )
-        for host in hosts:
-            msg = message.get('restore_cluster')
-            msg = msg.format(tag=cluster_backup_dir, host=host)
-            logger.info(msg)
-            client = net.get_ssh(host)
-            net.ssh_execute(client, command)
-            client.close()
-            logger.info("OK")
+        center.cluster_restore_all(hosts, backup_path, restore_path)
+
+    def snapshot(self, slave=False, per_host=1, copy=False, ls=False):
+        """Take BGSAVE of all instances and keep dump files in catalog
+
+        Dump files are kept in 'backup/snapshot/<tag>' of each host.
+
+        :param slave: If true, snapshot slaves instead of masters
+        :param per_host: maximum number of concurrent BGSAVE of a host
+        :param copy: If true, copy dump files instead of hard link
+        :param ls: If true, print list of snapshots only
+        """
+        for option, value in [('slave', slave), ('copy', copy), ('ls', ls)]:
+            if not isinstance(value, bool):
+                msg = message.get('error_option_type_not_boolean')
+                msg = msg.format(option=option)
+                logger.error(msg)
+                return
+        if not isinstance(per_host, int) or per_host < 1:
+            msg = message.get('error_option_type_not_number')
+            msg = msg.format(option='per-host')
+            logger.error(msg)
+            return
+        cluster_id = config.get_cur_cluster_id()
+        path_of_fb = config.get_path_of_fb(cluster_id)
+        snapshot_path = os.path.join(
+            path_of_fb['cluster_backup_path'],
+            'snapshot'
+        )
+        if ls:
+            catalogs = snapshot_util.load_catalogs(snapshot_path)
+            prefix = 'cluster_{}_snap_'.format(cluster_id)
+            catalogs = [c for c in catalogs if c['tag'].startswith(prefix)]
+            snapshot_util.print_catalogs(catalogs)
+            return
+        role = 'slave' if slave else 'master'
+        tag = 'cluster_{}_snap_{}'.format(
+            cluster_id,
+            time.strftime("%Y%m%d%H%M%S", time.gmtime())
+        )
+        catalog_path = os.path.join(snapshot_path, tag)
+        cluster_snapshot = snapshot_util.ClusterSnapshot(
+            get_targets(cluster_id),
+            catalog_path,
+            max_per_host=per_host,
+            copy=copy
+        )
+        try:
+            entries = cluster_snapshot.select(role)
+            if not entries:
+                msg = message.get('error_no_snapshot_target').format(role=role)
+                logger.error(msg)
+                return
+            msg = message.get('start_snapshot')
+            logger.info(msg.format(count=len(entries), per_host=per_host))
+            results = cluster_snapshot.run(entries)
+        finally:
+            cluster_snapshot.close()
+        snapshot_util.print_results(results)
+        catalog = snapshot_util.save_catalog(
+            os.path.join(catalog_path, snapshot_util.CATALOG_FILE),
+            cluster_id,
+            tag,
+            results
+        )
+        if not catalog['complete']:
+            msg = message.get('error_snapshot_partial')
+            msg = msg.format(tag=tag, count=len(catalog['failed']))
+            logger.error(msg)
+            return
+        msg = message.get('complete_snapshot')
+        logger.info(msg.format(tag=tag, path=catalog_path))
 
     def version(self):
         """Get version of lightningDB
@@ -1198,8 +1402,8 @@ class Cluster(object):
             hosts += [config.get_local_ip()]
         tag = time.strftime("%Y%m%d%H%M%S", time.gmtime())
         cluster_backup_dir = 'cluster_{}_bak_{}'.format(cluster_id, tag)
-        for host in hosts:
-            center.cluster_backup(host, cluster_id, cluster_backup_dir)
+        if not center.cluster_backup_all(hosts, cluster_id, cluster_backup_dir):
+            return
         msg = message.get('cluster_delete_complete')
         msg = msg.format(cluster_id=cluster_id)
         logger.info(msg)
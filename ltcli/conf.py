@@ -2,9 +2,10 @@ import os
 import shutil
 
 
-from ltcli import config, editor, ask_util, message
+from ltcli import config, editor, ask_util, message, utils
 from ltcli.log import logger
 from ltcli.center import Center
+from ltcli.conf_store import ConfStore
 
 
 class Conf(object):
@@ -71,6 +72,36 @@ class Conf(object):
         """
         self.thriftserver()
 
+    def backup(self, prune=0):
+        """List conf backups of cluster
+
+        :param prune: If set, remove backups except the latest N
+        """
+        if not isinstance(prune, int) or prune < 0:
+            msg = message.get('error_option_type_not_number')
+            msg = msg.format(option='prune')
+            logger.error(msg)
+            return
+        cluster_id = config.get_cur_cluster_id()
+        path_of_cli = config.get_path_of_cli(cluster_id)
+        store = ConfStore(path_of_cli['conf_backup_path'])
+        prefix = 'cluster_{}_conf_bak_'.format(cluster_id)
+        if prune > 0:
+            tags, objects = store.prune(prune, prefix=prefix)
+            msg = message.get('complete_conf_backup_prune')
+            logger.info(msg.format(tags=len(tags), objects=objects))
+        meta = [['TAG', 'FILES', 'SIZE']]
+        for manifest in store.manifests(prefix):
+            files = [
+                e for e in manifest['entries'].values() if e['type'] == 'file'
+            ]
+            meta.append([
+                manifest['tag'],
+                len(files),
+                utils.int_2_bytes(sum(e['size'] for e in files)),
+            ])
+        utils.print_table(meta)
+
     def _edit_conf(self, target_path, syntax=None):
         tmp_target_path = target_path + '.tmp'
         if os.path.exists(tmp_target_path):
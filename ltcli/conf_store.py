@@ -0,0 +1,239 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+
+from ltcli.log import logger
+from ltcli.exceptions import SSHCommandError
+
+
+MANIFEST_DIR = 'manifests'
+OBJECT_DIR = 'objects'
+
+
+def _write_atomic(path, data):
+    tmp_path = '{}.tmp.{}'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fd:
+        fd.write(data)
+    os.rename(tmp_path, path)
+
+
+def _check_exit(client, channel, command, stderr):
+    exit_status = channel.recv_exit_status()
+    if exit_status != 0:
+        stderr_msg = stderr.read()
+        logger.debug('[{}] {}'.format(command, stderr_msg))
+        raise SSHCommandError(exit_status, client.hostname, stderr_msg)
+
+
+class ConfStore(object):
+    """Content addressed store of conf backup
+
+    A file is stored once in 'objects/' named by its sha256, however many
+    backups have it. A backup is a manifest 'manifests/<tag>.json' which
+    maps path of each file to its object. Directory of remote host is
+    fetched and restored with a tar stream over a single ssh channel.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: directory of store (conf_backup_path)
+        """
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_DIR)
+        self.object_path = os.path.join(root, OBJECT_DIR)
+
+    def _init(self):
+        for path in [self.root, self.manifest_path, self.object_path]:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def _object(self, digest):
+        return os.path.join(self.object_path, digest[:2], digest[2:])
+
+    def _manifest(self, tag):
+        return os.path.join(self.manifest_path, '{}.json'.format(tag))
+
+    def _put_object(self, data):
+        """
+        :return: (sha256, True if newly stored)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object(digest)
+        if os.path.exists(path):
+            return digest, False
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        _write_atomic(path, data)
+        return digest, True
+
+    def has(self, tag):
+        return os.path.isfile(self._manifest(tag))
+
+    def load(self, tag):
+        with open(self._manifest(tag), 'r') as fd:
+            return json.load(fd)
+
+    def manifests(self, prefix=''):
+        """
+        :param prefix: prefix of tag
+        :return: list of manifest(dict) sorted by created time
+        """
+        ret = []
+        if not os.path.isdir(self.manifest_path):
+            return ret
+        for name in os.listdir(self.manifest_path):
+            if not name.endswith('.json') or not name.startswith(prefix):
+                continue
+            ret.append(self.load(name[:-len('.json')]))
+        ret.sort(key=lambda x: (x['created'], x['tag']))
+        return ret
+
+    def _save_tar(self, tag, tar):
+        entries = {}
+        stat = {'files': 0, 'new': 0, 'bytes': 0}
+        for info in tar:
+            name = os.path.normpath(info.name)
+            if name == '.':
+                continue
+            entry = {'mode': info.mode}
+            if info.isdir():
+                entry['type'] = 'dir'
+            elif info.issym():
+                entry['type'] = 'link'
+                entry['target'] = info.linkname
+            elif info.isfile():
+                data = tar.extractfile(info).read()
+                digest, new = self._put_object(data)
+                entry.update({'type': 'file', 'sha256': digest,
+                              'size': len(data)})
+                stat['files'] += 1
+                if new:
+                    stat['new'] += 1
+                    stat['bytes'] += len(data)
+            else:
+                continue
+            entries[name] = entry
+        manifest = {
+            'tag': tag,
+            'created': int(time.time()),
+            'entries': entries,
+        }
+        data = json.dumps(manifest, indent=2, sort_keys=True)
+        _write_atomic(self._manifest(tag), data.encode('utf-8'))
+        logger.debug('conf backup {}: {}'.format(tag, stat))
+        return stat
+
+    def backup_remote(self, client, remote_path, tag):
+        """Store directory of remote host as tag
+
+        :param client: SSHClient
+        :param remote_path: absolute path of directory
+        :param tag: tag of backup
+        :return: dict of number of files, new objects and bytes stored
+        """
+        self._init()
+        command = 'tar -C {} -cf - .'.format(remote_path)
+        logger.debug('[ssh_execute] {}'.format(command))
+        _, stdout, stderr = client.exec_command(command)
+        tar = tarfile.open(fileobj=stdout, mode='r|')
+        try:
+            stat = self._save_tar(tag, tar)
+        finally:
+            tar.close()
+        _check_exit(client, stdout.channel, command, stderr)
+        return stat
+
+    def backup_local(self, local_path, tag):
+        """Store local directory as tag. See backup_remote"""
+        self._init()
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            tar.add(local_path, arcname='.')
+        buf.seek(0)
+        with tarfile.open(fileobj=buf, mode='r') as tar:
+            return self._save_tar(tag, tar)
+
+    def _make_tar(self, tag):
+        manifest = self.load(tag)
+        buf = io.BytesIO()
+        tar = tarfile.open(fileobj=buf, mode='w')
+        # parent directories first
+        for name in sorted(manifest['entries'].keys()):
+            entry = manifest['entries'][name]
+            info = tarfile.TarInfo(name)
+            info.mode = entry['mode']
+            info.mtime = manifest['created']
+            if entry['type'] == 'dir':
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif entry['type'] == 'link':
+                info.type = tarfile.SYMTYPE
+                info.linkname = entry['target']
+                tar.addfile(info)
+            else:
+                info.size = entry['size']
+                with open(self._object(entry['sha256']), 'rb') as fd:
+                    tar.addfile(info, fd)
+        tar.close()
+        return buf.getvalue()
+
+    def restore_remote(self, client, tag, remote_path):
+        """Write files of tag to directory of remote host
+
+        Files not in backup are left as they are.
+
+        :param client: SSHClient
+        :param tag: tag of backup
+        :param remote_path: absolute path of directory
+        """
+        data = self._make_tar(tag)
+        command = 'mkdir -p {0} && tar -C {0} -xf -'.format(remote_path)
+        logger.debug('[ssh_execute] {}'.format(command))
+        stdin, stdout, stderr = client.exec_command(command)
+        stdin.write(data)
+        stdin.flush()
+        stdin.channel.shutdown_write()
+        _check_exit(client, stdout.channel, command, stderr)
+
+    def prune(self, keep, prefix=''):
+        """Remove old backups and objects no longer referenced
+
+        :param keep: number of latest backups to keep
+        :param prefix: prefix of tag. Only backups with it are removed
+        :return: (removed tags, number of removed objects)
+        """
+        manifests = self.manifests(prefix)
+        if keep > 0:
+            old = manifests[:-keep]
+        else:
+            old = manifests
+        removed = []
+        for manifest in old:
+            os.remove(self._manifest(manifest['tag']))
+            removed.append(manifest['tag'])
+        return removed, self.gc()
+
+    def gc(self):
+        """Remove objects not referenced by any manifest
+
+        :return: number of removed objects
+        """
+        if not os.path.isdir(self.object_path):
+            return 0
+        used = set()
+        for manifest in self.manifests():
+            for entry in manifest['entries'].values():
+                if entry['type'] == 'file':
+                    used.add(entry['sha256'])
+        count = 0
+        for sub in os.listdir(self.object_path):
+            directory = os.path.join(self.object_path, sub)
+            for name in os.listdir(directory):
+                if sub + name not in used:
+                    os.remove(os.path.join(directory, name))
+                    count += 1
+        return count
@@ -4,6 +4,7 @@ import time
 import re
 import subprocess
 import shutil
+from collections import namedtuple
 
 import yaml
 
@@ -343,37 +344,181 @@ def get_path_of_fb(cluster_id):
     }
 
 
-def get_env_dict(ip, port):
+Instance = namedtuple('Instance', [
+    'host',
+    'port',
+    'role',
+    'ssd_no',
+    'redis_data',
+    'flash_db_path',
+    'redis_dump',
+])
+
+
+class InstanceTable(object):
+    """Redis instances of a cluster and their paths
+
+    Built from one read of redis.properties. Paths of an instance depend
+    only on its port, so they are computed once per port when first needed.
+    Do not modify.
+    """
+
+    def __init__(self, cluster_id, props, user):
+        """
+        :param cluster_id: cluster id
+        :param props: result of get_props_as_dict of redis.properties
+        :param user: user name in data paths
+        """
+        self.cluster_id = cluster_id
+        self.user = user
+        self.master_hosts = tuple(props.get('sr2_redis_master_hosts', []))
+        self.master_ports = tuple(props.get('sr2_redis_master_ports', []))
+        self.slave_hosts = tuple(props.get('sr2_redis_slave_hosts', []))
+        self.slave_ports = tuple(props.get('sr2_redis_slave_ports', []))
+        self._ssd_count = int(props.get('ssd_count', 0))
+        # None if not in props. PropsKeyError is raised when paths are needed
+        self._redis_data_prefix = props.get('sr2_redis_data')
+        self._flash_db_path_prefix = props.get('sr2_flash_db_path')
+        self.path_of_fb = get_path_of_fb(cluster_id)
+        self.ld_library_path = ':'.join([
+            '{}/native'.format(self.path_of_fb['sr2_redis_lib']),
+            '/usr/lib64',
+        ])
+        self._by_port = {}
+        self._by_addr = {}
+        self._roles = {}
+        for role, hosts, ports in [
+                ('slave', self.slave_hosts, self.slave_ports),
+                ('master', self.master_hosts, self.master_ports)]:
+            for host in hosts:
+                for port in ports:
+                    self._roles[(host, port)] = role
+
+    def _make(self, port):
+        if self._redis_data_prefix is None:
+            raise PropsKeyError('sr2_redis_data')
+        if self._flash_db_path_prefix is None:
+            raise PropsKeyError('sr2_flash_db_path')
+        ssd_no = get_sata_ssd_no(port, self._ssd_count)
+        redis_data = os.path.join(
+            self._redis_data_prefix + ssd_no,
+            'nvkvs',
+            self.user,
+        )
+        flash_db_path = os.path.join(
+            self._flash_db_path_prefix + ssd_no,
+            'nvkvs',
+            self.user,
+            'db/db-{port}'.format(port=port),
+        )
+        return Instance(
+            host=None,
+            port=port,
+            role=None,
+            ssd_no=ssd_no,
+            redis_data=redis_data,
+            flash_db_path=flash_db_path,
+            redis_dump=os.path.join(redis_data, 'dump'),
+        )
+
+    def get(self, host, port):
+        """
+        :return: Instance. None if host:port is not in props
+        """
+        addr = (host, int(port))
+        instance = self._by_addr.get(addr)
+        if instance is None:
+            role = self._roles.get(addr)
+            if role is None:
+                return None
+            instance = self.paths(port)._replace(host=host, role=role)
+            self._by_addr[addr] = instance
+        return instance
+
+    def paths(self, port):
+        """Instance of port with paths. host and role are None
+        """
+        port = int(port)
+        instance = self._by_port.get(port)
+        if instance is None:
+            instance = self._make(port)
+            self._by_port[port] = instance
+        return instance
+
+    def addrs(self, role=None):
+        """Addresses of instances. Paths are not needed
+
+        :param role: 'master' or 'slave'. If None, all instances
+        :return: sorted list of (host, port)
+        """
+        ret = self._roles.items()
+        return sorted(a for a, r in ret if role is None or r == role)
+
+    def instances(self, role=None):
+        """
+        :param role: 'master' or 'slave'. If None, all instances
+        :return: list of Instance
+        """
+        ret = [self.get(host, port) for host, port in self.addrs(role)]
+        return sorted(ret, key=lambda i: (i.role, i.host, i.port))
+
+
+_instance_tables = {}
+
+
+def get_instance_table(cluster_id=None):
+    """Get InstanceTable of cluster
+
+    The table is reused until redis.properties is changed.
+
+    :param cluster_id: cluster id. If None, current cluster
+    :return: InstanceTable
+    """
+    if cluster_id is None:
+        cluster_id = get_cur_cluster_id()
+    props_path = get_path_of_fb(cluster_id)['redis_properties']
+    try:
+        st = os.stat(props_path)
+        stat = (st.st_mtime, st.st_size)
+    except OSError:
+        # no redis.properties. Table is empty like lists of hosts and ports
+        stat = None
+    user = os.environ['USER']
+    key = (cluster_id, props_path, stat, user)
+    table = _instance_tables.get(cluster_id)
+    if table is None or table[0] != key:
+        props = get_props_as_dict(props_path) if stat else {}
+        table = (key, InstanceTable(cluster_id, props, user))
+        _instance_tables[cluster_id] = table
+    return table[1]
+
+
+def get_env_dict(ip, port, table=None):
     """Collection of env
 
     Build env from config and return it as dict type.
 
     :param ip: ip
     :param port: port
+    :param table: InstanceTable. If None, table of current cluster
     :return: dict
     """
-
-    ssd_disk_position = get_ssd_disk_position(port)
-    cluster_id = get_cur_cluster_id()
-    path_of_fb = get_path_of_fb(cluster_id)
+    if table is None:
+        table = get_instance_table()
+    instance = table.paths(port)
+    path_of_fb = table.path_of_fb
     return {
         'sr2_redis_home': path_of_fb['sr2_redis_home'],
         'sr2_redis_bin': path_of_fb['sr2_redis_bin'],
         'sr2_redis_lib': path_of_fb['sr2_redis_lib'],
         'sr2_redis_conf': path_of_fb['sr2_redis_conf'],
         'sr2_redis_log': path_of_fb['sr2_redis_log'],
-        'sr2_redis_data': ssd_disk_position['sr2_redis_data'],
-        'sr2_redis_dump': ssd_disk_position['sr2_redis_dump'],
-        'sr2_flash_db_path': ssd_disk_position['sr2_flash_db_path'],
-        'sr2_redis_db_path': ssd_disk_position['sr2_redis_db_path'],
-        'ld_library_path': ':'.join([
-            '{}/native'.format(path_of_fb['sr2_redis_lib']),
-            '/usr/lib64',
-        ]),
-        'dyld_library_path': ':'.join([
-            '{}/native'.format(path_of_fb['sr2_redis_lib']),
-            '/usr/lib64',
-        ]),
+        'sr2_redis_data': instance.redis_data,
+        'sr2_redis_dump': instance.redis_dump,
+        'sr2_flash_db_path': instance.flash_db_path,
+        'sr2_redis_db_path': instance.flash_db_path,
+        'ld_library_path': table.ld_library_path,
+        'dyld_library_path': table.ld_library_path,
         'sr2_redis_host': ip,
         'sr2_redis_port': port,
     }
@@ -547,9 +692,9 @@ def set_props(props_path, key, value):
 
 
 def get_props(props_path, key, default=None):
-    logger.debug('Get props key: {}, default: {}'.format(key, default))
+    logger.debug('Get props key: {}, default: {}', key, default)
     props = get_props_as_dict(props_path)
-    logger.debug(props)
+    logger.debug('{}', props)
     try:
         return props[key]
     except KeyError:
@@ -598,10 +743,10 @@ def get_props_as_dict(props_path):
                         'echo ${FBCLI_TMP_ENV[@]}'
                     ]
                     cmd = ' '.join(cmd)
-                    logger.debug('subprocess cmd: {}'.format(cmd))
+                    logger.debug('subprocess cmd: {}', cmd)
                     value = subprocess.check_output(cmd, shell=True)
                     value = to_str(value.strip())
-                    logger.debug('subprocess result: {}'.format(value))
+                    logger.debug('subprocess result: {}', value)
                     value = value.split(' ')
                     value = map(lambda x: int(x) if is_number(x) else x, value)
                     value = filter(lambda x: bool(x), value)
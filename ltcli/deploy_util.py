@@ -1,3 +1,4 @@
+import json
 import os
 
 from ltcli import config, utils, net
@@ -9,6 +10,10 @@ CLEAN = 101
 PENDING = 102
 DEPLOYED = 103
 
+# stages of zero-downtime deploy
+STAGE_INSTALLED = 'installed'
+STAGE_CONFIGURED = 'configured'
+
 
 class DeployUtil(object):
 
@@ -76,7 +81,13 @@ class DeployUtil(object):
         client = net.get_ssh(host)
         if not net.is_exist(client, installer_path):
             raise FileNotExistError(installer_path, host=host)
-        net.ssh_execute(client=client, command=command)
+        # progress of installer
+        net.ssh_stream(
+            client,
+            command,
+            on_stdout=lambda line: logger.debug('[{}] {}', host, line),
+            on_stderr=lambda line: logger.debug('[{}] {}', host, line)
+        )
         client.close()
         logger.debug('OK')
 
@@ -112,3 +123,42 @@ class DeployUtil(object):
         meta.append(['ssd count', props_dict['ssd_count']])
         meta.append(['db path', props_dict['prefix_of_db_path']])
         return meta
+
+
+class DeployCheckpoint(object):
+    """Progress of zero-downtime deploy saved in local file
+
+    An interrupted deploy can resume from the last completed stage and wave.
+    """
+
+    def __init__(self, cluster_id):
+        path_of_cli = config.get_path_of_cli(cluster_id)
+        self.path = os.path.join(
+            path_of_cli['cluster_path'],
+            '.deploy.checkpoint'
+        )
+        self.data = {}
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def load(self):
+        with open(self.path, 'r') as fd:
+            self.data = json.load(fd)
+        return self.data
+
+    def save(self, **kwargs):
+        self.data.update(kwargs)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump(self.data, fd)
+        os.rename(tmp_path, self.path)
+
+    def add_done_wave(self, wave_id):
+        done = self.data.get('done_waves', [])
+        done.append(wave_id)
+        self.save(done_waves=done)
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
@@ -113,6 +113,18 @@ class SSHCommandError(LtcliBaseError):
         LtcliBaseError.__init__(self, message, *args)
 
 
+class SSHCommandTimeoutError(LtcliBaseError):
+    def __init__(self, host, command, timeout, *args):
+        self.host = host
+        self.command = command
+        message = m.get('error_ssh_command_timeout').format(
+            host=host,
+            command=command,
+            timeout=timeout
+        )
+        LtcliBaseError.__init__(self, message, *args)
+
+
 class CreateDirError(LtcliBaseError):
     def __init__(self, message, dir_path, *args):
         self.dir_path = dir_path
@@ -123,3 +135,11 @@ class EnvError(LtcliBaseError):
     def __init__(self, env, *args):
         message = m.get('error_env').format(env=env)
         LtcliBaseError.__init__(self, message, *args)
+
+
+class AgentError(LtcliBaseError):
+    def __init__(self, host, op, error, *args):
+        self.host = host
+        self.op = op
+        message = m.get('error_agent').format(host=host, op=op, error=error)
+        LtcliBaseError.__init__(self, message, *args)
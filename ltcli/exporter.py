@@ -0,0 +1,230 @@
+import time
+from threading import Lock
+
+from six.moves import BaseHTTPServer, socketserver
+
+from ltcli.log import logger
+from ltcli.stats import StatCollector
+
+
+SLOT_COUNT = 16384
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+INSTANCE_METRICS = [
+    # (name, type, help, getter)
+    ('ltcli_redis_up', 'gauge', 'Whether the instance answered INFO',
+     lambda stat: 1 if stat.alive else 0),
+    ('ltcli_redis_used_memory_bytes', 'gauge', 'used_memory of instance',
+     lambda stat: stat.info.get('used_memory')),
+    ('ltcli_redis_used_memory_rss_bytes', 'gauge',
+     'used_memory_rss of instance',
+     lambda stat: stat.info.get('used_memory_rss')),
+    ('ltcli_redis_keys', 'gauge', 'Number of keys of all db',
+     lambda stat: stat.keys if stat.alive else None),
+    ('ltcli_redis_total_rows', 'gauge', 'Sum of totalRows of all tables',
+     lambda stat: stat.total_rows if stat.alive else None),
+    ('ltcli_redis_commands_processed_total', 'counter',
+     'total_commands_processed of instance',
+     lambda stat: stat.info.get('total_commands_processed')),
+    ('ltcli_redis_evicted_keys_total', 'counter', 'evicted_keys of instance',
+     lambda stat: stat.info.get('evicted_keys')),
+    ('ltcli_redis_connected_slaves', 'gauge', 'connected_slaves of instance',
+     lambda stat: stat.info.get('connected_slaves')),
+    ('ltcli_redis_master_repl_offset', 'gauge',
+     'master_repl_offset of instance',
+     lambda stat: stat.info.get('master_repl_offset')),
+    ('ltcli_redis_cluster_state_ok', 'gauge',
+     'Whether cluster_state of instance is ok',
+     lambda stat: None if 'cluster_state' not in stat.info else
+     int(stat.info['cluster_state'] == 'ok')),
+    ('ltcli_redis_cluster_slots_ok', 'gauge',
+     'cluster_slots_ok seen by instance',
+     lambda stat: stat.info.get('cluster_slots_ok')),
+    ('ltcli_redis_cluster_known_nodes', 'gauge',
+     'cluster_known_nodes seen by instance',
+     lambda stat: stat.info.get('cluster_known_nodes')),
+]
+
+TABLE_METRICS = [
+    # (name, type, help, key of table stats)
+    ('ltcli_table_rows', 'gauge', 'totalRows of table', 'totalRows'),
+    ('ltcli_table_evicted_rows', 'gauge', 'evictedRows of table',
+     'evictedRows'),
+    ('ltcli_table_partitions', 'gauge', 'partitions of table', 'partitions'),
+]
+
+
+def _escape(value):
+    value = str(value)
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**kwargs):
+    items = sorted(kwargs.items())
+    pairs = ['{}="{}"'.format(k, _escape(v)) for k, v in items]
+    return '{' + ','.join(pairs) + '}'
+
+
+def _head(lines, name, metric_type, help_msg):
+    lines.append('# HELP {} {}'.format(name, help_msg))
+    lines.append('# TYPE {} {}'.format(name, metric_type))
+
+
+def _get_table_stats(info):
+    """{table_id: stats dict} from 'INFO tablespace'"""
+    ret = {}
+    for key, value in info.items():
+        if isinstance(value, dict) and 'totalRows' in value:
+            table_id = key.split('_', 1)[-1]
+            ret[table_id] = value
+    return ret
+
+
+def render_metrics(stats, cluster_id, scrape_duration):
+    """Make Prometheus text exposition from NodeStat list
+
+    :param stats: list of NodeStat
+    :param cluster_id: cluster #
+    :param scrape_duration: elapsed time(sec) for collecting stats
+    :return: text
+    """
+    lines = []
+    for name, metric_type, help_msg, getter in INSTANCE_METRICS:
+        _head(lines, name, metric_type, help_msg)
+        for stat in stats:
+            value = getter(stat)
+            if value is None:
+                continue
+            labels = _labels(
+                cluster=cluster_id,
+                host=stat.host,
+                addr=stat.addr,
+                role=stat.role if stat.alive else stat.m_s.lower(),
+            )
+            lines.append('{}{} {}'.format(name, labels, value))
+
+    for name, metric_type, help_msg, key in TABLE_METRICS:
+        _head(lines, name, metric_type, help_msg)
+        tables = {}
+        for stat in stats:
+            if not stat.alive or stat.role != 'master':
+                continue
+            for table_id, table in _get_table_stats(stat.info).items():
+                labels = _labels(
+                    cluster=cluster_id,
+                    addr=stat.addr,
+                    table=table_id,
+                )
+                value = table.get(key, 0)
+                lines.append('{}{} {}'.format(name, labels, value))
+                tables[table_id] = tables.get(table_id, 0) + value
+        name = name.replace('ltcli_table_', 'ltcli_cluster_table_')
+        _head(lines, name, 'gauge', help_msg + ' of all masters')
+        for table_id in sorted(tables.keys()):
+            labels = _labels(cluster=cluster_id, table=table_id)
+            lines.append('{}{} {}'.format(name, labels, tables[table_id]))
+
+    # slot coverage seen by masters
+    alive = [s for s in stats if s.alive and 'cluster_slots_ok' in s.info]
+    coverage = 0.0
+    if alive:
+        slots_ok = min(s.info['cluster_slots_ok'] for s in alive)
+        coverage = float(slots_ok) / SLOT_COUNT
+    labels = _labels(cluster=cluster_id)
+    name = 'ltcli_cluster_slot_coverage_ratio'
+    _head(lines, name, 'gauge', 'Minimum cluster_slots_ok / 16384 of nodes')
+    lines.append('{}{} {}'.format(name, labels, coverage))
+    name = 'ltcli_cluster_instances_up'
+    _head(lines, name, 'gauge', 'Number of instances answered INFO')
+    up = len([s for s in stats if s.alive])
+    lines.append('{}{} {}'.format(name, labels, up))
+    name = 'ltcli_cluster_instances'
+    _head(lines, name, 'gauge', 'Number of instances in redis.properties')
+    lines.append('{}{} {}'.format(name, labels, len(stats)))
+    name = 'ltcli_scrape_duration_seconds'
+    _head(lines, name, 'gauge', 'Time spent collecting INFO of all nodes')
+    lines.append('{}{} {:.6f}'.format(name, labels, scrape_duration))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsCache(object):
+    """Collect metrics at most once per min_interval
+
+    Concurrent scrapes wait for the scrape in progress and share its result,
+    so the number of requests to redis does not depend on scrape count.
+    """
+
+    def __init__(self, collector, cluster_id, min_interval=5):
+        self.collector = collector
+        self.cluster_id = cluster_id
+        self.min_interval = min_interval
+        self.text = None
+        self.updated = 0.0
+        self._lock = Lock()
+
+    def get(self):
+        with self._lock:
+            if self.text is not None:
+                if time.time() - self.updated < self.min_interval:
+                    return self.text
+            start = time.time()
+            stats = self.collector.collect()
+            duration = time.time() - start
+            self.text = render_metrics(stats, self.cluster_id, duration)
+            self.updated = time.time()
+            return self.text
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def _make_handler(cache):
+    class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            try:
+                body = cache.get().encode('utf-8')
+            except Exception as ex:
+                logger.exception(ex)
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # pylint: disable=redefined-builtin
+            logger.debug('exporter {}: {}'.format(
+                self.address_string(),
+                format % args
+            ))
+
+    return MetricsHandler
+
+
+class Exporter(object):
+    """HTTP server exposing '/metrics' of cluster
+    """
+
+    def __init__(self, targets, cluster_id, bind='127.0.0.1', port=9121,
+                 min_interval=5):
+        collector = StatCollector(targets, cluster_info=True)
+        self.cache = MetricsCache(collector, cluster_id, min_interval)
+        handler = _make_handler(self.cache)
+        self.server = _ThreadingHTTPServer((bind, port), handler)
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.cache.collector.close()
+
+    def shutdown(self):
+        self.server.shutdown()
@@ -0,0 +1,284 @@
+import time
+
+import hiredis
+
+from ltcli import color, message, parallel, utils
+from ltcli.log import logger
+from ltcli.redistrib2.clusternode import ClusterNode
+from ltcli.redistrib2.connection import ConnectionPool
+
+
+ERR_NOT_SLAVE = 'You should send CLUSTER FAILOVER to a slave'
+
+
+class FailoverResult(object):
+    """Failover result of a slave
+    """
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.ok = False
+        self.elapsed = 0.0
+        self.attempts = 0
+        self.error = None
+
+    @property
+    def host(self):
+        return self.addr.rsplit(':', 1)[0]
+
+
+def is_master(role_reply, nodes_reply):
+    """Check role of node with 'ROLE' and 'CLUSTER NODES'
+
+    :param role_reply: reply of 'ROLE'
+    :param nodes_reply: reply of 'CLUSTER NODES'
+    :return: True if both say the node is master
+    """
+    if not role_reply or role_reply[0] != 'master':
+        return False
+    for line in nodes_reply.splitlines():
+        flags = line.split(' ')[2].split(',') if line.count(' ') > 2 else []
+        if 'myself' in flags:
+            return 'master' in flags
+    return False
+
+
+def split_addr(addr):
+    host, port = addr.rsplit(':', 1)
+    return host, int(port.split('@')[0])
+
+
+def parse_cluster_nodes(nodes_reply):
+    """
+    :param nodes_reply: reply of 'CLUSTER NODES'
+    :return: (list of ClusterNode, myself)
+    """
+    nodes = []
+    myself = None
+    for line in nodes_reply.splitlines():
+        if len(line.split(' ')) < 8:
+            continue
+        node = ClusterNode(*line.split(' '))
+        nodes.append(node)
+        if node.myself:
+            myself = node
+    return nodes, myself
+
+
+class ReadinessTracker(object):
+    """Wait until redis instances answer PING
+
+    All instances not yet ready are pinged concurrently in each round.
+    Instance loading dataset is not ready.
+    """
+
+    def __init__(self, addrs, timeout=60, interval=0.5):
+        """
+        :param addrs: list of address(host:port)
+        :param timeout: maximum time(sec) to wait
+        :param interval: interval(sec) between rounds
+        """
+        self.addrs = list(addrs)
+        self.timeout = timeout
+        self.interval = interval
+        self.pending = set(self.addrs)
+        self.pool = ConnectionPool(timeout=2, max_idle=1)
+
+    def _ping(self, addr):
+        host, port = split_addr(addr)
+        return self.pool.execute(host, port, 'ping') == 'PONG'
+
+    def wait(self):
+        """
+        :return: True if all instances are ready in timeout
+        """
+        logger.info(message.get('wait_all_redis_up'))
+        total = len(self.addrs)
+        start = time.time()
+        try:
+            while self.pending:
+                results = parallel.run(self._ping, sorted(self.pending))
+                for result in results:
+                    if result.ok and result.value:
+                        self.pending.discard(result.args[0])
+                msg = message.get('counting_alive_redis')
+                msg = msg.format(alive=total - len(self.pending), total=total)
+                logger.info(msg)
+                if not self.pending:
+                    break
+                if time.time() - start > self.timeout:
+                    return False
+                time.sleep(self.interval)
+        finally:
+            self.pool.close()
+        logger.info(message.get('complete_all_redis_up'))
+        return True
+
+
+def reattach_replicas(addrs, pairs):
+    """Make restarted master without slots replica of its partner
+
+    :param addrs: list of restarted address(ip:port)
+    :param pairs: dict {address: partner address} of designed
+        master-slave pairs. See Center._get_master_slave_pair_list
+    :return: list of (address, partner address) replicated
+    """
+    pool = ConnectionPool(timeout=5, max_idle=1)
+
+    def _reattach(addr):
+        host, port = split_addr(addr)
+        nodes, myself = parse_cluster_nodes(
+            pool.execute(host, port, 'cluster', 'nodes')
+        )
+        if myself is None or not myself.master or myself.assigned_slots:
+            return None
+        addr = '{}:{}'.format(host, port)
+        partner = pairs.get(addr)
+        for node in nodes:
+            if node.addr() != partner:
+                continue
+            if not node.master or not node.assigned_slots:
+                return None
+            pool.execute(host, port, 'cluster', 'replicate', node.node_id)
+            return addr, partner
+        return None
+
+    try:
+        results = parallel.run(_reattach, addrs)
+    finally:
+        pool.close()
+    ret = []
+    for result in results:
+        if not result.ok:
+            logger.warning('replicate {}: {}'.format(
+                result.args[0],
+                result.error
+            ))
+        elif result.value is not None:
+            ret.append(result.value)
+    return ret
+
+
+class FailoverOrchestrator(object):
+    """Send 'CLUSTER FAILOVER' to slaves concurrently
+
+    Each slave is watched until 'ROLE' and 'CLUSTER NODES' say it is master.
+    Only failed slaves are tried again.
+    """
+
+    def __init__(self, takeover=False, max_per_host=4, timeout=30,
+                 retry=3, poll_interval=0.1):
+        """
+        :param takeover: If true, use 'CLUSTER FAILOVER TAKEOVER'
+        :param max_per_host: maximum number of concurrent failover of a host
+        :param timeout: time(sec) to wait for role change of a slave
+        :param retry: number of retries of failed slaves
+        :param poll_interval: interval(sec) of role check
+        """
+        self.takeover = takeover
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retry = retry
+        self.poll_interval = poll_interval
+        self.pool = ConnectionPool(timeout=5, max_idle=1)
+
+    def _check_master(self, host, port):
+        role, nodes = self.pool.execute_bulk(
+            host,
+            port,
+            [['role'], ['cluster', 'nodes']]
+        )
+        return is_master(role, nodes)
+
+    def _failover_one(self, result):
+        host, port = split_addr(result.addr)
+        result.attempts += 1
+        start = time.time()
+        args = ['cluster', 'failover']
+        if self.takeover:
+            args.append('takeover')
+        try:
+            self.pool.execute(host, port, *args)
+        except hiredis.ReplyError as ex:
+            # already master
+            if ERR_NOT_SLAVE not in str(ex):
+                raise
+        while True:
+            if self._check_master(host, port):
+                result.elapsed = time.time() - start
+                return True
+            if time.time() - start > self.timeout:
+                msg = 'role of {} is not changed in {}s'
+                raise RuntimeError(msg.format(result.addr, self.timeout))
+            time.sleep(self.poll_interval)
+
+    def run(self, addrs):
+        """
+        :param addrs: list of slave address(host:port)
+        :return: list of FailoverResult
+        """
+        results = [FailoverResult(addr) for addr in addrs]
+        targets = results
+        for try_count in range(self.retry + 1):
+            if try_count > 0:
+                msg = 'retry failover({}): {}'.format(
+                    try_count,
+                    ', '.join(r.addr for r in targets)
+                )
+                logger.info(msg)
+            ret = parallel.run(
+                self._failover_one,
+                targets,
+                key=lambda r: r.host,
+                max_per_key=self.max_per_host
+            )
+            for r in ret:
+                result = r.args[0]
+                result.ok = r.ok
+                result.error = r.error
+                if not r.ok:
+                    result.elapsed = r.elapsed
+                logger.debug('failover {}: {} ({:.2f}s)'.format(
+                    result.addr,
+                    'OK' if r.ok else r.error,
+                    result.elapsed
+                ))
+            targets = [r for r in results if not r.ok]
+            if not targets:
+                break
+        return results
+
+    def close(self):
+        self.pool.close()
+
+
+def failover(addrs, takeover=False, max_per_host=4, timeout=30, retry=3):
+    """Failover slaves concurrently. See FailoverOrchestrator
+
+    :return: list of FailoverResult
+    """
+    orchestrator = FailoverOrchestrator(
+        takeover=takeover,
+        max_per_host=max_per_host,
+        timeout=timeout,
+        retry=retry
+    )
+    try:
+        return orchestrator.run(addrs)
+    finally:
+        orchestrator.close()
+
+
+def print_results(results):
+    meta = [['ADDR', 'RESULT', 'TIME(s)', 'ATTEMPTS']]
+    for result in sorted(results, key=lambda x: x.elapsed, reverse=True):
+        state = color.green('OK') if result.ok else color.red('FAIL')
+        meta.append([
+            result.addr,
+            state,
+            '{:.2f}'.format(result.elapsed),
+            result.attempts,
+        ])
+    utils.print_table(meta)
+    ok_cnt = len([r for r in results if r.ok])
+    logger.info('success {}/{}'.format(ok_cnt, len(results)))
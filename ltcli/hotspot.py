@@ -0,0 +1,304 @@
+from __future__ import print_function
+
+import time
+
+import six
+
+from ltcli import color, message, parallel, utils
+from ltcli.exceptions import ClusterRedisError
+from ltcli.log import logger
+from ltcli.redistrib2.command import list_masters
+from ltcli.redistrib2.connection import ConnectionPool
+from ltcli.stats import parse_info
+
+
+SLOT_COUNT = 16384
+COUNTKEYS_BATCH = 1024
+WEIGHT_SCALE = 100
+# a node gets at most 4 times of average slots
+MAX_WEIGHT = 4 * WEIGHT_SCALE
+
+
+def _skew(values):
+    """max / mean of values. 1.0 means no skew"""
+    values = list(values)
+    if not values:
+        return 1.0
+    mean = float(sum(values)) / len(values)
+    if mean == 0:
+        return 1.0
+    return max(values) / mean
+
+
+def get_command_calls(info):
+    """Sum of calls of 'INFO commandstats'"""
+    calls = 0
+    for key, value in info.items():
+        if key.startswith('cmdstat_') and isinstance(value, dict):
+            calls += value.get('calls', 0)
+    return calls
+
+
+class NodeLoad(object):
+    """Load of a master
+    """
+
+    def __init__(self, node):
+        self.node_id = node.node_id
+        self.host = node.host
+        self.port = node.port
+        self.slots = list(node.assigned_slots)
+        self.slot_keys = {}
+        self.ops = 0.0
+        self.hot_keys = []
+        self.error = None
+
+    @property
+    def addr(self):
+        return '{}:{}'.format(self.host, self.port)
+
+    @property
+    def keys(self):
+        return sum(self.slot_keys.values())
+
+
+class HotspotReport(object):
+    """Result of HotspotAnalyzer
+    """
+
+    def __init__(self, loads, interval):
+        self.loads = loads
+        self.interval = interval
+
+    @property
+    def total_keys(self):
+        return sum(load.keys for load in self.loads)
+
+    @property
+    def total_ops(self):
+        return sum(load.ops for load in self.loads)
+
+    def load_share(self, load):
+        """Share of a node in cluster load (0.0 ~ 1.0)
+
+        Command rate is used if there were commands in interval,
+        otherwise number of keys is used.
+        """
+        if self.total_ops > 0:
+            return load.ops / self.total_ops
+        if self.total_keys > 0:
+            return float(load.keys) / self.total_keys
+        return 1.0 / len(self.loads)
+
+    def hot_slots(self, n=10):
+        """
+        :param n: number of slots
+        :return: list of (slot, keys, addr) sorted by keys
+        """
+        slots = []
+        for load in self.loads:
+            for slot, keys in load.slot_keys.items():
+                slots.append((slot, keys, load.addr))
+        slots.sort(key=lambda x: x[1], reverse=True)
+        return slots[:n]
+
+    def slot_skew(self):
+        slot_keys = []
+        for load in self.loads:
+            slot_keys.extend(load.slot_keys.values())
+        return _skew(slot_keys)
+
+    def node_skew(self):
+        return _skew(self.load_share(load) for load in self.loads)
+
+    def failed(self):
+        """Addresses of nodes of which load is not measured"""
+        return [load.addr for load in self.loads if load.error is not None]
+
+    def weights(self):
+        """Weight of each master for rebalancing
+
+        A node gets slots in proportion to its weight. Weight is the number
+        of slots needed to make load of the node average, assuming load is
+        spread evenly over its slots. Weight is at most MAX_WEIGHT, which
+        an idle node with slots gets. A node without slots has no load to
+        measure, so it gets the average weight.
+
+        :return: dict {node_id: weight}
+        :raise ClusterRedisError: if load of a node is not measured. The
+            node would get MAX_WEIGHT with no load
+        """
+        failed = self.failed()
+        if failed:
+            msg = message.get('error_hotspot_not_measured')
+            raise ClusterRedisError(msg.format(addrs=', '.join(failed)))
+        count = len(self.loads)
+        ret = {}
+        for load in self.loads:
+            share = self.load_share(load)
+            if not load.slots:
+                ret[load.node_id] = WEIGHT_SCALE
+                continue
+            if share <= 0:
+                ret[load.node_id] = MAX_WEIGHT
+                continue
+            target = len(load.slots) * (1.0 / count) / share
+            weight = target / (float(SLOT_COUNT) / count)
+            weight = int(round(weight * WEIGHT_SCALE))
+            ret[load.node_id] = min(max(weight, 1), MAX_WEIGHT)
+        return ret
+
+
+class HotspotAnalyzer(object):
+    """Find skewed slots and nodes of cluster
+
+    All masters are queried concurrently. Keys of each slot are counted with
+    pipelined 'CLUSTER COUNTKEYSINSLOT' and command rate is the delta of
+    'INFO commandstats' during interval. Keys are counted and sampled
+    before interval, so that the commands are not counted as load.
+    """
+
+    def __init__(self, host, port, timeout=10):
+        """
+        :param host: host of any node in cluster
+        :param port: port of the node
+        :param timeout: socket timeout(sec)
+        """
+        self.host = host
+        self.port = port
+        self.pool = ConnectionPool(timeout=timeout, max_idle=1)
+
+    def _count_keys(self, load):
+        slots = load.slots
+        for i in range(0, len(slots), COUNTKEYS_BATCH):
+            chunk = slots[i:i + COUNTKEYS_BATCH]
+            commands = [['cluster', 'countkeysinslot', s] for s in chunk]
+            counts = self.pool.execute_bulk(load.host, load.port, commands)
+            for slot, keys in zip(chunk, counts):
+                load.slot_keys[slot] = keys
+
+    def _command_calls(self, load):
+        out = self.pool.execute(load.host, load.port, 'info', 'commandstats')
+        return get_command_calls(parse_info(out))
+
+    def _sample_hot_keys(self, load, samples):
+        """Sample keys with 'OBJECT FREQ'. Needs LFU maxmemory-policy"""
+        policy = self.pool.execute(
+            load.host,
+            load.port,
+            'config',
+            'get',
+            'maxmemory-policy'
+        )
+        if len(policy) < 2 or 'lfu' not in policy[1]:
+            msg = '{}: maxmemory-policy is not lfu. skip key sampling'
+            logger.warning(msg.format(load.addr))
+            return
+        commands = [['randomkey'] for _ in range(samples)]
+        keys = self.pool.execute_bulk(load.host, load.port, commands)
+        keys = sorted(set(k for k in keys if isinstance(k, six.string_types)))
+        if not keys:
+            return
+        commands = [['object', 'freq', k] for k in keys]
+        freqs = self.pool.execute_bulk(load.host, load.port, commands)
+        hot_keys = []
+        for key, freq in zip(keys, freqs):
+            if isinstance(freq, int):
+                hot_keys.append((key, freq))
+        hot_keys.sort(key=lambda x: x[1], reverse=True)
+        load.hot_keys = hot_keys
+
+    def analyze(self, interval=5, samples=0):
+        """
+        :param interval: time(sec) to measure command rate
+        :param samples: number of keys to sample per master with OBJECT FREQ.
+            0 means no sampling
+        :return: HotspotReport
+        """
+        masters, _ = list_masters(self.host, self.port)
+        loads = []
+        for node in masters:
+            node.close()
+            if node.fail:
+                continue
+            loads.append(NodeLoad(node))
+
+        def _analyze_one(load):
+            self._count_keys(load)
+            if samples > 0:
+                self._sample_hot_keys(load, samples)
+
+        for result in parallel.run(_analyze_one, loads):
+            if not result.ok:
+                result.args[0].error = result.error
+        results = parallel.run(self._command_calls, loads)
+        start = time.time()
+        before = [result.value for result in results]
+        remain = interval - (time.time() - start)
+        if remain > 0:
+            time.sleep(remain)
+        results = parallel.run(self._command_calls, loads)
+        elapsed = time.time() - start
+        for load, old, result in zip(loads, before, results):
+            if old is None or not result.ok:
+                load.error = load.error or result.error
+                continue
+            load.ops = max(result.value - old, 0) / elapsed
+        return HotspotReport(loads, elapsed)
+
+    def close(self):
+        self.pool.close()
+
+
+def print_report(report, n=10, threshold=1.5):
+    """
+    :param report: HotspotReport
+    :param n: number of hot slots and hot keys to print
+    :param threshold: skew(max / mean) to be marked
+    """
+    def mark(skew):
+        text = '{:.2f}'.format(skew)
+        return color.red(text) if skew >= threshold else text
+
+    weights = {} if report.failed() else report.weights()
+    meta = [['ADDR', 'NODE ID', 'SLOTS', 'KEYS', 'OPS/S', 'LOAD(%)',
+             'WEIGHT']]
+    mean = 1.0 / len(report.loads) if report.loads else 0
+    for load in sorted(report.loads, key=lambda x: x.addr):
+        if load.error is not None:
+            meta.append([load.addr, load.node_id[:8], len(load.slots),
+                         color.red('FAIL'), '-', '-', '-'])
+            continue
+        share = report.load_share(load)
+        text = '{:.1f}'.format(share * 100)
+        if mean and share / mean >= threshold:
+            text = color.red(text)
+        meta.append([
+            load.addr,
+            load.node_id[:8],
+            len(load.slots),
+            load.keys,
+            '{:.1f}'.format(load.ops),
+            text,
+            weights.get(load.node_id, '-'),
+        ])
+    utils.print_table(meta)
+    logger.info('node skew: {}, slot skew: {}'.format(
+        mark(report.node_skew()),
+        mark(report.slot_skew())
+    ))
+
+    meta = [['SLOT', 'KEYS', 'ADDR']]
+    for slot, keys, addr in report.hot_slots(n):
+        meta.append([slot, keys, addr])
+    utils.print_table(meta)
+
+    hot_keys = []
+    for load in report.loads:
+        hot_keys.extend((key, freq, load.addr) for key, freq in load.hot_keys)
+    if hot_keys:
+        hot_keys.sort(key=lambda x: x[1], reverse=True)
+        meta = [['KEY', 'FREQ', 'ADDR']]
+        for key, freq, addr in hot_keys[:n]:
+            meta.append([key, freq, addr])
+        utils.print_table(meta)
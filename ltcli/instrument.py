@@ -0,0 +1,598 @@
+"""Count and time slow calls of a command
+
+ssh connect/exec, sftp, local subprocess (redis-cli, ...), redis
+requests, dns lookup and sleep are recorded by category and host with
+bytes and a latency histogram. A summary is printed at the end of each
+command and appended to a file as a json line if set.
+
+Enabled by 'ltcli --profile' or env LTCLI_PROFILE=1. Functions are
+wrapped only when enabled, so there is no cost otherwise.
+
+With 'ltcli --trace <file>', the calls and the phases and hosts marked by
+span/traced are written as chrome trace events, which chrome://tracing
+or perfetto opens as a timeline of threads.
+"""
+import bisect
+import json
+import os
+import re
+import socket
+import threading
+import time
+from functools import wraps
+from threading import Lock
+
+import six
+
+from ltcli import message, utils
+from ltcli.log import logger
+
+
+PROFILE_ENV = 'LTCLI_PROFILE'
+PROFILE_FILE_ENV = 'LTCLI_PROFILE_FILE'
+TRACE_FILE_ENV = 'LTCLI_TRACE_FILE'
+
+# upper bound(ms) of histogram buckets
+BUCKETS = [
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+    1000, 2500, 5000, 10000, float('inf'),
+]
+TOP_HOSTS = 5
+# length of command in name and args of trace event
+TRACE_NAME_LEN = 80
+TRACE_DETAIL_LEN = 1000
+
+PAT_REDIS_CLI_HOST = re.compile(r'\s-h\s+(\S+)')
+
+
+class Metric(object):
+    """Count, errors, bytes and latency histogram"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, elapsed, nbytes=0, error=False):
+        self.count += 1
+        self.errors += 1 if error else 0
+        self.bytes += nbytes
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed * 1000)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.bytes += other.bytes
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+
+    def percentile(self, p):
+        """Upper bound(ms) of bucket which has p(0~1) of calls"""
+        rank = p * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            cumulative += count
+            if count and cumulative >= rank:
+                return min(bound, self.max * 1000)
+        return 0.0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'total': round(self.total, 6),
+            'max': round(self.max, 6),
+            'buckets': dict(
+                (str(bound), count)
+                for bound, count in zip(BUCKETS, self.buckets) if count
+            ),
+        }
+
+
+class Recorder(object):
+    """Metrics of a command by (category, host)"""
+
+    def __init__(self, command):
+        self.command = command
+        self.start = time.time()
+        self.metrics = {}
+        self._lock = Lock()
+
+    def record(self, category, host, elapsed, nbytes=0, error=False):
+        with self._lock:
+            metric = self.metrics.get((category, host))
+            if metric is None:
+                metric = Metric()
+                self.metrics[(category, host)] = metric
+            metric.add(elapsed, nbytes, error)
+
+    def by_category(self):
+        ret = {}
+        with self._lock:
+            for (category, _), metric in self.metrics.items():
+                ret.setdefault(category, Metric()).merge(metric)
+        return ret
+
+    def items(self):
+        """
+        :return: list of ((category, host), Metric)
+        """
+        with self._lock:
+            return list(self.metrics.items())
+
+    def to_dict(self):
+        hosts = {}
+        for (category, host), metric in self.items():
+            hosts.setdefault(category, {})[host] = metric.to_dict()
+        return {
+            'command': self.command,
+            'start': self.start,
+            'elapsed': round(time.time() - self.start, 6),
+            'categories': dict(
+                (k, v.to_dict()) for k, v in self.by_category().items()
+            ),
+            'hosts': hosts,
+        }
+
+
+class Tracer(object):
+    """Complete events('X') of chrome trace event format
+
+    Events of a thread nest by time, so a phase contains hosts and calls
+    run in it on the same thread. Events of all commands of a session are
+    kept and the file is rewritten at the end of each command.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.pid = os.getpid()
+        self.events = []
+        self.threads = {}
+        self._lock = Lock()
+
+    def add(self, name, cat, start, elapsed, args=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': int(start * 1e6),
+            'dur': int(elapsed * 1e6),
+            'pid': self.pid,
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self.threads.setdefault(thread.ident, thread.name)
+
+    def to_dict(self):
+        with self._lock:
+            events = list(self.events)
+            threads = list(self.threads.items())
+        meta = [{
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': self.pid,
+            'tid': tid,
+            'args': {'name': name},
+        } for tid, name in threads]
+        return {'traceEvents': meta + events, 'displayTimeUnit': 'ms'}
+
+    def save(self):
+        file_path = os.path.expanduser(self.file_path)
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump(self.to_dict(), fd)
+        os.rename(tmp_path, file_path)
+
+
+_enabled = False
+_file_path = None
+_installed = False
+_install_lock = Lock()
+_recorder = None
+_tracer = None
+
+
+def enable(file_path=None):
+    """
+    :param file_path: file to append result of each command as json
+    """
+    global _enabled, _file_path
+    _enabled = True
+    _file_path = file_path
+
+
+def is_enabled():
+    env = os.environ.get(PROFILE_ENV, '').lower() in ['1', 'true', 'yes']
+    return _enabled or env
+
+
+def _get_file_path():
+    return _file_path or os.environ.get(PROFILE_FILE_ENV)
+
+
+def enable_trace(file_path):
+    """
+    :param file_path: file to write chrome trace events
+    """
+    global _tracer
+    _tracer = Tracer(file_path)
+
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None and os.environ.get(TRACE_FILE_ENV):
+        _tracer = Tracer(os.environ[TRACE_FILE_ENV])
+    return _tracer
+
+
+def _record(category, host, start, nbytes=0, error=False, detail=None):
+    recorder = _recorder
+    if recorder is None:
+        return
+    elapsed = time.time() - start
+    recorder.record(category, host, elapsed, nbytes, error)
+    tracer = _tracer
+    if tracer is None:
+        return
+    args = {'host': host}
+    if detail:
+        args['command'] = detail[:TRACE_DETAIL_LEN]
+    if error:
+        args['error'] = True
+    name = (detail or category)[:TRACE_NAME_LEN]
+    tracer.add(name, category, start, elapsed, args)
+
+
+def _timed(func, category, host_of, size_of=None, detail_of=None):
+    """Wrap func to record its calls
+
+    :param host_of: callable of arguments of func returning host
+    :param size_of: callable of return value returning bytes
+    :param detail_of: callable of arguments of func returning command to
+        show in trace
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _recorder is None:
+            return func(*args, **kwargs)
+        host = _safe(host_of, args, kwargs)
+        detail = None
+        if detail_of and _tracer is not None:
+            detail = _safe(detail_of, args, kwargs, None)
+        start = time.time()
+        try:
+            ret = func(*args, **kwargs)
+        except BaseException:
+            _record(category, host, start, 0, True, detail)
+            raise
+        nbytes = _safe(size_of, (ret,), {}, 0) if size_of else 0
+        _record(category, host, start, nbytes, False, detail)
+        return ret
+    return wrapper
+
+
+class _Span(object):
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, except_type, except_obj, tb):
+        tracer = _tracer
+        if tracer is not None and _recorder is not None:
+            args = dict(self.args)
+            if except_type is not None:
+                args['error'] = except_type.__name__
+            elapsed = time.time() - self.start
+            tracer.add(self.name, self.cat, self.start, elapsed, args)
+        return False
+
+
+def span(name, cat='phase', **args):
+    """Trace a block as a span. No-op unless tracing
+
+    ex)
+        with instrument.span(host, 'host'):
+            ...
+    """
+    return _Span(str(name), cat, args)
+
+
+def traced(func):
+    """Trace calls of func as a phase named after it"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _tracer is None or _recorder is None:
+            return func(*args, **kwargs)
+        with span(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _safe(func, args, kwargs, default='-'):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        return default
+
+
+def _client_host(*args, **kwargs):
+    client = kwargs.get('client', args[0] if args else None)
+    return client.hostname
+
+
+def _ssh_output_size(ret):
+    _, stdout, stderr = ret
+    return len(stdout) + len(stderr)
+
+
+def _ssh_command(*args, **kwargs):
+    return kwargs.get('command', args[1] if len(args) > 1 else None)
+
+
+class _SFTP(object):
+    """SFTPClient recording transfers"""
+
+    def __init__(self, sftp, host):
+        self._sftp = sftp
+        self._host = host
+
+    def _transfer(self, func, size_of, remotepath, *args, **kwargs):
+        detail = '{} {}'.format(func.__name__, remotepath)
+        start = time.time()
+        try:
+            ret = func(*args, **kwargs)
+        except BaseException:
+            _record('sftp', self._host, start, 0, True, detail)
+            raise
+        nbytes = _safe(size_of, (ret,), {}, 0)
+        _record('sftp', self._host, start, nbytes, False, detail)
+        return ret
+
+    def put(self, localpath, remotepath, *args, **kwargs):
+        return self._transfer(
+            self._sftp.put,
+            lambda ret: ret.st_size,
+            remotepath,
+            localpath,
+            remotepath,
+            *args,
+            **kwargs
+        )
+
+    def putfo(self, fl, remotepath, *args, **kwargs):
+        return self._transfer(
+            self._sftp.putfo,
+            lambda ret: ret.st_size,
+            remotepath,
+            fl,
+            remotepath,
+            *args,
+            **kwargs
+        )
+
+    def get(self, remotepath, localpath, *args, **kwargs):
+        return self._transfer(
+            self._sftp.get,
+            lambda _: os.path.getsize(localpath),
+            remotepath,
+            remotepath,
+            localpath,
+            *args,
+            **kwargs
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._sftp, name)
+
+
+class _Subprocess(object):
+    """subprocess module recording check_output and call"""
+
+    def __init__(self, module):
+        self._module = module
+        self.check_output = _timed(
+            module.check_output,
+            'subprocess',
+            self._host,
+            len,
+            self._command
+        )
+        self.call = _timed(
+            module.call,
+            'subprocess',
+            self._host,
+            detail_of=self._command
+        )
+
+    @staticmethod
+    def _command(*args, **kwargs):
+        command = kwargs.get('args', args[0] if args else '')
+        if not isinstance(command, six.string_types):
+            command = ' '.join(command)
+        return command
+
+    @staticmethod
+    def _host(*args, **kwargs):
+        command = _Subprocess._command(*args, **kwargs)
+        match = PAT_REDIS_CLI_HOST.search(command)
+        return match.group(1) if match else 'localhost'
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+def _wrap_send_raw(send_raw):
+    @wraps(send_raw)
+    def wrapper(conn, command, recv=None):
+        if _recorder is None:
+            return send_raw(conn, command, recv)
+        start = time.time()
+        received = conn.received_bytes
+        sent = sum(len(c) for c in command)
+        host = '{}:{}'.format(conn.host, conn.port)
+        try:
+            ret = send_raw(conn, command, recv)
+        except BaseException:
+            _record('redis', host, start, sent, True)
+            raise
+        received = conn.received_bytes - received
+        _record('redis', host, start, sent + received)
+        return ret
+    return wrapper
+
+
+def install():
+    """Wrap functions to record. Called once"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _installed = True
+    from ltcli import center, cluster, net, rediscli_util
+    from ltcli.redistrib2 import command
+    from ltcli.redistrib2.connection import Connection
+
+    net.get_ssh = _timed(
+        net.get_ssh,
+        'ssh_connect',
+        lambda *args, **kwargs: kwargs.get('host', args[0])
+    )
+    net.ssh_execute = _timed(
+        net.ssh_execute,
+        'ssh_exec',
+        _client_host,
+        _ssh_output_size,
+        _ssh_command
+    )
+    net.ssh_stream = _timed(
+        net.ssh_stream,
+        'ssh_exec',
+        _client_host,
+        detail_of=_ssh_command
+    )
+    get_sftp = net.get_sftp
+
+    @wraps(get_sftp)
+    def _get_sftp(client):
+        sftp = get_sftp(client)
+        if sftp is None:
+            return sftp
+        return _SFTP(sftp, getattr(client, 'hostname', '-'))
+    net.get_sftp = _get_sftp
+
+    for module in [center, cluster, rediscli_util]:
+        module.subprocess = _Subprocess(module.subprocess)
+
+    Connection.send_raw = _wrap_send_raw(Connection.send_raw)
+
+    socket.gethostbyname = _timed(
+        socket.gethostbyname,
+        'dns',
+        lambda *args, **kwargs: args[0]
+    )
+    sleep = _timed(time.sleep, 'sleep', lambda *args, **kwargs: '-')
+    time.sleep = sleep
+    command.sleep = sleep
+    logger.debug('instrument installed')
+
+
+def begin(command):
+    """Start recording of a command if profiling or tracing"""
+    global _recorder
+    if not is_enabled() and _get_tracer() is None:
+        return
+    install()
+    _recorder = Recorder(command)
+
+
+def end():
+    """Stop recording, print summary and save it"""
+    global _recorder
+    recorder = _recorder
+    _recorder = None
+    if recorder is None:
+        return
+    tracer = _tracer
+    if tracer is not None:
+        elapsed = time.time() - recorder.start
+        tracer.add(recorder.command, 'command', recorder.start, elapsed)
+        tracer.save()
+    if not is_enabled():
+        return
+    print_summary(recorder)
+    file_path = _get_file_path()
+    if file_path:
+        save(recorder, file_path)
+
+
+def save(recorder, file_path):
+    with open(os.path.expanduser(file_path), 'a') as fd:
+        fd.write(json.dumps(recorder.to_dict(), sort_keys=True) + '\n')
+
+
+def _ms(sec):
+    return '{:.1f}'.format(sec * 1000)
+
+
+def print_summary(recorder):
+    elapsed = time.time() - recorder.start
+    msg = message.get('profile_summary')
+    logger.info(msg.format(command=recorder.command, elapsed=elapsed))
+    meta = [[
+        'CATEGORY', 'COUNT', 'ERRORS', 'TOTAL(s)', 'AVG(ms)', 'P50(ms)',
+        'P95(ms)', 'P99(ms)', 'MAX(ms)', 'BYTES'
+    ]]
+    categories = recorder.by_category()
+    for category in sorted(categories.keys()):
+        metric = categories[category]
+        meta.append([
+            category,
+            metric.count,
+            metric.errors,
+            '{:.2f}'.format(metric.total),
+            _ms(metric.total / metric.count),
+            '{:.1f}'.format(metric.percentile(0.5)),
+            '{:.1f}'.format(metric.percentile(0.95)),
+            '{:.1f}'.format(metric.percentile(0.99)),
+            _ms(metric.max),
+            utils.int_2_bytes(metric.bytes) if metric.bytes else '-',
+        ])
+    if len(meta) == 1:
+        return
+    utils.print_table(meta)
+    # slowest hosts of each category
+    meta = [['CATEGORY', 'HOST', 'COUNT', 'TOTAL(s)', 'MAX(ms)']]
+    items = recorder.items()
+    items.sort(key=lambda item: (item[0][0], -item[1].total))
+    shown = {}
+    for (category, host), metric in items:
+        if host == '-' or shown.get(category, 0) >= TOP_HOSTS:
+            continue
+        shown[category] = shown.get(category, 0) + 1
+        meta.append([
+            category,
+            host,
+            metric.count,
+            '{:.2f}'.format(metric.total),
+            _ms(metric.max),
+        ])
+    if len(meta) > 1:
+        utils.print_table(meta)
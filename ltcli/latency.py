@@ -0,0 +1,266 @@
+from __future__ import print_function
+
+import time
+
+from ltcli import color, parallel, utils
+from ltcli.log import logger
+from ltcli.redistrib2.connection import ConnectionPool
+
+
+# commands whose second argument is a sub command, not a key
+SUB_COMMANDS = [
+    'CLIENT', 'CLUSTER', 'COMMAND', 'CONFIG', 'DEBUG', 'LATENCY', 'MEMORY',
+    'MODULE', 'OBJECT', 'SCRIPT', 'SLOWLOG', 'XGROUP', 'XINFO',
+]
+
+# upper bounds(ms) of histogram buckets
+HIST_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+def signature(args):
+    """Signature of command, independent of keys and values
+
+    ex) ['set', 'k1', 'v'] -> 'SET', ['config', 'get', 'x'] -> 'CONFIG GET'
+
+    :param args: list of arguments in slowlog entry
+    :return: string
+    """
+    if not args:
+        return '-'
+    name = args[0].upper()
+    if name in SUB_COMMANDS and len(args) > 1:
+        return '{} {}'.format(name, args[1].upper())
+    return name
+
+
+class SlowlogEntry(object):
+    """An entry of 'SLOWLOG GET'
+    """
+
+    def __init__(self, addr, reply):
+        self.addr = addr
+        self.id = reply[0]
+        self.timestamp = reply[1]
+        self.duration = reply[2]  # microseconds
+        self.args = [str(arg) for arg in reply[3]]
+        self.client = reply[4] if len(reply) > 4 else ''
+        self.signature = signature(self.args)
+
+    @property
+    def key(self):
+        return (self.addr, self.id)
+
+
+def _bucket(duration):
+    """Index of histogram bucket of duration(us)"""
+    ms = duration / 1000.0
+    for i, bound in enumerate(HIST_BUCKETS):
+        if ms < bound:
+            return i
+    return len(HIST_BUCKETS)
+
+
+def _bucket_names():
+    names = ['<{}ms'.format(bound) for bound in HIST_BUCKETS]
+    names.append('>={}ms'.format(HIST_BUCKETS[-1]))
+    return names
+
+
+class SlowlogAggregator(object):
+    """Merge slowlog entries of nodes
+
+    Entries are deduplicated by (addr, id), so the same entry fetched
+    repeatedly is counted once.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.by_signature = {}
+        self.hist = {}
+
+    def add(self, entry):
+        if entry.key in self.seen:
+            return False
+        self.seen.add(entry.key)
+        s = self.by_signature.setdefault(entry.signature, {
+            'signature': entry.signature,
+            'count': 0,
+            'total': 0,
+            'max': 0,
+            'nodes': {},
+            'sample': entry.args,
+        })
+        s['count'] += 1
+        s['total'] += entry.duration
+        if entry.duration > s['max']:
+            s['max'] = entry.duration
+            s['sample'] = entry.args
+        s['nodes'][entry.addr] = s['nodes'].get(entry.addr, 0) + 1
+        hist = self.hist.setdefault(entry.addr, [0] * (len(HIST_BUCKETS) + 1))
+        hist[_bucket(entry.duration)] += 1
+        return True
+
+    def top(self, n=10):
+        """Signatures sorted by total duration
+
+        :param n: number of signatures
+        :return: list of dict
+        """
+        values = list(self.by_signature.values())
+        values.sort(key=lambda x: x['total'], reverse=True)
+        return values[:n]
+
+
+class ClusterLatency(object):
+    """Fetch SLOWLOG / LATENCY of all nodes concurrently
+    """
+
+    def __init__(self, targets, timeout=3):
+        """
+        :param targets: list of (type, host, ip, port). See stats.get_targets
+        :param timeout: socket timeout(sec)
+        """
+        self.targets = targets
+        self.pool = ConnectionPool(timeout=timeout, max_idle=1)
+
+    def _execute_all(self, *args):
+        def _execute(m_s, host, ip, port):
+            return self.pool.execute(ip, port, *args)
+
+        results = parallel.run(_execute, self.targets)
+        ret = []
+        for result in results:
+            _, _, ip, port = result.args
+            addr = '{}:{}'.format(ip, port)
+            if not result.ok:
+                msg = '{} {}: {}'.format(' '.join(args), addr, result.error)
+                logger.warning(msg)
+            ret.append((addr, result.value, result.error))
+        return ret
+
+    def slowlog(self, count=128):
+        """
+        :param count: number of entries to get from each node
+        :return: list of SlowlogEntry
+        """
+        entries = []
+        for addr, reply, error in self._execute_all('slowlog', 'get', count):
+            if error is not None:
+                continue
+            entries.extend(SlowlogEntry(addr, r) for r in reply)
+        return entries
+
+    def slowlog_reset(self):
+        """
+        :return: (number of success, number of nodes)
+        """
+        ret = self._execute_all('slowlog', 'reset')
+        ok = len([r for r in ret if r[2] is None])
+        return ok, len(ret)
+
+    def latency_latest(self):
+        """
+        :return: list of (addr, event, timestamp, latest(ms), max(ms))
+        """
+        rows = []
+        for addr, reply, error in self._execute_all('latency', 'latest'):
+            if error is not None:
+                continue
+            for event, timestamp, latest, max_latency in reply:
+                rows.append((addr, event, timestamp, latest, max_latency))
+        return rows
+
+    def latency_history(self, event):
+        """
+        :param event: latency event name
+        :return: list of (addr, timestamp, latency(ms))
+        """
+        rows = []
+        ret = self._execute_all('latency', 'history', event)
+        for addr, reply, error in ret:
+            if error is not None:
+                continue
+            for timestamp, latency in reply:
+                rows.append((addr, timestamp, latency))
+        return rows
+
+    def close(self):
+        self.pool.close()
+
+
+def _format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def _truncate(args, width=60):
+    line = ' '.join(args)
+    if len(line) > width:
+        line = line[:width - 3] + '...'
+    return line
+
+
+def print_slowlog_top(aggregator, n=10):
+    meta = [['SIGNATURE', 'COUNT', 'TOTAL(ms)', 'AVG(ms)', 'MAX(ms)', 'NODES',
+             'SLOWEST']]
+    for s in aggregator.top(n):
+        meta.append([
+            s['signature'],
+            s['count'],
+            '{:.2f}'.format(s['total'] / 1000.0),
+            '{:.2f}'.format(s['total'] / 1000.0 / s['count']),
+            '{:.2f}'.format(s['max'] / 1000.0),
+            len(s['nodes']),
+            _truncate(s['sample']),
+        ])
+    utils.print_table(meta)
+
+
+def print_slowlog_hist(aggregator):
+    meta = [['ADDR'] + _bucket_names()]
+    for addr in sorted(aggregator.hist.keys()):
+        row = [addr]
+        for i, count in enumerate(aggregator.hist[addr]):
+            if count and i >= len(HIST_BUCKETS) - 3:
+                count = color.red(str(count))
+            row.append(count)
+        meta.append(row)
+    utils.print_table(meta)
+
+
+def print_slowlog_entry(entry):
+    print('{} {} {:>10.2f}ms {}'.format(
+        _format_time(entry.timestamp),
+        entry.addr,
+        entry.duration / 1000.0,
+        _truncate(entry.args, 120)
+    ))
+
+
+def tail_slowlog(cluster_latency, interval=1, count=128):
+    """Print new slowlog entries of all nodes continuously
+
+    The last seen id is kept per node. When id of node goes backward
+    (restart or 'SLOWLOG RESET'), all fetched entries are new.
+
+    :param cluster_latency: ClusterLatency
+    :param interval: polling interval(sec)
+    :param count: number of entries to get from each node per poll
+    """
+    last_id = {}
+    for entry in cluster_latency.slowlog(count):
+        last_id[entry.addr] = max(last_id.get(entry.addr, -1), entry.id)
+    while True:
+        time.sleep(interval)
+        entries = cluster_latency.slowlog(count)
+        max_id = {}
+        for entry in entries:
+            max_id[entry.addr] = max(max_id.get(entry.addr, -1), entry.id)
+        for addr, cur in max_id.items():
+            if cur < last_id.get(addr, -1):
+                last_id[addr] = -1
+        new = [e for e in entries if e.id > last_id.get(e.addr, -1)]
+        new.sort(key=lambda x: (x.timestamp, x.addr, x.id))
+        for entry in new:
+            print_slowlog_entry(entry)
+        for addr, cur in max_id.items():
+            last_id[addr] = max(last_id.get(addr, -1), cur)
@@ -1,8 +1,10 @@
+import atexit
 import os
 import sys
 
 from logbook import Logger, Processor, StreamHandler, RotatingFileHandler
 from logbook import DEBUG, INFO, WARNING, ERROR
+from logbook.queues import ThreadedWrapperHandler
 
 from ltcli import color, message
 
@@ -61,6 +63,44 @@ formatter = {
 }
 
 
+# max length of payload like output of command in a log
+PAYLOAD_LIMIT = 16 * 1024
+
+class QueueHandler(ThreadedWrapperHandler):
+    """Write records with handler on a background thread
+
+    Caller only pulls frame information of a record and puts it in queue.
+    Message is formatted and written by the writer thread, so log I/O
+    never blocks caller. Arguments of a log are formatted later, so do
+    not pass objects changed after logging.
+    """
+
+    def emit(self, record):
+        record.pull_information()
+        ThreadedWrapperHandler.emit(self, record)
+
+
+class SafeRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler which reports error of a record and goes on
+
+    Writer thread of QueueHandler calls emit directly, not handle, so an
+    error of a record would stop the thread.
+    """
+
+    def emit(self, record):
+        try:
+            RotatingFileHandler.emit(self, record)
+        except Exception:
+            self.handle_error(record, sys.exc_info())
+
+
+def cap(text, limit=PAYLOAD_LIMIT):
+    """Cut long text like output of command to log"""
+    if len(text) <= limit:
+        return text
+    return '{}... ({} more characters)'.format(text[:limit], len(text) - limit)
+
+
 def inject_extra(record):
     record.extra['basename'] = os.path.basename(record.filename)
     record.extra['level_color'] = get_log_color(record.level)
@@ -90,7 +130,7 @@ if os.path.isdir(file_path):
     file_level = DEBUG
     each_size = max_size / (backup_count + 1)
     filename = os.path.join(file_path, 'ltcli-rotate.log')
-    rotating_file_handler = RotatingFileHandler(
+    rotating_file_handler = SafeRotatingFileHandler(
         filename=filename,
         level=file_level,
         bubble=True,
@@ -98,8 +138,11 @@ if os.path.isdir(file_path):
         backup_count=backup_count
     )
     rotating_file_handler.format_string = formatter['file']
-    rotating_file_handler.push_application()
-    logger.debug('start logging on file: {}'.format(filename))
+    file_handler = QueueHandler(rotating_file_handler)
+    file_handler.push_application()
+    # write queued records before exit
+    atexit.register(file_handler.close)
+    logger.debug('start logging on file: {}', filename)
 else:
     try:
         os.mkdir(file_path)
@@ -0,0 +1,193 @@
+import time
+from threading import Event, Thread
+
+from prompt_toolkit.application import Application
+from prompt_toolkit.formatted_text import ANSI
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import Layout
+from prompt_toolkit.layout.containers import Window
+from prompt_toolkit.layout.controls import FormattedTextControl
+from terminaltables import AsciiTable
+
+from ltcli import color, message
+from ltcli.stats import StatCollector
+
+
+def _human_number(v):
+    for unit in ['', 'K', 'M', 'G']:
+        if abs(v) < 1000:
+            return '{:.1f}{}'.format(v, unit) if unit else '{:.0f}'.format(v)
+        v /= 1000.0
+    return '{:.1f}T'.format(v)
+
+
+def _human_bytes(v):
+    v = float(v)
+    for unit in ['B', 'K', 'M', 'G']:
+        if abs(v) < 1024:
+            return '{:.1f}{}'.format(v, unit)
+        v /= 1024.0
+    return '{:.1f}T'.format(v)
+
+
+def summarize_by_host(stats):
+    """Aggregate NodeStat list by host
+
+    :param stats: list of NodeStat
+    :return: list of dict sorted by host
+    """
+    hosts = {}
+    for stat in stats:
+        h = hosts.setdefault(stat.host, {
+            'host': stat.host,
+            'master': 0,
+            'slave': 0,
+            'down': 0,
+            'ops': 0.0,
+            'rows': 0.0,
+            'evictions': 0.0,
+            'memory': 0,
+            'max_lag': 0,
+        })
+        if not stat.alive:
+            h['down'] += 1
+            continue
+        if stat.role == 'master':
+            h['master'] += 1
+        else:
+            h['slave'] += 1
+        h['ops'] += stat.ops
+        h['rows'] += stat.rows
+        h['evictions'] += stat.evictions
+        h['memory'] += stat.used_memory
+        h['max_lag'] = max(h['max_lag'], stat.repl_lag)
+    return [hosts[host] for host in sorted(hosts.keys())]
+
+
+def render(stats, top=10, interval=2):
+    """Make dashboard text from NodeStat list
+
+    :param stats: list of NodeStat
+    :param top: number of nodes in top-N table
+    :param interval: polling interval(sec)
+    :return: text (with ANSI color)
+    """
+    alive = [stat for stat in stats if stat.alive]
+    total_ops = sum(stat.ops for stat in alive)
+    total_rows = sum(stat.rows for stat in alive)
+    total_evictions = sum(stat.evictions for stat in alive)
+    total_memory = sum(stat.used_memory for stat in alive)
+    max_lag = max([stat.repl_lag for stat in alive] or [0])
+    lines = [
+        '{}  interval: {}s  (press q to quit)'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S'),
+            interval
+        ),
+        'alive {}/{}  ops/s {}  rows/s {}  evictions/s {}  memory {}  '
+        'max repl lag {}'.format(
+            len(alive),
+            len(stats),
+            _human_number(total_ops),
+            _human_number(total_rows),
+            _human_number(total_evictions),
+            _human_bytes(total_memory),
+            _human_bytes(max_lag),
+        ),
+        '',
+    ]
+
+    meta = [[
+        'HOST', 'MASTER', 'SLAVE', 'DOWN', 'OPS/S', 'ROWS/S', 'EVICT/S',
+        'MEMORY', 'MAX LAG'
+    ]]
+    for h in summarize_by_host(stats):
+        down = str(h['down'])
+        if h['down'] > 0:
+            down = color.red(down)
+        meta.append([
+            h['host'],
+            h['master'],
+            h['slave'],
+            down,
+            _human_number(h['ops']),
+            _human_number(h['rows']),
+            _human_number(h['evictions']),
+            _human_bytes(h['memory']),
+            _human_bytes(h['max_lag']),
+        ])
+    lines.append(AsciiTable(meta, ' HOSTS ').table)
+    lines.append('')
+
+    meta = [[
+        'ADDR', 'ROLE', 'OPS/S', 'ROWS/S', 'EVICT/S', 'MEMORY', 'KEYS',
+        'TOTAL ROWS', 'REPL LAG'
+    ]]
+    for stat in sorted(alive, key=lambda x: x.ops, reverse=True)[:top]:
+        meta.append([
+            stat.addr,
+            stat.role,
+            _human_number(stat.ops),
+            _human_number(stat.rows),
+            _human_number(stat.evictions),
+            _human_bytes(stat.used_memory),
+            _human_number(stat.keys),
+            _human_number(stat.total_rows),
+            _human_bytes(stat.repl_lag),
+        ])
+    title = ' TOP {} NODES BY OPS/S '.format(top)
+    lines.append(AsciiTable(meta, title).table)
+
+    down = [stat for stat in stats if not stat.alive]
+    if down:
+        lines.append('')
+        addrs = ', '.join(stat.addr for stat in down)
+        lines.append(color.red('disconnected: {}'.format(addrs)))
+    return '\n'.join(lines)
+
+
+class Dashboard(object):
+    """Refreshing terminal dashboard of cluster metrics
+    """
+
+    def __init__(self, targets, interval=2, top=10):
+        self.interval = interval
+        self.top = top
+        self.collector = StatCollector(targets)
+        self.text = message.get('try_connection')
+        self._stop = Event()
+        self._app = None
+
+    def _get_text(self):
+        return ANSI(self.text)
+
+    def _poll(self):
+        while not self._stop.is_set():
+            stats = self.collector.collect()
+            self.text = render(stats, self.top, self.interval)
+            if self._app is not None:
+                self._app.invalidate()
+            self._stop.wait(self.interval)
+
+    def run(self):
+        kb = KeyBindings()
+
+        @kb.add('q')
+        @kb.add('c-c')
+        def _exit(event):
+            event.app.exit()
+
+        control = FormattedTextControl(self._get_text)
+        self._app = Application(
+            layout=Layout(Window(content=control)),
+            key_bindings=kb,
+            full_screen=True
+        )
+        poller = Thread(target=self._poll)
+        poller.daemon = True
+        poller.start()
+        try:
+            self._app.run()
+        finally:
+            self._stop.set()
+            poller.join(self.interval + 5)
+            self.collector.close()
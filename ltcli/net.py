@@ -1,9 +1,12 @@
 from __future__ import print_function
 
+import codecs
 import errno
+import select
 import socket
 import time
-from threading import Thread
+from collections import deque
+from threading import Lock, Thread
 import os
 import sys
 import shutil
@@ -11,16 +14,31 @@ import shutil
 import paramiko
 import requests
 
-from ltcli import parser, message
+from ltcli import log, parser, message
+from ltcli.agent_server import (
+    parse_netstat_listen,
+    parse_socket_owners,
+    parse_tcp_table,
+)
 from ltcli.log import logger
 from ltcli.exceptions import (
     SSHConnectionError,
     HostConnectionError,
     HostNameError,
     SSHCommandError,
+    SSHCommandTimeoutError,
 )
 
 
+# bytes read from a stream of channel at once
+STREAM_CHUNK = 32 * 1024
+# max wait(sec) of select on channel
+STREAM_POLL = 0.1
+STREAM_MAX_LINE = 64 * 1024
+# last lines of stderr kept for SSHCommandError of ssh_stream
+STREAM_ERROR_LINES = 100
+
+
 def get_ssh(host, port=22):
     """Create SSHClient, connect TCP, and return it
 
@@ -44,6 +62,57 @@ def get_ssh(host, port=22):
         raise HostNameError(host)
 
 
+class SSHPool(object):
+    """Share a SSHClient per host between threads
+
+    Commands on the same host run on channels of one transport, so
+    concurrent jobs do not open a new connection for each command.
+    """
+
+    def __init__(self, port=22):
+        self.port = port
+        self._clients = {}
+        self._host_locks = {}
+        self._lock = Lock()
+
+    def _get_host_lock(self, host):
+        with self._lock:
+            if host not in self._host_locks:
+                self._host_locks[host] = Lock()
+            return self._host_locks[host]
+
+    def get(self, host):
+        """Get connected SSHClient of host. Do not close it
+
+        :param host: host
+        :return: SSHClient
+        """
+        with self._get_host_lock(host):
+            client = self._clients.get(host)
+            if client is not None:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    return client
+                client.close()
+            client = get_ssh(host, self.port)
+            self._clients[host] = client
+            return client
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients = {}
+        for client in clients:
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, except_type, except_obj, tb):
+        self.close()
+        return False
+
+
 def get_sftp(client):
     """Open sftp
 
@@ -57,43 +126,24 @@ def get_sftp(client):
         logger.debug(e)
 
 
-def __ssh_execute_async_thread(channel, command):
-    channel.exec_command(command)
-    while True:
-        if channel.exit_status_ready():
-            break
-        try:
-            msg = channel.recv(4096)
-            print(msg.decode('utf-8'))
-        except socket.error as e:
-            err = e.args[0]
-            if err == errno.EAGAIN or err == errno.EWOULDBLOCK:
-                time.sleep(1)
-                continue
-            else:
-                print(e)
-                break
-
-
 def ssh_execute_async(client, command):
-    """Execute ssh asynchronous
+    """Execute ssh and print output until it ends or Ctrl-C
 
     This for for not terminating process (like tail -f)
 
     :param client: SSHClient
     :param command: command
     """
-    channel = client.get_transport().open_session()
-    t = Thread(
-        target=__ssh_execute_async_thread,
-        args=(channel, command,))
-    t.daemon = True
-    t.start()
     try:
-        while True:
-            time.sleep(1)
+        ssh_stream(
+            client,
+            command,
+            on_stdout=print,
+            on_stderr=print,
+            allow_status=None
+        )
     except KeyboardInterrupt:
-        channel.close()
+        pass
 
 
 def ssh_bulk_execute(hosts, command, allow_status=[0]):
@@ -134,31 +184,33 @@ def ssh_execute(client, command, allow_status=[0]):
     :param allow_status: list of allow status.
     """
     try:
-        logger.debug('[ssh_execute] %s' % command)
+        logger.debug('[ssh_execute] {}', command)
         stdin, stdout, stderr = client.exec_command(command)
     except Exception as e:
         print(e)
         raise e
-    stdout_msg = ''
-    stderr_msg = ''
-
-    stdout_msg = stdout.read()
-    stdout_msg = stdout_msg.decode('utf-8')
-    if stdout_msg and stdout_msg is not "":
-        logger.debug('---------------- command to : %s' % client.hostname)
+    stdout_msg = []
+    stderr_msg = []
+    exit_status = _read_channel(
+        stdout.channel,
+        stdout_msg.append,
+        stderr_msg.append
+    )
+
+    stdout_msg = ''.join(stdout_msg)
+    if stdout_msg:
+        logger.debug('---------------- command to : {}', client.hostname)
         logger.debug(command)
         logger.debug('---------------- stdout')
-        logger.debug(stdout_msg)
+        logger.debug(log.cap(stdout_msg))
 
-    stderr_msg = stderr.read()
-    stderr_msg = stderr_msg.decode('utf-8')
-    if stderr_msg and stderr_msg is not "":
-        logger.debug('---------------- command to : %s' % client.hostname)
+    stderr_msg = ''.join(stderr_msg)
+    if stderr_msg:
+        logger.debug('---------------- command to : {}', client.hostname)
         logger.debug(command)
         logger.debug('---------------- stderr')
-        logger.debug(stderr_msg)
+        logger.debug(log.cap(stderr_msg))
 
-    exit_status = stdout.channel.recv_exit_status()
     if exit_status not in allow_status:
         host = client.hostname
         stderr_msg = stderr_msg.encode('utf-8')
@@ -166,6 +218,116 @@ def ssh_execute(client, command, allow_status=[0]):
     return exit_status, stdout_msg, stderr_msg
 
 
+def _read_channel(channel, on_stdout, on_stderr, timeout=None):
+    """Read stdout and stderr of channel as they arrive until command ends
+
+    Both are read in turn, so neither fills window of channel and blocks
+    command while the other is read. Decoded text is passed to callbacks
+    in chunks.
+
+    :param timeout: time(sec) to wait for command
+    :return: exit status, or None if timed out
+    """
+    streams = []
+    for ready, recv, callback in [
+        (channel.recv_ready, channel.recv, on_stdout),
+        (channel.recv_stderr_ready, channel.recv_stderr, on_stderr),
+    ]:
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        streams.append((ready, recv, callback, decoder))
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        # output sent before exit status is buffered when it is ready
+        ended = channel.exit_status_ready()
+        received = False
+        for ready, recv, callback, decoder in streams:
+            if not ready():
+                continue
+            data = recv(STREAM_CHUNK)
+            if data:
+                received = True
+                callback(decoder.decode(data))
+        # checked on every pass, so endless output does not keep it running
+        if not ended and deadline is not None and time.time() > deadline:
+            return None
+        if received:
+            continue
+        if ended:
+            break
+        select.select([channel], [], [], STREAM_POLL)
+    for _, _, callback, decoder in streams:
+        text = decoder.decode(b'', True)
+        if text:
+            callback(text)
+    return channel.recv_exit_status()
+
+
+class _LineBuffer(object):
+    """Pass text to callback line by line"""
+
+    def __init__(self, callback, max_line=STREAM_MAX_LINE):
+        self.callback = callback
+        self.max_line = max_line
+        self.rest = ''
+
+    def feed(self, text):
+        lines = (self.rest + text).split('\n')
+        self.rest = lines.pop()
+        for line in lines:
+            self.callback(line.rstrip('\r'))
+        while len(self.rest) > self.max_line:
+            self.callback(self.rest[:self.max_line])
+            self.rest = self.rest[self.max_line:]
+
+    def flush(self):
+        if self.rest:
+            self.callback(self.rest)
+            self.rest = ''
+
+
+def ssh_stream(client, command, on_stdout=None, on_stderr=None,
+               allow_status=[0], timeout=None):
+    """Execute ssh and pass each line of stdout and stderr to callbacks
+    while command runs
+
+    Only a line being received and last lines of stderr (for error) are
+    kept, so output of any size can be streamed. A line longer than
+    STREAM_MAX_LINE is passed in pieces.
+
+    :param client: SSHClient
+    :param command: command
+    :param on_stdout: callable called with each line of stdout
+    :param on_stderr: callable called with each line of stderr
+    :param allow_status: list of allow status. None to allow any
+    :param timeout: time(sec) to wait for command. The channel is closed
+        and SSHCommandTimeoutError raised after it
+    :return: exit status
+    """
+    logger.debug('[ssh_stream] {}', command)
+    stdin, stdout, stderr = client.exec_command(command)
+    channel = stdout.channel
+    errors = deque(maxlen=STREAM_ERROR_LINES)
+
+    def _on_stderr(line):
+        errors.append(line)
+        if on_stderr is not None:
+            on_stderr(line)
+
+    out = _LineBuffer(on_stdout or (lambda line: None))
+    err = _LineBuffer(_on_stderr)
+    try:
+        exit_status = _read_channel(channel, out.feed, err.feed, timeout)
+    finally:
+        channel.close()
+    if exit_status is None:
+        raise SSHCommandTimeoutError(client.hostname, command, timeout)
+    out.flush()
+    err.flush()
+    if allow_status is not None and exit_status not in allow_status:
+        raise SSHCommandError(exit_status, client.hostname, '\n'.join(errors))
+    return exit_status
+
+
 def is_dir(client, file_path):
     """Determine if directory or not
 
@@ -278,6 +440,50 @@ def ping(host, duration=3):
         raise HostConnectionError(host)
 
 
+def get_listen_ports(client):
+    """Get listening tcp ports of host with owner
+
+    /proc/net/tcp{,6}, socket fds of processes and users are read with an
+    ssh exec. Owner pid of other user's process is not visible unless
+    the ssh user is root. 'netstat -an' is used on a host without
+    /proc/net/tcp (ex. macOS), and owner is not known.
+
+    :param client: SSHClient
+    :return: dict {port: (pid or None, user)}
+    """
+    sep = '--ltcli-port-inventory--'
+    netstat = '--ltcli-netstat--'
+    command = '; '.join([
+        'if [ -r /proc/net/tcp ]',
+        'then cat /proc/net/tcp /proc/net/tcp6 2>/dev/null',
+        'else echo {}'.format(netstat),
+        # host supporting neither is reported as error
+        'netstat -an || exit $?',
+        'fi',
+        'echo {}'.format(sep),
+        "find /proc/[0-9]*/fd -lname 'socket:*' -printf '%h %l\\n' "
+        "2>/dev/null",
+        'echo {}'.format(sep),
+        'getent passwd 2>/dev/null || cat /etc/passwd',
+        'true',
+    ])
+    _, stdout, _ = ssh_execute(client, command)
+    tcp, fds, passwd = stdout.split(sep + '\n', 2)
+    if tcp.startswith(netstat):
+        return dict((port, (None, '-')) for port in parse_netstat_listen(tcp))
+    listen = parse_tcp_table(tcp)
+    owners = parse_socket_owners(fds.splitlines())
+    users = {}
+    for line in passwd.splitlines():
+        fields = line.split(':')
+        if len(fields) > 2 and fields[2].isdigit():
+            users[int(fields[2])] = fields[0]
+    ret = {}
+    for port, (uid, inode) in listen.items():
+        ret[port] = (owners.get(inode), users.get(uid, str(uid)))
+    return ret
+
+
 def is_port_empty(host, port):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     result = True
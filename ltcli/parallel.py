@@ -0,0 +1,92 @@
+import time
+from threading import Condition, Thread
+
+from ltcli.log import logger
+
+
+DEFAULT_MAX_WORKERS = 64
+
+
+class Result(object):
+    """Result of a single call made by 'run'
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.value = None
+        self.error = None
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def run(func, args_list, max_workers=DEFAULT_MAX_WORKERS, key=None,
+        max_per_key=0):
+    """Call func with each arguments concurrently
+
+    Calls are processed by at most max_workers threads. An exception raised
+    by func is stored in Result.error instead of being propagated.
+
+    :param func: callable
+    :param args_list: list of arguments (tuple or single value)
+    :param max_workers: maximum number of threads
+    :param key: callable returning group(ex. host) of arguments. Used with
+        max_per_key
+    :param max_per_key: maximum number of concurrent calls of a group.
+        0 means no limit
+    :return: list of Result, in the same order as args_list
+    """
+    results = []
+    for args in args_list:
+        if not isinstance(args, tuple):
+            args = (args,)
+        results.append(Result(args))
+    if not results:
+        return results
+    pending = list(results)
+    running = {}
+    cond = Condition()
+
+    def _next():
+        with cond:
+            while pending:
+                for i, result in enumerate(pending):
+                    k = key(*result.args) if key else None
+                    if not max_per_key or running.get(k, 0) < max_per_key:
+                        running[k] = running.get(k, 0) + 1
+                        return pending.pop(i), k
+                cond.wait()
+            return None, None
+
+    def _done(k):
+        with cond:
+            running[k] -= 1
+            cond.notify_all()
+
+    def _worker():
+        while True:
+            result, k = _next()
+            if result is None:
+                return
+            start = time.time()
+            try:
+                result.value = func(*result.args)
+            except Exception as ex:
+                name = getattr(func, '__name__', func)
+                logger.debug('{}{}: {}'.format(name, result.args, ex))
+                result.error = ex
+            result.elapsed = time.time() - start
+            _done(k)
+
+    threads = []
+    for _ in range(min(max_workers, len(results))):
+        t = Thread(target=_worker)
+        t.daemon = True
+        threads.append(t)
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
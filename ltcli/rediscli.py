@@ -1,9 +1,18 @@
 from __future__ import print_function
 
+import time
+
 from terminaltables import AsciiTable
 
-from ltcli import config, utils, color, message as m
+from ltcli import config, utils, color, stats, message as m
 from ltcli.center import Center
+from ltcli.latency import (
+    ClusterLatency,
+    SlowlogAggregator,
+    print_slowlog_hist,
+    print_slowlog_top,
+    tail_slowlog
+)
 from ltcli.rediscli_util import RedisCliUtil
 from ltcli.log import logger
 
@@ -201,3 +210,127 @@ class RedisCliConfig(object):
                 return
             center.configure_redis()
             center.sync_conf()
+
+
+class RedisCliSlowlog(object):
+    def __init__(self):
+        pass
+
+    def _get(self, count, slave):
+        if not isinstance(count, int):
+            msg = m.get('error_option_type_not_number').format(option='count')
+            logger.error(msg)
+            return None
+        if not isinstance(slave, bool):
+            msg = m.get('error_option_type_not_boolean').format(option='slave')
+            logger.error(msg)
+            return None
+        cluster_latency = ClusterLatency(stats.get_targets(slave=slave))
+        try:
+            aggregator = SlowlogAggregator()
+            for entry in cluster_latency.slowlog(count):
+                aggregator.add(entry)
+            return aggregator
+        finally:
+            cluster_latency.close()
+
+    def top(self, n=10, count=128, slave=True):
+        """Command: slowlog get of all redis, merged by command
+
+        :param n: number of commands to print
+        :param count: number of entries to get from each redis
+        :param slave: If true, include slave
+        """
+        aggregator = self._get(count, slave)
+        if aggregator is not None:
+            print_slowlog_top(aggregator, n)
+
+    def hist(self, count=128, slave=True):
+        """Command: histogram of slowlog duration per redis
+
+        :param count: number of entries to get from each redis
+        :param slave: If true, include slave
+        """
+        aggregator = self._get(count, slave)
+        if aggregator is not None:
+            print_slowlog_hist(aggregator)
+
+    def tail(self, t=1, count=128, slave=True):
+        """Command: print new slowlog entries of all redis continuously
+
+        :param t: renewal cycle(sec)
+        :param count: number of entries to get from each redis per cycle
+        :param slave: If true, include slave
+        """
+        if not isinstance(t, int) and not isinstance(t, float):
+            msg = m.get('error_option_type_not_float').format(option='t')
+            logger.error(msg)
+            return
+        cluster_latency = ClusterLatency(stats.get_targets(slave=slave))
+        logger.info(m.get('message_for_exit'))
+        try:
+            tail_slowlog(cluster_latency, t, count)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cluster_latency.close()
+
+    def reset(self, slave=True):
+        """Command: slowlog reset of all redis
+
+        :param slave: If true, include slave
+        """
+        cluster_latency = ClusterLatency(stats.get_targets(slave=slave))
+        try:
+            ok_cnt, total = cluster_latency.slowlog_reset()
+        finally:
+            cluster_latency.close()
+        logger.info('success {}/{}'.format(ok_cnt, total))
+
+
+class RedisCliLatency(object):
+    def __init__(self):
+        pass
+
+    def latest(self, slave=True):
+        """Command: latency latest of all redis
+
+        :param slave: If true, include slave
+        """
+        cluster_latency = ClusterLatency(stats.get_targets(slave=slave))
+        try:
+            rows = cluster_latency.latency_latest()
+        finally:
+            cluster_latency.close()
+        rows.sort(key=lambda x: x[4], reverse=True)
+        meta = [['ADDR', 'EVENT', 'TIME', 'LATEST(ms)', 'MAX(ms)']]
+        for addr, event, timestamp, latest, max_latency in rows:
+            meta.append([
+                addr,
+                event,
+                time.strftime('%H:%M:%S', time.localtime(timestamp)),
+                latest,
+                max_latency
+            ])
+        utils.print_table(meta)
+
+    def history(self, event, slave=True):
+        """Command: latency history of all redis, merged by time
+
+        :param event: latency event name (ex. command, fast-command)
+        :param slave: If true, include slave
+        """
+        cluster_latency = ClusterLatency(stats.get_targets(slave=slave))
+        try:
+            rows = cluster_latency.latency_history(event)
+        finally:
+            cluster_latency.close()
+        rows.sort(key=lambda x: x[1])
+        meta = [['TIME', 'ADDR', 'LATENCY(ms)']]
+        for addr, timestamp, latency in rows:
+            meta.append([
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)),
+                addr,
+                latency
+            ])
+        utils.print_table(meta)
@@ -143,9 +143,10 @@ class RedisCliUtil(object):
         outs = ''
         stdout = ''
         meta = [['addr', 'stdout']]
+        table = config.get_instance_table()
+        ex_cmd = os.path.join(table.path_of_fb['sr2_redis_bin'], 'redis-cli')
         for ip, port in targets:
-            env = utils.make_export_envs(ip, port)
-            ex_cmd = os.path.join(config.get_tsr2_home(), 'bin', 'redis-cli')
+            env = utils.make_export_envs(ip, port, table)
             command = '{env}; {ex_cmd} -c -h {ip} -p {port} {sub_cmd}'.format(
                 env=env,
                 ex_cmd=ex_cmd,
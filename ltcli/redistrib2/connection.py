@@ -1,5 +1,6 @@
 import socket
 from functools import wraps
+from threading import Lock
 
 import hiredis
 import six
@@ -58,6 +59,14 @@ CMD_CLUSTER_NODES = pack_command('cluster', 'nodes')
 CMD_CLUSTER_INFO = pack_command('cluster', 'info')
 
 
+def _decode(reply):
+    if isinstance(reply, list):
+        return [_decode(i) for i in reply]
+    if isinstance(reply, six.binary_type):
+        return reply.decode(ENCODING)
+    return reply
+
+
 def _wrap_sock_op(f):
     @wraps(f)
     def g(conn, *args, **kwargs):
@@ -75,7 +84,9 @@ class Connection(object):
         self.port = port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.reader = hiredis.Reader()
-        self.last_raw_message = EMPTY
+        # bytes received. Raw replies are not kept, so a pooled
+        # connection does not grow
+        self.received_bytes = 0
 
         self.sock.settimeout(timeout)
         self._conn()
@@ -88,7 +99,7 @@ class Connection(object):
     def _recv(self):
         while True:
             m = self.sock.recv(16384)
-            self.last_raw_message += m
+            self.received_bytes += len(m)
             self.reader.feed(m)
             r = self.reader.gets()
             # From hiredis.Reader : https://github.com/redis/hiredis-py#usage
@@ -101,7 +112,7 @@ class Connection(object):
         resp = []
         while len(resp) < n:
             m = self.sock.recv(16384)
-            self.last_raw_message += m
+            self.received_bytes += len(m)
             self.reader.feed(m)
 
             r = self.reader.gets()
@@ -122,9 +133,7 @@ class Connection(object):
         if isinstance(r, hiredis.ReplyError):
             raise r
 
-        if isinstance(r, list):
-            return [i.decode(ENCODING) for i in r]
-        return r.decode(ENCODING)
+        return _decode(r)
 
     def execute(self, *args):
         return self.send_raw(pack_command(*args))
@@ -155,3 +164,71 @@ class Connection(object):
 
     def talk_bulk(self, cmd_list):
         return self.execute_bulk(cmd_list)
+
+
+class ConnectionPool(object):
+    """Keep idle connections per address for reuse
+
+    A connection is owned by one caller between 'get' and 'release'.
+    Connections that raised an error should be passed to 'discard'.
+    """
+
+    def __init__(self, timeout=5, max_idle=4):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = Lock()
+
+    def get(self, host, port):
+        key = (host, int(port))
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        return Connection(host, int(port), timeout=self.timeout)
+
+    def release(self, conn):
+        key = (conn.host, conn.port)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def discard(self, conn):
+        conn.close()
+
+    def execute(self, host, port, *args):
+        conn = self.get(host, port)
+        try:
+            ret = conn.execute(*args)
+        except hiredis.ReplyError:
+            self.release(conn)
+            raise
+        except Exception:
+            self.discard(conn)
+            raise
+        self.release(conn)
+        return ret
+
+    def execute_bulk(self, host, port, cmd_list):
+        conn = self.get(host, port)
+        try:
+            ret = conn.execute_bulk(cmd_list)
+        except hiredis.ReplyError:
+            self.release(conn)
+            raise
+        except Exception:
+            self.discard(conn)
+            raise
+        self.release(conn)
+        return ret
+
+    def close(self):
+        with self._lock:
+            idle_lists = list(self._idle.values())
+            self._idle = {}
+        for idle in idle_lists:
+            for conn in idle:
+                conn.close()
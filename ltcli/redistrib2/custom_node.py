@@ -1,11 +1,21 @@
 from __future__ import print_function
 
 import redis
+from .connection import Connection
 from .custom_util import PrettySlotGenerator
 
+# one round trip of load_info
+CLUSTER_INFO_COMMANDS = [['cluster', 'nodes'], ['cluster', 'info']]
+
+
+def fetch_cluster_info(host, port):
+    """Replies of CLUSTER NODES and CLUSTER INFO, pipelined"""
+    with Connection(host, port) as conn:
+        return conn.execute_bulk(CLUSTER_INFO_COMMANDS)
+
 
 class CustomClusterNode(object):
-    def __init__(self, addr):
+    def __init__(self, addr, connect=True):
         s = addr.split(':')
         if len(s) < 2:
             print('Invalid Addr (given as %s) - use IP:Port format' % addr)
@@ -27,7 +37,8 @@ class CustomClusterNode(object):
         self.r = None
         self.ip = ip
         self.port = port
-        self.connect()
+        if connect:
+            self.connect()
 
     def connect(self):
         self.r = redis.Redis(host=self.ip, port=self.port)
@@ -54,22 +65,27 @@ class CustomClusterNode(object):
         return msg
 
     def load_info(self, o={}):
-        conn = self.r
-        nodes_res_text = conn.execute_command('cluster nodes')
-        info_res_text = conn.execute_command('cluster info')
+        nodes_res_text, info_res_text = fetch_cluster_info(self.ip, self.port)
+        return self.load_info_from_text(nodes_res_text, info_res_text, o)
+
+    def load_info_from_text(self, nodes_res_text, info_res_text, o={}):
+        """Load replies of CLUSTER NODES and CLUSTER INFO fetched already"""
         self.all_info_list = []
+        self.friends = []
         self.info = {}
         self._load_info(nodes_res_text, info_res_text, o)
         return self
 
     def get_config_signature(self):
-        self.load_info()
+        """Slots of masters seen by this node, from the loaded info"""
         signature = ''
         sorted_info_list = sorted(self.all_info_list, key=lambda x: x['name'])
         for info in sorted_info_list:
-            msg = self.info_string(info)
-            if msg.startswith('M'):
-                signature += (msg + '|')
+            if self._is_master(info):
+                signature += '%s:%s|' % (
+                    info['name'],
+                    ','.join(sorted(info['slot_ranges']))
+                )
         return signature
 
     @staticmethod
@@ -119,11 +135,15 @@ class CustomClusterNode(object):
             'importing': {},
             'my_master_id': my_master_id,
             'slots': {},
+            # ex) ['0-5460', '5462']. no open slot
+            'slot_ranges': [x for x in slots if x and x[0] != '['],
         }
-        self._load_slots(info, slots)
-        self._load_cluster_info_text(info, info_res_text)
         self.all_info_list.append(info)
         if 'myself' in info['flags']:
+            # rows of others are in their own replies. slots of them are
+            # only compared as slot_ranges
+            self._load_slots(info, slots)
+            self._load_cluster_info_text(info, info_res_text)
             self.info = info
         else:
             self.friends.append(info)
@@ -1,8 +1,13 @@
 import logging
 import random
 
+from ltcli import parallel
 from .command import custom_migrate_slots
-from .custom_node import CustomClusterNode
+from .custom_node import (
+    CLUSTER_INFO_COMMANDS,
+    CustomClusterNode,
+    fetch_cluster_info,
+)
 from .custom_reshard import CustomReshard
 from .custom_util import CustomStd
 
@@ -10,6 +15,37 @@ total_slot_count = 16384
 migrate_default_timeout = 60000
 rebalance_default_threshold = 2
 
+# flags of slot map
+SLOT_COVERED = 1
+SLOT_OPEN = 2
+
+try:
+    from ltcli import aio
+except (ImportError, SyntaxError):
+    # python 2
+    aio = None
+
+
+def fetch_cluster_info_all(addrs):
+    """Replies of CLUSTER NODES and CLUSTER INFO of nodes, concurrently
+
+    :param addrs: list of (host, port)
+    :return: list of (nodes text, info text) in order of addrs
+    """
+    if aio is not None:
+        results = aio.execute_bulk_all(addrs, CLUSTER_INFO_COMMANDS, timeout=5)
+    else:
+        results = parallel.run(fetch_cluster_info, addrs)
+    replies = []
+    for result in results:
+        if not result.ok:
+            raise result.error
+        for reply in result.value:
+            if isinstance(reply, Exception):
+                raise reply
+        replies.append(result.value)
+    return replies
+
 
 class RedisTrib(object):
     def __init__(self, opt={}):
@@ -20,6 +56,7 @@ class RedisTrib(object):
         self.timeout = migrate_default_timeout
         self.cluster_error = False
         self.master_nodes = []
+        self.slot_map = None
 
     def add_node(self, node):
         self.nodes.append(node)
@@ -29,19 +66,26 @@ class RedisTrib(object):
 
     def load_cluster_info_from_node(self, node_addr):
         logging.debug('load_cluster_info_from_node')
-        node = CustomClusterNode(node_addr)
+        node = CustomClusterNode(node_addr, connect=False)
         node.load_info()
         self.reset_node()
         self.add_node(node)
+        friends = []
         for friend in node.friends:
             if 'noaddr' in friend['flags'] or \
                     'disconnected' in friend['flags'] or \
                     'fail' in friend['flags']:
                 continue
-            fnode = CustomClusterNode(friend['addr'])
-            fnode.load_info()
+            friends.append(friend)
+        addrs = [(friend['ip'], friend['port']) for friend in friends]
+        replies = fetch_cluster_info_all(addrs)
+        for friend, (nodes_res_text, info_res_text) in zip(friends, replies):
+            fnode = CustomClusterNode(friend['addr'], connect=False)
+            fnode.load_info_from_text(nodes_res_text, info_res_text)
             self.add_node(fnode)
         self.populate_nodes_replicas_info()
+        self.master_nodes = []
+        self.slot_map = None
         for node in self.nodes:
             if 'master' in node.info['flags']:
                 self.master_nodes.append(node)
@@ -59,11 +103,17 @@ class RedisTrib(object):
         self.check_cluster()
         master_nodes = self.master_nodes
         nodes_involved = len(master_nodes)
-        total_weight = len(master_nodes)
+        # weights: {node id: weight}. Node not in weights has default_weight
+        weights = self.opt.get('weights') or {}
+        default_weight = self.opt.get('default_weight', 1)
+        for node in master_nodes:
+            name = node.info['name']
+            node.info['weight'] = weights.get(name, default_weight)
+        total_weight = sum(node.info['weight'] for node in master_nodes)
         threshold_reached = False
         for node in master_nodes:
             i = node.info
-            expected = int(float(total_slot_count) / total_weight)
+            expected = int(float(total_slot_count) * i['weight'] / total_weight)
             slot_count = len(i['slots'].keys())
             b = slot_count - expected
             i['balance'] = b
@@ -133,8 +183,7 @@ class RedisTrib(object):
     def compute_single_reshard_table(self, src, num_slots):
         moved = []
         slots = src.info['slots']
-        t = slots.keys()
-        t.sort()
+        t = sorted(slots.keys())
         for slot_num in t[0:int(num_slots)]:
             moved.append(slot_num)
         return moved
@@ -217,9 +266,26 @@ class RedisTrib(object):
             print('[OK] All nodes agree about slots configuration.')
             return True
 
+    def get_slot_map(self):
+        """Flags(SLOT_COVERED, SLOT_OPEN) of each slot over loaded nodes"""
+        if self.slot_map is None:
+            slot_map = bytearray(total_slot_count)
+            for node in self.nodes:
+                for slot in node.info['slots']:
+                    slot_map[slot] |= SLOT_COVERED
+                for slot in node.info['migrating']:
+                    slot_map[slot] |= SLOT_OPEN
+                for slot in node.info['importing']:
+                    slot_map[slot] |= SLOT_OPEN
+            self.slot_map = slot_map
+        return self.slot_map
+
+    def open_slots(self):
+        slot_map = self.get_slot_map()
+        return [i for i in range(total_slot_count) if slot_map[i] & SLOT_OPEN]
+
     def check_open_slots(self):
         print('>>> Check for open slots...')
-        open_slots = []
         for node in self.nodes:
             m_nodes = node.info['migrating']
             i_nodes = node.info['importing']
@@ -227,19 +293,20 @@ class RedisTrib(object):
                 self.cluster_error = True
                 print('[WARNING] Node %s has lots in migrating state' %
                       node.to_string())
-                open_slots.append(m_nodes.keys())
             elif len(i_nodes) > 0:
                 print('[WARNING] Node %s has lots in importing state' %
                       node.to_string())
-                open_slots.append(i_nodes.keys())
                 # TODO: implement fix option
+        open_slots = self.open_slots()
+        if open_slots:
+            print('[WARNING] The following slots are open: %s' %
+                  ','.join(str(slot) for slot in open_slots))
 
     def covered_slots(self):
-        slots = {}
-        for node in self.nodes:
-            cur_slots = node.info['slots'].copy()
-            slots.update(cur_slots)
-        return slots.keys()
+        slot_map = self.get_slot_map()
+        return [
+            i for i in range(total_slot_count) if slot_map[i] & SLOT_COVERED
+        ]
 
     def check_slots_coverage(self):
         print('>>> Check slots coverage...')
@@ -280,9 +347,18 @@ class RedisTrib(object):
         return False
 
 
-def rebalance_cluster_cmd(ip, port):
+def rebalance_cluster_cmd(ip, port, weights=None, default_weight=1):
+    """
+    :param weights: dict {node id: weight}
+    :param default_weight: weight of master not in weights
+    """
     logging.debug('rebalance')
-    rt = RedisTrib({'ip': ip, 'port': port})
+    rt = RedisTrib({
+        'ip': ip,
+        'port': port,
+        'weights': weights,
+        'default_weight': default_weight,
+    })
     rt.rebalance_cluster_cmd()
     return True
 
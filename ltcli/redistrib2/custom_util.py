@@ -31,8 +31,7 @@ class PrettySlotGenerator(object):
         self.pretty_list = []
 
     def generate(self, slots):
-        key_list = slots.keys()
-        key_list.sort()
+        key_list = sorted(slots.keys())
         self.pretty_list = []
         buf = self._get_init_buf()
         for key in key_list:
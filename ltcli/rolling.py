@@ -0,0 +1,271 @@
+import time
+
+from ltcli import message, net, parallel
+from ltcli.failover import (
+    FailoverOrchestrator,
+    ReadinessTracker,
+    print_results,
+    split_addr
+)
+from ltcli.log import logger
+from ltcli.redistrib2.connection import ConnectionPool
+from ltcli.stats import parse_info
+from ltcli.exceptions import ClusterRedisError
+
+
+class Shard(object):
+    """A master and its slaves
+    """
+
+    def __init__(self, master, slaves):
+        self.master = master
+        self.slaves = list(slaves)
+
+
+def get_shards(master_obj_list):
+    """
+    :param master_obj_list: result of Center.get_master_obj_list
+    :return: list of Shard
+    """
+    shards = []
+    for node in master_obj_list:
+        slaves = [s['addr'] for s in node['slaves']]
+        shards.append(Shard(node['addr'], slaves))
+    return shards
+
+
+def make_waves(shards, width=1):
+    """Plan waves of rolling restart
+
+    In a wave, at most one instance of a shard is restarted. Slaves are
+    restarted first. Then each master is restarted after one of its slaves
+    is promoted, so a shard always has a live master.
+
+    :param shards: list of Shard
+    :param width: maximum number of instances in a wave
+    :return: (slave waves, master waves). A slave wave is a list of address.
+        A master wave is a list of (master, slave to promote)
+    """
+    slave_waves = []
+    depth = max([len(shard.slaves) for shard in shards] or [0])
+    for i in range(depth):
+        # i-th slave of each shard. One instance per shard in a wave
+        nodes = [shard.slaves[i] for shard in shards if i < len(shard.slaves)]
+        for j in range(0, len(nodes), width):
+            slave_waves.append(nodes[j:j + width])
+    pairs = [(s.master, s.slaves[0]) for s in shards if s.slaves]
+    master_waves = []
+    for i in range(0, len(pairs), width):
+        master_waves.append(pairs[i:i + width])
+    return slave_waves, master_waves
+
+
+class RollingRestart(object):
+    """Restart instances in waves without losing any shard
+
+    Config files are not regenerated. Run 'cluster configure' before to
+    apply changed config.
+    """
+
+    def __init__(self, center, width=1, max_lag=0, timeout=300,
+                 restore_roles=True, force=False):
+        """
+        :param center: Center (update_ip_port called)
+        :param width: maximum number of instances restarted in a wave
+        :param max_lag: allowed replication lag(bytes) to go to next wave
+        :param timeout: maximum time(sec) to wait in a wave
+        :param restore_roles: If true, promote original masters at the end
+        :param force: If true, send SIGKILL to stop instance
+        """
+        self.center = center
+        self.width = width
+        self.max_lag = max_lag
+        self.timeout = timeout
+        self.restore_roles = restore_roles
+        self.force = force
+        self.pool = ConnectionPool(timeout=5, max_idle=1)
+        self.ssh_pool = net.SSHPool()
+        self.current_time = time.strftime("%Y%m%d-%H%M", time.gmtime())
+
+    def _is_down(self, addr):
+        host, port = split_addr(addr)
+        try:
+            self.pool.execute(host, port, 'ping')
+            return False
+        except Exception:
+            return True
+
+    def _restart_host(self, host, ports):
+        client = self.ssh_pool.get(host)
+        self.center.stop_redis_process(host, ports, self.force, client=client)
+        addrs = ['{}:{}'.format(host, port) for port in ports]
+        start = time.time()
+        while not all(self._is_down(addr) for addr in addrs):
+            if time.time() - start > self.timeout:
+                msg = message.get('error_max_try_stop_redis')
+                raise ClusterRedisError(msg)
+            time.sleep(0.5)
+        self.center.run_redis_process(
+            host,
+            ports,
+            False,
+            self.current_time,
+            client=client
+        )
+
+    def restart_wave(self, addrs):
+        """Restart instances concurrently, grouped by host"""
+        by_host = {}
+        for addr in addrs:
+            host, port = split_addr(addr)
+            by_host.setdefault(host, []).append(port)
+            msg = message.get('redis_restart').format(host=host, ports=port)
+            logger.info(msg)
+        results = parallel.run(self._restart_host, list(by_host.items()))
+        for result in results:
+            if not result.ok:
+                raise result.error
+        if not ReadinessTracker(addrs, timeout=self.timeout).wait():
+            msg = message.get('error_max_try_start_redis')
+            raise ClusterRedisError(msg)
+
+    def _repl_lag(self, addr):
+        """Replication lag(bytes) of slave. None if link is not up"""
+        host, port = split_addr(addr)
+        info = parse_info(self.pool.execute(host, port, 'info', 'replication'))
+        if info.get('role') != 'slave':
+            return 0
+        if info.get('master_link_status') != 'up':
+            return None
+        m_info = parse_info(self.pool.execute(
+            info['master_host'],
+            info['master_port'],
+            'info',
+            'replication'
+        ))
+        m_offset = m_info.get('master_repl_offset', 0)
+        return max(m_offset - info.get('slave_repl_offset', 0), 0)
+
+    def _connected_slaves(self, addr):
+        """Number of connected slaves. 0 if instance is not master"""
+        host, port = split_addr(addr)
+        info = parse_info(self.pool.execute(host, port, 'info', 'replication'))
+        if info.get('role') != 'master':
+            return 0
+        return info.get('connected_slaves', 0)
+
+    def check_shards(self, pairs):
+        """Abort unless each shard has a master with a connected slave
+
+        Restarting a slave of a shard whose master is down would make the
+        shard unavailable.
+
+        :param pairs: list of (master, slave) of plan. Roles may be swapped
+            by a previous run
+        """
+        addrs = sorted(set(addr for pair in pairs for addr in pair))
+        results = parallel.run(self._connected_slaves, addrs)
+        healthy = set(r.args[0] for r in results if r.ok and r.value)
+        unhealthy = [
+            m for m, s in pairs if m not in healthy and s not in healthy
+        ]
+        if unhealthy:
+            msg = message.get('error_rolling_restart_unhealthy')
+            raise ClusterRedisError(msg.format(addrs=', '.join(unhealthy)))
+
+    def wait_for_catch_up(self, addrs):
+        """Wait until replication lag of slaves is not more than max_lag"""
+        pending = list(addrs)
+        start = time.time()
+        while pending:
+            results = parallel.run(self._repl_lag, pending)
+            pending = []
+            for result in results:
+                lag = result.value if result.ok else None
+                if lag is None or lag > self.max_lag:
+                    pending.append(result.args[0])
+            if not pending:
+                break
+            if time.time() - start > self.timeout:
+                msg = message.get('error_replication_catch_up')
+                raise ClusterRedisError(msg.format(addrs=', '.join(pending)))
+            logger.debug('wait for catch up: {}'.format(pending))
+            time.sleep(0.5)
+
+    def _promote(self, slaves):
+        orchestrator = FailoverOrchestrator(timeout=self.timeout)
+        try:
+            results = orchestrator.run(slaves)
+        finally:
+            orchestrator.close()
+        if not all(result.ok for result in results):
+            print_results(results)
+            raise ClusterRedisError(message.get('error_redis_failover'))
+
+    def plan(self):
+        """Make plan of waves with current roles
+
+        :return: dict (json serializable)
+        """
+        shards = get_shards(self.center.get_master_obj_list())
+        slave_waves, master_waves = make_waves(shards, self.width)
+        return {
+            'slave_waves': slave_waves,
+            'master_waves': [[list(p) for p in w] for w in master_waves],
+            'no_slave': [shard.master for shard in shards if not shard.slaves],
+        }
+
+    def run(self, plan=None, done=(), on_wave_done=None):
+        """
+        :param plan: result of 'plan'. If not set, make new plan
+        :param done: ids of waves already completed, skipped
+        :param on_wave_done: callable called with id of wave when completed
+        """
+        if plan is None:
+            plan = self.plan()
+        slave_waves = plan['slave_waves']
+        master_waves = plan['master_waves']
+        no_slave = plan['no_slave']
+        steps = []
+        for i, wave in enumerate(slave_waves):
+            steps.append(('slave-{}'.format(i), self._slave_wave, wave))
+        for i, wave in enumerate(master_waves):
+            steps.append(('master-{}'.format(i), self._master_wave, wave))
+        if no_slave:
+            steps.append(('no-slave', self._no_slave_wave, no_slave))
+        if self.restore_roles and master_waves:
+            masters = [m for wave in master_waves for m, _ in wave]
+            steps.append(('restore-roles', self._promote, masters))
+        try:
+            pairs = [tuple(pair) for wave in master_waves for pair in wave]
+            if any(wave_id not in done for wave_id, _, _ in steps):
+                self.check_shards(pairs)
+            for count, (wave_id, func, wave) in enumerate(steps, 1):
+                if wave_id in done:
+                    continue
+                msg = message.get('rolling_restart_wave')
+                logger.info(msg.format(cur=count, total=len(steps)))
+                func(wave)
+                if on_wave_done is not None:
+                    on_wave_done(wave_id)
+        finally:
+            self.pool.close()
+            self.ssh_pool.close()
+        logger.info(message.get('complete_rolling_restart'))
+
+    def _slave_wave(self, slaves):
+        self.restart_wave(slaves)
+        self.wait_for_catch_up(slaves)
+
+    def _master_wave(self, wave):
+        masters = [m for m, _ in wave]
+        slaves = [s for _, s in wave]
+        self.wait_for_catch_up(slaves)
+        self._promote(slaves)
+        self.restart_wave(masters)
+        self.wait_for_catch_up(masters)
+
+    def _no_slave_wave(self, masters):
+        msg = message.get('rolling_restart_no_slave')
+        logger.warning(msg.format(addrs=', '.join(masters)))
+        self.restart_wave(masters)
@@ -0,0 +1,173 @@
+from __future__ import print_function
+
+import json
+import random
+from threading import Event, Thread
+
+from six.moves import queue
+
+from ltcli.log import logger
+from ltcli.parallel import DEFAULT_MAX_WORKERS
+from ltcli.redistrib2.connection import ConnectionPool
+
+
+QUEUE_SIZE = 64
+
+
+class _Done(object):
+    """End mark of a node in queue"""
+
+    def __init__(self, addr, count, error=None):
+        self.addr = addr
+        self.count = count
+        self.error = error
+
+
+class ClusterScanner(object):
+    """SCAN all nodes concurrently and stream keys
+
+    A thread per node runs SCAN and puts each batch of keys into a bounded
+    queue. A thread blocks while the queue is full, so memory does not grow
+    with keyspace size even if the consumer is slow.
+    """
+
+    def __init__(self, targets, match=None, count=1000, type=None,
+                 sample=1.0, timeout=10, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        :param targets: list of (type, host, ip, port). See stats.get_targets
+        :param match: pattern of SCAN MATCH
+        :param count: SCAN COUNT
+        :param type: SCAN TYPE (redis 6 or later)
+        :param sample: ratio(0.0 ~ 1.0) of keys to yield
+        :param timeout: socket timeout(sec)
+        :param max_workers: maximum number of nodes scanned at the same time
+        """
+        # pylint: disable=redefined-builtin
+        self.targets = targets
+        self.match = match
+        self.count = count
+        self.type = type
+        self.sample = sample
+        self.max_workers = max_workers
+        self.pool = ConnectionPool(timeout=timeout, max_idle=1)
+        self.node_counts = {}
+        self.errors = {}
+        self._stop = Event()
+
+    def _scan_args(self, cursor):
+        args = ['scan', cursor]
+        if self.match:
+            args += ['match', self.match]
+        args += ['count', self.count]
+        if self.type:
+            args += ['type', self.type]
+        return args
+
+    def _put(self, out, item):
+        while not self._stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _scan_node(self, ip, port, out, count_only):
+        addr = '{}:{}'.format(ip, port)
+        count = 0
+        conn = self.pool.get(ip, port)
+        try:
+            cursor = '0'
+            while not self._stop.is_set():
+                cursor, keys = conn.execute(*self._scan_args(cursor))
+                if self.sample < 1.0 and not count_only:
+                    keys = [k for k in keys if random.random() < self.sample]
+                count += len(keys)
+                if keys and not count_only:
+                    if not self._put(out, (addr, keys)):
+                        break
+                if str(cursor) == '0':
+                    break
+            self.pool.release(conn)
+        except Exception as ex:
+            self.pool.discard(conn)
+            self._put(out, _Done(addr, count, ex))
+            return
+        self._put(out, _Done(addr, count))
+
+    def _produce(self, jobs, out, count_only):
+        while not self._stop.is_set():
+            try:
+                ip, port = jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._scan_node(ip, port, out, count_only)
+            except Exception as ex:
+                addr = '{}:{}'.format(ip, port)
+                self._put(out, _Done(addr, 0, ex))
+
+    def _run(self, count_only):
+        jobs = queue.Queue()
+        for _, _, ip, port in self.targets:
+            jobs.put((ip, port))
+        out = queue.Queue(maxsize=QUEUE_SIZE)
+        threads = []
+        for _ in range(min(self.max_workers, len(self.targets))):
+            t = Thread(target=self._produce, args=(jobs, out, count_only))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        remain = len(self.targets)
+        try:
+            while remain > 0:
+                item = out.get()
+                if isinstance(item, _Done):
+                    remain -= 1
+                    self.node_counts[item.addr] = item.count
+                    if item.error is not None:
+                        msg = 'scan {}: {}'.format(item.addr, item.error)
+                        logger.warning(msg)
+                        self.errors[item.addr] = item.error
+                    continue
+                yield item
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join(1)
+
+    def keys(self):
+        """Generator of (addr, key)"""
+        for addr, keys in self._run(count_only=False):
+            for key in keys:
+                yield addr, key
+
+    def count_keys(self):
+        """Count keys without transferring them to consumer. Not sampled
+
+        :return: dict {addr: count}
+        """
+        for _ in self._run(count_only=True):
+            pass
+        return self.node_counts
+
+    def close(self):
+        self._stop.set()
+        self.pool.close()
+
+
+def write_ndjson(items, fd, limit=0):
+    """Write (addr, key) as a JSON object per line
+
+    :param items: iterable of (addr, key)
+    :param fd: file object
+    :param limit: maximum number of keys. 0 means no limit
+    :return: number of written keys
+    """
+    written = 0
+    for addr, key in items:
+        fd.write(json.dumps({'addr': addr, 'key': key}) + '\n')
+        written += 1
+        if limit and written >= limit:
+            break
+    return written
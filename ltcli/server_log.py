@@ -0,0 +1,626 @@
+"""Logs of redis servers on all hosts of a cluster
+
+Lines are filtered on each host with awk, so only matched lines are sent,
+and lines of all hosts are merged in time order by the time of redis log
+('pid:role dd Mon yyyy HH:MM:SS.mmm level message').
+
+Backup directories made by Center.backup_server_logs ($SR2_REDIS_LOG/
+backup/<YYYYmmdd-HHMMSS>) hold logs written before their time. Their
+names are in UTC while lines are in local time of host, so a directory
+is pruned by time range only with a margin of a day.
+"""
+from __future__ import print_function
+
+import calendar
+import heapq
+import re
+import time
+from threading import Thread
+
+from six.moves import queue, shlex_quote
+
+from ltcli import color, config, message, net, parallel, utils
+from ltcli.log import logger
+
+
+# level characters of redis log shown with each level
+LEVELS = {
+    'debug': '.-*#',
+    'verbose': '-*#',
+    'notice': '*#',
+    'warning': '#',
+}
+MONTHS = dict((m, i + 1) for i, m in enumerate([
+    'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+    'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec',
+]))
+PAT_LOG_TIME = re.compile(
+    r'^\d+:[A-Za-z] (\d{1,2}) ([A-Z][a-z]{2}) (\d{4}) '
+    r'(\d{2}):(\d{2}):(\d{2})(\.\d+)?'
+)
+# lines of tail in the queue at most. ssh is not read while it is full
+MAX_QUEUED_LINES = 10000
+PAT_BACKUP_DIR = re.compile(r'^\d{8}-\d{6}$')
+PAT_LOG_FILE_PORT = re.compile(r'-(\d+)\.log(\.gz)?$')
+# margin(sec) of pruning backup directories by time range
+BACKUP_MARGIN = 24 * 60 * 60
+
+# prefix port to each line of 'tail -v' and filter by level and pattern
+AWK_FILTER = ' '.join([
+    '/^==> .* <==$/ {',
+    'n = split($2, a, "-"); port = a[n]; sub(/\\.log$/, "", port); next',
+    '}',
+    '(ENVIRON["LTCLI_LEVELS"] == "" || index(ENVIRON["LTCLI_LEVELS"], $6))',
+    '&& (ENVIRON["LTCLI_PATTERN"] == "" || $0 ~ ENVIRON["LTCLI_PATTERN"])',
+    '{ print port "\\t" $0; fflush() }',
+])
+
+# input is 'file:line' of 'zgrep -H'. Filter by time(YYYYmmddHHMMSS) of
+# line and print 'M<TAB>file<TAB>line' of first LTCLI_MAX lines and
+# 'C<TAB>file<TAB>count' of each file at the end
+AWK_GREP = '''
+BEGIN {
+    split("Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec", ms, " ")
+    for (i = 1; i <= 12; i++) mon[ms[i]] = sprintf("%02d", i)
+    since = ENVIRON["LTCLI_SINCE"]
+    until = ENVIRON["LTCLI_UNTIL"]
+    max = ENVIRON["LTCLI_MAX"] + 0
+}
+{
+    i = index($0, ":")
+    f = substr($0, 1, i - 1)
+    l = substr($0, i + 1)
+    split(l, t, " ")
+    if (t[3] in mon) {
+        hms = substr(t[5], 1, 2) substr(t[5], 4, 2) substr(t[5], 7, 2)
+        last[f] = t[4] mon[t[3]] sprintf("%02d", t[2]) hms
+    }
+    ts = last[f]
+    if (since != "" && ts < since) next
+    if (until != "" && ts > until) next
+    count[f]++
+    if (++total <= max) print "M\\t" f "\\t" l
+}
+END {
+    for (f in count) print "C\\t" f "\\t" count[f]
+}
+'''
+
+
+def parse_time(line):
+    """Time of a line of redis log
+
+    :param line: line of redis log
+    :return: seconds since epoch as if local time is UTC. None if line
+        has no time
+    """
+    match = PAT_LOG_TIME.match(line)
+    if not match:
+        return None
+    day, mon, year, hour, minute, sec, frac = match.groups()
+    month = MONTHS.get(mon)
+    if month is None:
+        return None
+    ret = calendar.timegm((
+        int(year), month, int(day), int(hour), int(minute), int(sec), 0, 0, 0
+    ))
+    return ret + float(frac or 0)
+
+
+def level_of(line):
+    """Level character of a line of redis log. None if unknown"""
+    fields = line.split(' ', 6)
+    if len(fields) < 6 or len(fields[5]) != 1:
+        return None
+    return fields[5]
+
+
+def format_line(host, port, line):
+    prefix = color.cyan('{}:{}'.format(host, port))
+    if level_of(line) == '#':
+        line = color.yellow(line)
+    return '{} {}'.format(prefix, line)
+
+
+def parse_ports(port):
+    """
+    :param port: None, port, list of ports or comma separated ports
+    :return: list of int. None if port is None
+    """
+    if port is None:
+        return None
+    if isinstance(port, (list, tuple)):
+        return [int(p) for p in port]
+    return [int(p) for p in str(port).split(',') if p.strip()]
+
+
+def get_targets(ports=None, cluster_id=None):
+    """Ports of redis on each host of cluster
+
+    :param ports: list of ports to include. If None, all ports
+    :return: dict of host to sorted list of port
+    """
+    table = config.get_instance_table(cluster_id)
+    ret = {}
+    for host, port in table.addrs():
+        if ports is not None and port not in ports:
+            continue
+        ret.setdefault(host, set()).add(port)
+    return dict((host, sorted(p)) for host, p in ret.items())
+
+
+def tail_command(log_dir, ports, n, levels, pattern=None):
+    """Command following logs of ports and printing 'port<TAB>line'
+
+    :param levels: level characters to print. '' for all
+    :param pattern: extended regular expression of lines to print
+    """
+    files = ' '.join(
+        '{}/servers-*-{}.log'.format(log_dir, port) for port in ports
+    )
+    return ' '.join([
+        # mawk reads input in blocks unless interactive
+        'awk -W version 2>&1 | grep -q mawk && LTCLI_AWK="-W interactive";',
+        'tail -v -n {} -F {} 2> /dev/null |'.format(n, files),
+        'LTCLI_LEVELS={}'.format(shlex_quote(levels)),
+        'LTCLI_PATTERN={}'.format(shlex_quote(pattern or '')),
+        'awk $LTCLI_AWK {}'.format(shlex_quote(AWK_FILTER)),
+    ])
+
+
+class LogMerger(object):
+    """Merge lines of hosts in time order
+
+    A line is held for delay(sec) after it is received, so lines of
+    other hosts written at the same time can be put before it. A line
+    without time (ex. multi-line message) follows the previous line of
+    its log.
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self._heap = []
+        self._seq = 0
+        self._last_time = {}
+
+    def push(self, host, port, line, received=None):
+        ts = parse_time(line)
+        key = (host, port)
+        if ts is None:
+            ts = self._last_time.get(key, 0)
+        else:
+            self._last_time[key] = ts
+        self._seq += 1
+        received = time.time() if received is None else received
+        heapq.heappush(
+            self._heap,
+            (ts, self._seq, received, host, port, line)
+        )
+
+    def pop_ready(self, now=None):
+        """
+        :return: list of (host, port, line) held longer than delay
+        """
+        now = time.time() if now is None else now
+        ret = []
+        heap = self._heap
+        while heap and heap[0][2] <= now - self.delay:
+            _, _, _, host, port, line = heapq.heappop(heap)
+            ret.append((host, port, line))
+        return ret
+
+    def flush(self):
+        """
+        :return: list of (host, port, line) of all held lines
+        """
+        ret = []
+        while self._heap:
+            _, _, _, host, port, line = heapq.heappop(self._heap)
+            ret.append((host, port, line))
+        return ret
+
+
+class LogTail(object):
+    """Follow logs of redis on hosts concurrently and merge them
+
+    A ssh channel of a pooled connection is opened per host.
+    """
+
+    def __init__(self, targets, log_dir, n=10, levels='', pattern=None,
+                 delay=1.0):
+        """
+        :param targets: dict of host to list of ports
+        :param log_dir: directory of redis logs
+        :param n: number of last lines of each log to print first
+        :param levels: level characters to print. '' for all
+        :param pattern: extended regular expression of lines to print
+        :param delay: time(sec) to hold lines to sort them
+        """
+        self.targets = targets
+        self.log_dir = log_dir
+        self.n = n
+        self.levels = levels
+        self.pattern = pattern
+        self.delay = delay
+
+    def _tail_host(self, pool, host, lines):
+        command = tail_command(
+            self.log_dir,
+            self.targets[host],
+            self.n,
+            self.levels,
+            self.pattern
+        )
+        try:
+            net.ssh_stream(
+                pool.get(host),
+                command,
+                on_stdout=lambda line: lines.put((host, line, None)),
+                allow_status=None
+            )
+        except Exception as ex:
+            lines.put((host, None, ex))
+
+    def run(self, out=print):
+        """Print merged lines until Ctrl-C or all tails end
+
+        :param out: callable called with each formatted line
+        """
+        lines = queue.Queue(MAX_QUEUED_LINES)
+        pool = net.SSHPool()
+        threads = []
+        for host in sorted(self.targets):
+            t = Thread(target=self._tail_host, args=(pool, host, lines))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        merger = LogMerger(self.delay)
+        try:
+            while True:
+                # bounded, so ready lines are printed while hosts keep
+                # writing
+                items = []
+                timeout = min(self.delay, 0.5) or 0.1
+                try:
+                    items.append(lines.get(timeout=timeout))
+                    while len(items) < MAX_QUEUED_LINES:
+                        items.append(lines.get_nowait())
+                except queue.Empty:
+                    pass
+                for item in items:
+                    self._push(merger, *item)
+                for host, port, line in merger.pop_ready():
+                    out(format_line(host, port, line))
+                if lines.empty() and not any(t.is_alive() for t in threads):
+                    break
+            for host, port, line in merger.flush():
+                out(format_line(host, port, line))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.close()
+
+    @staticmethod
+    def _push(merger, host, line, error):
+        if error is not None:
+            msg = message.get('error_log_tail')
+            logger.error(msg.format(host=host, error=error))
+            return
+        if '\t' not in line:
+            return
+        port, line = line.split('\t', 1)
+        merger.push(host, port, line)
+
+
+def parse_time_option(value, end=False):
+    """Time option to 'YYYYmmddHHMMSS'
+
+    :param value: YYYYmmdd[-HHMM[SS]]
+    :param end: If true, fill omitted digits to the end of the range
+    :return: str of 14 digits. None if value is None
+    """
+    if value is None:
+        return None
+    digits = str(value).replace('-', '')
+    if not digits.isdigit() or len(digits) not in [8, 12, 14]:
+        raise ValueError(value)
+    # given digits are validated for end as well
+    try:
+        time.strptime(digits.ljust(14, '0'), '%Y%m%d%H%M%S')
+    except ValueError:
+        raise ValueError(value)
+    return digits.ljust(14, '9' if end else '0')
+
+
+def _shift(digits, sec):
+    """'YYYYmmddHHMMSS' moved by sec. Filled '9's are taken as max"""
+    ts = calendar.timegm(time.strptime(digits[:8], '%Y%m%d'))
+    ts += min(int(digits[8:10]), 23) * 3600
+    ts += min(int(digits[10:12]), 59) * 60
+    ts += min(int(digits[12:14]), 59)
+    return time.strftime('%Y%m%d%H%M%S', time.gmtime(ts + sec))
+
+
+def select_log_dirs(log_dir, backups, since=None, until=None):
+    """Directories of logs which may have lines in time range
+
+    Backup directory T has logs written after the previous backup and
+    before T.
+
+    :param log_dir: directory of redis logs
+    :param backups: names of backup directories (YYYYmmdd-HHMMSS)
+    :param since: 'YYYYmmddHHMMSS' or None
+    :param until: 'YYYYmmddHHMMSS' or None
+    :return: list of directories, older first
+    """
+    if since is not None:
+        since = _shift(since, -BACKUP_MARGIN)
+    if until is not None:
+        until = _shift(until, BACKUP_MARGIN)
+    ret = []
+    prev = None
+    for name in sorted(backups) + [None]:
+        digits = name.replace('-', '') if name else None
+        if since is not None and digits is not None and digits < since:
+            prev = digits
+            continue
+        if until is not None and prev is not None and prev > until:
+            break
+        if name is None:
+            ret.append(log_dir)
+        else:
+            ret.append('{}/backup/{}'.format(log_dir, name))
+        prev = digits
+    return ret
+
+
+def grep_command(dirs, ports, pattern, since=None, until=None,
+                 max_lines=1000):
+    """Command searching logs of ports in dirs. Output is of AWK_GREP
+
+    Compressed logs(.gz) are searched too.
+    """
+    if ports is None:
+        files = ['{}/servers-*.log*'.format(d) for d in dirs]
+    else:
+        files = [
+            '{}/servers-*-{}.log*'.format(d, port)
+            for d in dirs for port in ports
+        ]
+    return ' '.join([
+        'zgrep -H -E -e {} -- {} 2> /dev/null |'.format(
+            shlex_quote(pattern),
+            ' '.join(files)
+        ),
+        'LTCLI_SINCE={}'.format(since or ''),
+        'LTCLI_UNTIL={}'.format(until or ''),
+        'LTCLI_MAX={}'.format(int(max_lines)),
+        'awk {}'.format(shlex_quote(AWK_GREP)),
+    ])
+
+
+class GrepResult(object):
+    """Matched lines and counts of a host"""
+
+    def __init__(self, host):
+        self.host = host
+        # (time, seq, port, line)
+        self.lines = []
+        self.counts = {}
+        self._last_time = {}
+
+    @staticmethod
+    def port_of(file_path):
+        match = PAT_LOG_FILE_PORT.search(file_path)
+        return int(match.group(1)) if match else None
+
+    def feed(self, line):
+        fields = line.split('\t', 2)
+        if len(fields) != 3:
+            return
+        kind, file_path, value = fields
+        port = self.port_of(file_path)
+        if kind == 'C':
+            self.counts[port] = self.counts.get(port, 0) + int(value)
+            return
+        ts = parse_time(value)
+        if ts is None:
+            ts = self._last_time.get(file_path, 0)
+        else:
+            self._last_time[file_path] = ts
+        self.lines.append((ts, len(self.lines), port, value))
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+class LogGrep(object):
+    """Search logs of redis on hosts in parallel"""
+
+    def __init__(self, targets, log_dir, pattern, since=None, until=None,
+                 backup=True, max_lines=1000):
+        """
+        :param targets: dict of host to list of ports. None as list of
+            ports for all ports
+        :param log_dir: directory of redis logs
+        :param pattern: extended regular expression
+        :param since: 'YYYYmmddHHMMSS' or None
+        :param until: 'YYYYmmddHHMMSS' or None
+        :param backup: If true, search backup directories too
+        :param max_lines: maximum lines to receive from a host
+        """
+        self.targets = targets
+        self.log_dir = log_dir
+        self.pattern = pattern
+        self.since = since
+        self.until = until
+        self.backup = backup
+        self.max_lines = max_lines
+
+    def _list_backups(self, client):
+        command = 'ls -1 {}/backup 2> /dev/null'.format(self.log_dir)
+        _, stdout, _ = net.ssh_execute(client, command, allow_status=[0, 1, 2])
+        return [n for n in stdout.split() if PAT_BACKUP_DIR.match(n)]
+
+    def _grep_host(self, pool, host):
+        client = pool.get(host)
+        backups = self._list_backups(client) if self.backup else []
+        dirs = select_log_dirs(self.log_dir, backups, self.since, self.until)
+        command = grep_command(
+            dirs,
+            self.targets[host],
+            self.pattern,
+            self.since,
+            self.until,
+            self.max_lines
+        )
+        result = GrepResult(host)
+        net.ssh_stream(client, command, on_stdout=result.feed)
+        result.lines.sort()
+        return result
+
+    def run(self):
+        """
+        :return: list of parallel.Result of which value is GrepResult
+        """
+        with net.SSHPool() as pool:
+            return parallel.run(
+                lambda host: self._grep_host(pool, host),
+                sorted(self.targets)
+            )
+
+
+def merge_results(results):
+    """Matched lines of all hosts in time order
+
+    :param results: list of GrepResult
+    :return: iterator of (host, port, line)
+    """
+    streams = [
+        [(ts, seq, r.host, port, line) for ts, seq, port, line in r.lines]
+        for r in results
+    ]
+    for _, _, host, port, line in heapq.merge(*streams):
+        yield host, port, line
+
+
+class ServerLog(object):
+    """Logs of redis on all hosts of cluster
+    """
+
+    def tail(self, n=10, level='notice', port=None, grep=None, delay=1):
+        """Print logs of redis on all hosts in time order while written
+
+        :param n: number of last lines of each log to print first
+        :param level: debug / verbose / notice / warning. Lines of lower
+            level are not sent
+        :param port: port or ports (ex. 18101,18102). If None, all ports
+        :param grep: extended regular expression of lines to print
+        :param delay: time(sec) to hold lines to sort lines of hosts
+        """
+        if not isinstance(n, int):
+            msg = message.get('error_option_type_not_number')
+            logger.error(msg.format(option='n'))
+            return
+        if not isinstance(delay, (int, float)):
+            msg = message.get('error_option_type_not_float')
+            logger.error(msg.format(option='delay'))
+            return
+        if level not in LEVELS:
+            msg = message.get('error_log_level')
+            logger.error(msg.format(value=level, list=sorted(LEVELS)))
+            return
+        ports = parse_ports(port)
+        targets = get_targets(ports)
+        if not targets:
+            msg = message.get('error_no_log_target').format(port=port)
+            logger.error(msg)
+            return
+        cluster_id = config.get_cur_cluster_id()
+        log_dir = config.get_path_of_fb(cluster_id)['sr2_redis_log']
+        # fire parses numeric pattern, ex) --grep=18101, as number
+        pattern = None if grep is None else str(grep)
+        logger.info(message.get('message_for_exit'))
+        LogTail(
+            targets,
+            log_dir,
+            n=n,
+            levels=LEVELS[level],
+            pattern=pattern,
+            delay=delay
+        ).run()
+
+    def grep(self, pattern, port=None, since=None, until=None, backup=True,
+             n=1000):
+        """Search logs of redis on all hosts
+
+        Print matched lines of all hosts in time order and number of them
+        by host and port.
+
+        :param pattern: extended regular expression
+        :param port: port or ports (ex. 18101,18102). If None, all ports
+        :param since: YYYYmmdd[-HHMM[SS]] in time of log
+        :param until: YYYYmmdd[-HHMM[SS]] in time of log
+        :param backup: If true, search backup of logs too
+        :param n: maximum lines to print of a host
+        """
+        if not isinstance(n, int):
+            msg = message.get('error_option_type_not_number')
+            logger.error(msg.format(option='n'))
+            return
+        if not isinstance(backup, bool):
+            msg = message.get('error_option_type_not_boolean')
+            logger.error(msg.format(option='backup'))
+            return
+        try:
+            since_digits = parse_time_option(since)
+            until_digits = parse_time_option(until, end=True)
+        except ValueError as ex:
+            msg = message.get('error_log_time').format(value=ex.args[0])
+            logger.error(msg)
+            return
+        ports = parse_ports(port)
+        targets = get_targets(ports)
+        if not targets:
+            msg = message.get('error_no_log_target').format(port=port)
+            logger.error(msg)
+            return
+        if ports is None:
+            targets = dict((host, None) for host in targets)
+        cluster_id = config.get_cur_cluster_id()
+        log_dir = config.get_path_of_fb(cluster_id)['sr2_redis_log']
+        results = LogGrep(
+            targets,
+            log_dir,
+            str(pattern),
+            since=since_digits,
+            until=until_digits,
+            backup=backup,
+            max_lines=n
+        ).run()
+        found = []
+        for result in results:
+            if not result.ok:
+                msg = message.get('error_log_grep')
+                logger.error(msg.format(
+                    host=result.args[0],
+                    error=result.error
+                ))
+                continue
+            found.append(result.value)
+        for host, port, line in merge_results(found):
+            print(format_line(host, port, line))
+        meta = [['HOST', 'PORT', 'MATCHES']]
+        for result in found:
+            for port in sorted(result.counts):
+                meta.append([result.host, port, result.counts[port]])
+            if result.total > n:
+                msg = message.get('log_grep_truncated')
+                logger.warning(msg.format(
+                    host=result.host,
+                    n=n,
+                    total=result.total
+                ))
+        meta.append(['TOTAL', '-', sum(r.total for r in found)])
+        utils.print_table(meta)
@@ -0,0 +1,288 @@
+import json
+import os
+import time
+
+import hiredis
+
+from ltcli import color, net, parallel, utils
+from ltcli.log import logger
+from ltcli.redistrib2.connection import ConnectionPool
+from ltcli.stats import parse_info
+
+
+ERR_BGSAVE_IN_PROGRESS = 'in progress'
+CATALOG_FILE = 'catalog.json'
+
+
+class SnapshotEntry(object):
+    """Snapshot of an instance
+    """
+
+    def __init__(self, host, ip, port):
+        self.host = host
+        self.ip = ip
+        self.port = port
+        self.role = None
+        self.src = None
+        self.path = None
+        self.size = 0
+        self.sha256 = None
+        self.last_save = 0
+        self.elapsed = 0.0
+
+    @property
+    def addr(self):
+        return '{}:{}'.format(self.ip, self.port)
+
+    def to_dict(self):
+        return {
+            'addr': self.addr,
+            'host': self.host,
+            'role': self.role,
+            'src': self.src,
+            'path': self.path,
+            'size': self.size,
+            'sha256': self.sha256,
+            'last_save': self.last_save,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+class ClusterSnapshot(object):
+    """Take BGSAVE of instances concurrently and collect dump files
+
+    Instances are saved at most max_per_host at a time on a host, so that
+    disk I/O of a host is not saturated. Completion is tracked with
+    'rdb_bgsave_in_progress' and 'rdb_last_bgsave_status' of
+    'INFO persistence'. Then the dump file is linked (or copied if link is
+    not possible) into catalog directory of the host with its size and
+    checksum.
+    """
+
+    def __init__(self, targets, catalog_path, max_per_host=1, timeout=3600,
+                 interval=1, copy=False):
+        """
+        :param targets: list of (type, host, ip, port). See stats.get_targets
+        :param catalog_path: directory of snapshot. Same path on all hosts
+        :param max_per_host: maximum number of concurrent BGSAVE of a host
+        :param timeout: maximum time(sec) to wait for BGSAVE of an instance
+        :param interval: polling interval(sec) of BGSAVE status
+        :param copy: If true, copy dump file instead of hard link
+        """
+        self.targets = targets
+        self.catalog_path = catalog_path
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.interval = interval
+        self.copy = copy
+        self.pool = ConnectionPool(timeout=10, max_idle=1)
+        self.ssh_pool = net.SSHPool()
+
+    def _persistence(self, entry):
+        out = self.pool.execute(entry.ip, entry.port, 'info', 'persistence')
+        return parse_info(out)
+
+    def _role(self, target):
+        _, _, ip, port = target
+        return self.pool.execute(ip, port, 'role')[0]
+
+    def select(self, role='master'):
+        """Filter targets by current role (not role in props)
+
+        :param role: 'master' or 'slave'
+        :return: list of SnapshotEntry
+        """
+        entries = []
+        for result in parallel.run(self._role, self.targets):
+            _, host, ip, port = result.args[0]
+            if not result.ok:
+                logger.warning('{}:{}: {}'.format(ip, port, result.error))
+                continue
+            if result.value != role:
+                continue
+            entry = SnapshotEntry(host, ip, port)
+            entry.role = result.value
+            entries.append(entry)
+        return entries
+
+    def _wait_bgsave(self, entry, start, last_save):
+        while True:
+            info = self._persistence(entry)
+            done = info.get('rdb_bgsave_in_progress') == 0
+            if done and info.get('rdb_last_save_time', 0) != last_save:
+                if info.get('rdb_last_bgsave_status') != 'ok':
+                    msg = 'bgsave failed: {}'.format(entry.addr)
+                    raise RuntimeError(msg)
+                return info['rdb_last_save_time']
+            if time.time() - start > self.timeout:
+                msg = 'bgsave of {} is not completed in {}s'
+                raise RuntimeError(msg.format(entry.addr, self.timeout))
+            time.sleep(self.interval)
+
+    def _bgsave(self, entry):
+        start = time.time()
+        while True:
+            info = self._persistence(entry)
+            # saving not started by us may not include latest writes. wait
+            # for it and start new one
+            if info.get('rdb_bgsave_in_progress') != 1:
+                last_save = info.get('rdb_last_save_time', 0)
+                # last save time is in seconds. make sure it changes
+                if last_save >= int(time.time()):
+                    time.sleep(1)
+                try:
+                    self.pool.execute(entry.ip, entry.port, 'bgsave')
+                    break
+                except hiredis.ReplyError as ex:
+                    # started by other between INFO and BGSAVE
+                    if ERR_BGSAVE_IN_PROGRESS not in str(ex):
+                        raise
+            if time.time() - start > self.timeout:
+                msg = 'bgsave of {} is not started in {}s'
+                raise RuntimeError(msg.format(entry.addr, self.timeout))
+            time.sleep(self.interval)
+        entry.last_save = self._wait_bgsave(entry, start, last_save)
+
+    def _collect(self, entry):
+        _, dump_dir = self.pool.execute(
+            entry.ip,
+            entry.port,
+            'config',
+            'get',
+            'dir'
+        )
+        _, dbfilename = self.pool.execute(
+            entry.ip,
+            entry.port,
+            'config',
+            'get',
+            'dbfilename'
+        )
+        entry.src = os.path.join(dump_dir, dbfilename)
+        entry.path = os.path.join(
+            self.catalog_path,
+            '{}-{}.rdb'.format(entry.host, entry.port)
+        )
+        # rdb is replaced by rename, so linked file is not changed
+        # by next save
+        if self.copy:
+            transfer = 'cp {0} {1}'
+        else:
+            transfer = '(ln -f {0} {1} 2>/dev/null || cp {0} {1})'
+        command = ' && '.join([
+            'mkdir -p {2}',
+            transfer,
+            'stat -c %s {1}',
+            'sha256sum {1} | cut -d" " -f1',
+        ]).format(entry.src, entry.path, self.catalog_path)
+        client = self.ssh_pool.get(entry.host)
+        _, stdout, _ = net.ssh_execute(client, command)
+        size, checksum = stdout.split()
+        entry.size = int(size)
+        entry.sha256 = checksum
+
+    def _snapshot_one(self, entry):
+        start = time.time()
+        logger.info('bgsave {}'.format(entry.addr))
+        self._bgsave(entry)
+        self._collect(entry)
+        entry.elapsed = time.time() - start
+        logger.info(' - {} OK ({:.2f}s)'.format(entry.addr, entry.elapsed))
+        return entry
+
+    def run(self, entries):
+        """
+        :param entries: list of SnapshotEntry. See select
+        :return: list of parallel.Result. args[0] is SnapshotEntry
+        """
+        return parallel.run(
+            self._snapshot_one,
+            entries,
+            key=lambda entry: entry.host,
+            max_per_key=self.max_per_host
+        )
+
+    def close(self):
+        self.pool.close()
+        self.ssh_pool.close()
+
+
+def save_catalog(path, cluster_id, tag, results):
+    """Write catalog of snapshot as json
+
+    :param path: catalog file path
+    :param cluster_id: cluster id
+    :param tag: tag of snapshot
+    :param results: return value of ClusterSnapshot.run
+    """
+    catalog = {
+        'cluster_id': cluster_id,
+        'tag': tag,
+        'created': int(time.time()),
+        'complete': all(result.ok for result in results),
+        'instances': [r.args[0].to_dict() for r in results if r.ok],
+        'failed': [
+            {'addr': r.args[0].addr, 'error': str(r.error)}
+            for r in results if not r.ok
+        ],
+    }
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as fd:
+        json.dump(catalog, fd, indent=2, sort_keys=True)
+    return catalog
+
+
+def load_catalogs(snapshot_path):
+    """
+    :param snapshot_path: directory which has snapshot directories
+    :return: list of catalog(dict) sorted by tag
+    """
+    catalogs = []
+    if not os.path.isdir(snapshot_path):
+        return catalogs
+    for name in sorted(os.listdir(snapshot_path)):
+        path = os.path.join(snapshot_path, name, CATALOG_FILE)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'r') as fd:
+            catalogs.append(json.load(fd))
+    return catalogs
+
+
+def print_results(results):
+    meta = [['ADDR', 'RESULT', 'SIZE', 'SHA256', 'TIME(s)']]
+    for result in results:
+        entry = result.args[0]
+        if not result.ok:
+            meta.append([entry.addr, color.red('FAIL'), '-', '-', '-'])
+            logger.error('{}: {}'.format(entry.addr, result.error))
+            continue
+        meta.append([
+            entry.addr,
+            color.green('OK'),
+            utils.int_2_bytes(entry.size),
+            entry.sha256[:16],
+            '{:.2f}'.format(entry.elapsed),
+        ])
+    utils.print_table(meta)
+
+
+def print_catalogs(catalogs):
+    meta = [['TAG', 'CREATED', 'INSTANCES', 'SIZE', 'COMPLETE']]
+    for catalog in catalogs:
+        size = sum(i['size'] for i in catalog['instances'])
+        created = time.strftime(
+            '%Y-%m-%d %H:%M:%S',
+            time.localtime(catalog['created'])
+        )
+        complete = catalog['complete']
+        meta.append([
+            catalog['tag'],
+            created,
+            len(catalog['instances']),
+            utils.int_2_bytes(size),
+            color.green('OK') if complete else color.red('PARTIAL'),
+        ])
+    utils.print_table(meta)
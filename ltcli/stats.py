@@ -0,0 +1,231 @@
+import socket
+import time
+
+import six
+
+from ltcli import config, parallel
+from ltcli.log import logger
+from ltcli.redistrib2.connection import ConnectionPool
+
+
+INFO_SECTIONS = ['stats', 'memory', 'keyspace', 'tablespace', 'replication']
+
+
+def _convert(value):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_info(text):
+    """Parse output of 'INFO'
+
+    'key:value' becomes {key: value}. A value like 'a=1,b=2'
+    (slaveN, dbN, table stats) becomes a dict.
+
+    :param text: output string of 'INFO'
+    :return: dict
+    """
+    ret = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        if '=' in value:
+            d = {}
+            for item in value.split(','):
+                if '=' not in item:
+                    continue
+                k, v = item.split('=', 1)
+                d[k] = _convert(v)
+            ret[key] = d
+        else:
+            ret[key] = _convert(value)
+    return ret
+
+
+def get_targets(cluster_id=None, slave=True):
+    """Get redis instances of cluster from props
+
+    :param cluster_id: target cluster #
+    :param slave: If true, include slave instances
+    :return: list of (type, host, ip, port). type is 'Master' or 'Slave'
+    """
+    if cluster_id is None:
+        cluster_id = config.get_cur_cluster_id()
+    targets = []
+    m_hosts = config.get_master_host_list(cluster_id)
+    m_ports = config.get_master_port_list(cluster_id)
+    for host in m_hosts:
+        ip = socket.gethostbyname(host)
+        for port in m_ports:
+            targets.append(('Master', host, ip, port))
+    if slave:
+        s_hosts = config.get_slave_host_list(cluster_id)
+        s_ports = config.get_slave_port_list(cluster_id)
+        for host in s_hosts:
+            ip = socket.gethostbyname(host)
+            for port in s_ports:
+                targets.append(('Slave', host, ip, port))
+    return targets
+
+
+def get_total_rows(info):
+    """Sum of totalRows, evictedRows of all tables in info"""
+    rows = 0
+    evicted = 0
+    for value in info.values():
+        if isinstance(value, dict) and 'totalRows' in value:
+            rows += value.get('totalRows', 0)
+            evicted += value.get('evictedRows', 0)
+    return rows, evicted
+
+
+def get_key_count(info):
+    """Sum of keys of all db in info"""
+    count = 0
+    for key, value in info.items():
+        if key.startswith('db') and isinstance(value, dict):
+            count += value.get('keys', 0)
+    return count
+
+
+class NodeStat(object):
+    """Snapshot of 'INFO' of a redis instance
+    """
+
+    def __init__(self, m_s, host, ip, port):
+        self.m_s = m_s
+        self.host = host
+        self.ip = ip
+        self.port = port
+        self.info = {}
+        self.error = None
+        self.timestamp = 0.0
+        self.ops = 0.0
+        self.rows = 0.0
+        self.evictions = 0.0
+        self.repl_lag = 0
+
+    @property
+    def addr(self):
+        return '{}:{}'.format(self.ip, self.port)
+
+    @property
+    def alive(self):
+        return self.error is None
+
+    @property
+    def role(self):
+        return self.info.get('role', '-')
+
+    @property
+    def used_memory(self):
+        return self.info.get('used_memory', 0)
+
+    @property
+    def total_rows(self):
+        return get_total_rows(self.info)[0]
+
+    @property
+    def keys(self):
+        return get_key_count(self.info)
+
+    def update_rates(self, prev):
+        """Calculate rates(per second) using previous snapshot
+
+        :param prev: previous NodeStat of same instance
+        """
+        if prev is None or not prev.alive or not self.alive:
+            return
+        elapsed = self.timestamp - prev.timestamp
+        if elapsed <= 0:
+            return
+
+        def rate(cur, old):
+            return max(cur - old, 0) / elapsed
+
+        cur_rows, cur_evicted = get_total_rows(self.info)
+        old_rows, old_evicted = get_total_rows(prev.info)
+        self.ops = rate(
+            self.info.get('total_commands_processed', 0),
+            prev.info.get('total_commands_processed', 0)
+        )
+        self.rows = rate(cur_rows, old_rows)
+        self.evictions = rate(
+            self.info.get('evicted_keys', 0) + cur_evicted,
+            prev.info.get('evicted_keys', 0) + old_evicted
+        )
+
+
+def update_repl_lag(stats):
+    """Set replication lag(bytes) of each slave using offset of master
+
+    :param stats: list of NodeStat
+    """
+    master_offset = {}
+    for stat in stats:
+        if stat.alive and stat.role == 'master':
+            master_offset[stat.addr] = stat.info.get('master_repl_offset', 0)
+    for stat in stats:
+        if not stat.alive or stat.role != 'slave':
+            continue
+        m_addr = '{}:{}'.format(
+            stat.info.get('master_host'),
+            stat.info.get('master_port')
+        )
+        if m_addr not in master_offset:
+            continue
+        offset = stat.info.get('slave_repl_offset', 0)
+        stat.repl_lag = max(master_offset[m_addr] - offset, 0)
+
+
+class StatCollector(object):
+    """Poll 'INFO' of all redis instances concurrently
+
+    Connections are kept in pool between polls.
+    """
+
+    def __init__(self, targets, sections=None, timeout=3, cluster_info=False):
+        self.targets = targets
+        self.sections = sections or INFO_SECTIONS
+        self.pool = ConnectionPool(timeout=timeout, max_idle=1)
+        self.prev = {}
+        self._commands = [['info', section] for section in self.sections]
+        if cluster_info:
+            self._commands.append(['cluster', 'info'])
+
+    def _collect_one(self, m_s, host, ip, port):
+        stat = NodeStat(m_s, host, ip, port)
+        try:
+            outs = self.pool.execute_bulk(ip, port, self._commands)
+            for out in outs:
+                if isinstance(out, six.string_types):
+                    stat.info.update(parse_info(out))
+        except Exception as ex:
+            logger.debug('info {}:{} fail: {}'.format(ip, port, ex))
+            stat.error = ex
+        stat.timestamp = time.time()
+        return stat
+
+    def collect(self):
+        """Get snapshot of all instances and calculate rates
+
+        :return: list of NodeStat
+        """
+        results = parallel.run(self._collect_one, self.targets)
+        stats = [result.value for result in results]
+        for stat in stats:
+            stat.update_rates(self.prev.get(stat.addr))
+        update_repl_lag(stats)
+        self.prev = dict((stat.addr, stat) for stat in stats)
+        return stats
+
+    def close(self):
+        self.pool.close()
@@ -208,10 +208,12 @@ def open_vim_editor(target='config'):
     editor.edit(full_path)
 
 
-def make_export_envs(ip, port):
+def make_export_envs(ip, port, table=None):
     """Make export env
+
+    :param table: config.InstanceTable. Pass it when called for many nodes
     """
-    envs = config.get_env_dict(ip, port)
+    envs = config.get_env_dict(ip, port, table)
     cmd = '''\
 export SR2_REDIS_HOME={sr2_redis_home} ; \
 export SR2_REDIS_BIN={sr2_redis_bin} ; \
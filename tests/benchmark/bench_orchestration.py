@@ -0,0 +1,260 @@
+"""Benchmark of cluster orchestration with simulated hosts
+
+Run 'cluster start/stop/restart/clean' and sync of conf against N hosts
+in process (see fake_hosts), and print wall time, ssh sessions opened,
+ssh exec count, sftp operations and local subprocess count of each.
+Fixed sleep of polling loops is not slept but summed in SLEEP(s).
+
+    python -m tests.benchmark.bench_orchestration
+    python -m tests.benchmark.bench_orchestration --hosts 1,10 \\
+        --instances 20 --latency 0.005 --json result.json
+
+No redis, ssh server or installed cluster is needed. Cluster creation
+needs redis endpoints and is not measured here.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tests.benchmark.fake_hosts import SimulatedHosts
+
+
+CLUSTER_ID = 1
+BASE_PORT = 18100
+OPS = ['check', 'sync', 'start', 'restart', 'stop', 'clean']
+
+
+class _Time(object):
+    """time module of which sleep is counted, not slept"""
+
+    def __init__(self, counter):
+        self._counter = counter
+
+    def sleep(self, sec):
+        self._counter.add('sleep', sec)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def _host_names(count):
+    # ip address, so that net.get_ip does not resolve
+    return ['10.254.{}.{}'.format(i // 250, i % 250 + 1) for i in range(count)]
+
+
+def _make_props(hosts, instances, replicas):
+    m_ports = list(range(BASE_PORT, BASE_PORT + instances))
+    s_base = BASE_PORT + 50
+    s_ports = list(range(s_base, s_base + instances * replicas))
+    return {
+        'sr2_redis_master_hosts': list(hosts),
+        'sr2_redis_master_ports': m_ports,
+        'sr2_redis_slave_hosts': list(hosts) if replicas else [],
+        'sr2_redis_slave_ports': s_ports,
+        'ssd_count': 3,
+        'sr2_redis_data': '/sata_ssd/ssd_',
+        'sr2_redis_db_path': '/sata_ssd/ssd_',
+        'sr2_flash_db_path': '/sata_ssd/ssd_',
+    }
+
+
+def _write_props(path, props):
+    lines = []
+    for key in sorted(props.keys()):
+        value = props[key]
+        if isinstance(value, list):
+            value = '( {} )'.format(' '.join('"{}"'.format(v) for v in value))
+        lines.append('export {}={}'.format(key.upper(), value))
+    with open(path, 'w') as fd:
+        fd.write('\n'.join(lines) + '\n')
+
+
+def setup_env(root):
+    fbpath = os.path.join(root, 'fbpath')
+    base_directory = os.path.join(root, 'base')
+    os.makedirs(fbpath)
+    os.makedirs(base_directory)
+    with open(os.path.join(fbpath, 'config'), 'w') as fd:
+        fd.write('base_directory: {}\n'.format(base_directory))
+    with open(os.path.join(fbpath, 'HEAD'), 'w') as fd:
+        fd.write(str(CLUSTER_ID))
+    os.environ['FBPATH'] = fbpath
+    os.environ.setdefault('USER', 'ltcli')
+
+
+def _setup_cluster(hosts, instances, replicas):
+    """Local conf of cluster. Return props and paths to exist on hosts"""
+    from ltcli import config
+
+    path_of_fb = config.get_path_of_fb(CLUSTER_ID)
+    # generated files of previous run are not counted
+    shutil.rmtree(path_of_fb['cluster_path'], ignore_errors=True)
+    for key in ['conf_path', 'sr2_redis_conf']:
+        if not os.path.isdir(path_of_fb[key]):
+            os.makedirs(path_of_fb[key])
+    with open(path_of_fb['master_template'], 'w') as fd:
+        fd.write('port $SR2_REDIS_PORT\ndir $SR2_REDIS_DATA\n')
+    props = _make_props(hosts, instances, replicas)
+    _write_props(path_of_fb['redis_properties'], props)
+    remote_paths = [
+        path_of_fb['cluster_path'],
+        path_of_fb['conf_path'],
+        path_of_fb['sr2_redis_conf'],
+    ]
+    return props, remote_paths
+
+
+def _run_op(op):
+    from ltcli.center import Center
+    from ltcli.cluster import Cluster
+
+    if op in ['check', 'sync']:
+        center = Center()
+        center.update_ip_port()
+        if op == 'check':
+            return center.check_hosts_connection()
+        return center.sync_conf()
+    cluster = Cluster()
+    if op == 'start':
+        return cluster.start()
+    if op == 'stop':
+        return cluster.stop()
+    if op == 'restart':
+        return cluster.restart()
+    if op == 'clean':
+        return cluster.clean()
+    raise ValueError(op)
+
+
+def run(host_count, instances, replicas, latency, exec_cost, ops):
+    """
+    :return: list of dict of each op
+    """
+    from ltcli import center, cluster, config
+
+    hosts = _host_names(host_count)
+    props, remote_paths = _setup_cluster(hosts, instances, replicas)
+    props_path = config.get_path_of_fb(CLUSTER_ID)['redis_properties']
+    get_props_as_dict = config.get_props_as_dict
+
+    # arrays of props need bash. props are given, not parsed
+    def _get_props_as_dict(path):
+        if path == props_path:
+            return dict(props)
+        return get_props_as_dict(path)
+
+    sim = SimulatedHosts(hosts, latency=latency, exec_cost=exec_cost)
+    sim.add_paths(remote_paths)
+    saved = (config.get_props_as_dict, center.time, cluster.time)
+    config.get_props_as_dict = _get_props_as_dict
+    center.time = cluster.time = _Time(sim.counter)
+    stdout = sys.stdout
+    records = []
+    try:
+        with sim:
+            for op in ops:
+                sim.counter.reset()
+                error = None
+                sys.stdout = open(os.devnull, 'w')
+                start = time.time()
+                try:
+                    _run_op(op)
+                except Exception as ex:
+                    error = '{}: {}'.format(type(ex).__name__, ex)
+                elapsed = time.time() - start
+                sys.stdout.close()
+                sys.stdout = stdout
+                record = {
+                    'hosts': host_count,
+                    'instances': host_count * instances * (1 + replicas),
+                    'op': op,
+                    'elapsed': elapsed,
+                    'alive': sim.alive(),
+                    'error': error,
+                }
+                record.update(sim.counter.to_dict())
+                records.append(record)
+    finally:
+        sys.stdout = stdout
+        config.get_props_as_dict, center.time, cluster.time = saved
+    return records
+
+
+def print_records(records):
+    from ltcli import color, utils
+
+    meta = [[
+        'HOSTS', 'INSTANCES', 'OP', 'RESULT', 'TIME(s)', 'SLEEP(s)',
+        'SESSIONS', 'EXECS', 'SFTP', 'SUBPROCESS'
+    ]]
+    for r in records:
+        meta.append([
+            r['hosts'],
+            r['instances'],
+            r['op'],
+            color.green('OK') if r['error'] is None else color.red('FAIL'),
+            '{:.2f}'.format(r['elapsed']),
+            '{:.0f}'.format(r['sleep']),
+            r['sessions'],
+            r['execs'],
+            r['sftp'],
+            r['subprocess'],
+        ])
+    utils.print_table(meta)
+    for r in records:
+        if r['error'] is not None:
+            print('{} hosts, {}: {}'.format(r['hosts'], r['op'], r['error']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hosts', default='1,10,50,200',
+                        help='comma separated numbers of hosts')
+    parser.add_argument('--instances', type=int, default=10,
+                        help='master instances per host')
+    parser.add_argument('--replicas', type=int, default=0,
+                        help='slaves per master')
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help='round trip time(sec) to a host')
+    parser.add_argument('--exec-cost', type=float, default=0.002,
+                        help='time(sec) to run a command on a host')
+    parser.add_argument('--ops', default=','.join(OPS),
+                        help='comma separated ops. {}'.format(OPS))
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    ops = args.ops.split(',')
+    for op in ops:
+        if op not in OPS:
+            parser.error('unknown op: {}'.format(op))
+    root = tempfile.mkdtemp(prefix='ltcli-bench-')
+    try:
+        setup_env(root)
+        from ltcli import log
+        log.stream_handler.level = log.get_log_code('error')
+        records = []
+        for count in [int(x) for x in args.hosts.split(',')]:
+            records += run(
+                count,
+                args.instances,
+                args.replicas,
+                args.latency,
+                args.exec_cost,
+                ops
+            )
+        print_records(records)
+        if args.json:
+            with open(args.json, 'w') as fd:
+                json.dump(records, fd, indent=2, sort_keys=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
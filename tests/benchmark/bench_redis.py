@@ -0,0 +1,293 @@
+"""Benchmark of cluster operations against simulated redis instances
+
+Python 3.5 or later. Build a cluster of simulated instances (see
+redis_sim) with redistrib2 and measure create, replicate, slot migration,
+fix of interrupted migration, weighted rebalance, rescue of lost slots,
+Center.get_master_obj_list and failover. Migration and rebalance report
+keys/sec and failover reports time until all slaves are promoted.
+
+    python -m tests.benchmark.bench_redis
+    python -m tests.benchmark.bench_redis --masters 3,50 --replicas 1 \\
+        --keys-per-slot 20 --latency 0.0005 --json result.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tests.benchmark.bench_orchestration import CLUSTER_ID, setup_env
+from tests.benchmark.redis_sim import ClusterSimulator
+
+
+OPS = ['create', 'replicate', 'migrate', 'fix_migrating', 'rebalance',
+       'rescue', 'nodes', 'failover']
+
+
+class _Bench(object):
+    def __init__(self, sim, masters, replicas, keys_per_slot,
+                 migrate_slots):
+        addrs = sim.addrs
+        self.sim = sim
+        self.masters = addrs[:masters]
+        self.slaves = addrs[masters:-1]
+        # not in cluster until rescue
+        self.spare = addrs[-1]
+        self.replicas = replicas
+        self.keys_per_slot = keys_per_slot
+        self.migrate_slots = migrate_slots
+
+    def op_create(self):
+        from ltcli.redistrib2 import command
+
+        command.create(self.masters)
+        return {}
+
+    def op_replicate(self):
+        from ltcli.redistrib2 import command
+
+        for i, (host, port) in enumerate(self.slaves):
+            m_host, m_port = self.masters[i % len(self.masters)]
+            command.replicate(m_host, m_port, host, port)
+        return {}
+
+    def op_migrate(self):
+        from ltcli.redistrib2 import command
+
+        self.sim.fill(self.keys_per_slot)
+        (src_host, src_port), (dst_host, dst_port) = self.masters[:2]
+        node = self.sim.node(src_host, src_port)
+        slots = sorted(
+            slot for slot, owner in enumerate(self.sim.owner)
+            if owner == node.node_id
+        )[:self.migrate_slots]
+        self.sim.reset_stat()
+        command.migrate_slots(src_host, src_port, dst_host, dst_port, slots)
+        return {'keys': self.sim.stat['migrated']}
+
+    def op_fix_migrating(self):
+        from ltcli.redistrib2 import command
+
+        (src_host, src_port), (dst_host, dst_port) = self.masters[:2]
+        src = self.sim.node(src_host, src_port)
+        dst = self.sim.node(dst_host, dst_port)
+        slots = [
+            slot for slot, owner in enumerate(self.sim.owner)
+            if owner == src.node_id
+        ][:self.migrate_slots]
+
+        # interrupted migration
+        def _interrupt():
+            for slot in slots:
+                src.migrating[slot] = dst.node_id
+                dst.importing[slot] = src.node_id
+
+        self.sim.call(_interrupt)
+        self.sim.reset_stat()
+        command.fix_migrating(src_host, src_port)
+        return {'keys': self.sim.stat['migrated']}
+
+    def op_rebalance(self):
+        from ltcli.redistrib2.custom_trib import rebalance_cluster_cmd
+
+        self.sim.fill(self.keys_per_slot)
+        host, port = self.masters[0]
+        # first master gets twice as many slots as others
+        weights = {self.sim.node(host, port).node_id: 2}
+        self.sim.reset_stat()
+        rebalance_cluster_cmd(host, port, weights=weights)
+        return {'keys': self.sim.stat['migrated']}
+
+    def op_rescue(self):
+        from ltcli.redistrib2 import command
+
+        if len(self.masters) < 2:
+            raise RuntimeError('rescue needs 2 or more masters')
+        host, port = self.masters[0]
+        lost = self.sim.node(*self.masters[-1])
+
+        # slots of the last master are lost with its keys
+        def _lose():
+            slots = 0
+            for slot, owner in enumerate(self.sim.owner):
+                if owner == lost.node_id:
+                    self.sim.set_owner(slot, None)
+                    slots += 1
+            lost.keys = {}
+            return slots
+
+        slots = self.sim.call(_lose)
+        self.sim.reset_stat()
+        subst_host, subst_port = self.spare
+        command.rescue_cluster(host, port, subst_host, subst_port)
+        return {'slots': slots}
+
+    def op_nodes(self):
+        from ltcli.center import Center
+
+        center = Center()
+        center.cluster_id = CLUSTER_ID
+        center.master_host_list = sorted(set(h for h, _ in self.masters))
+        center.master_port_list = [p for _, p in self.masters]
+        center.slave_host_list = sorted(set(h for h, _ in self.slaves))
+        center.slave_port_list = [p for _, p in self.slaves]
+        masters = center.get_master_obj_list()
+        return {'nodes': len(masters)}
+
+    def op_failover(self):
+        from ltcli import failover
+
+        if not self.slaves:
+            raise RuntimeError('no slave. set --replicas')
+        addrs = []
+        # a slave per master
+        for host, port in self.slaves[:len(self.masters)]:
+            addrs.append('{}:{}'.format(host, port))
+        results = failover.failover(addrs, max_per_host=len(addrs))
+        failed = [r for r in results if not r.ok]
+        if failed:
+            raise RuntimeError('{}: {}'.format(failed[0].addr,
+                                               failed[0].error))
+        return {
+            'nodes': len(results),
+            'max_failover': max(r.elapsed for r in results),
+        }
+
+
+def run(masters, replicas, keys_per_slot, migrate_slots, latency,
+        migrate_cost, failover_delay, ops):
+    """
+    :return: list of dict of each op
+    """
+    count = masters * (1 + replicas)
+    # and a spare for rescue
+    sim = ClusterSimulator(
+        count + 1,
+        latency=latency,
+        migrate_cost=migrate_cost,
+        failover_delay=failover_delay
+    ).start()
+    bench = _Bench(sim, masters, replicas, keys_per_slot, migrate_slots)
+    stdout = sys.stdout
+    records = []
+    try:
+        for op in ops:
+            sim.reset_stat()
+            error = None
+            value = {}
+            # '#' of slot migration
+            sys.stdout = open(os.devnull, 'w')
+            start = time.time()
+            try:
+                value = getattr(bench, 'op_' + op)()
+            except Exception as ex:
+                error = '{}: {}'.format(type(ex).__name__, ex)
+            elapsed = time.time() - start
+            sys.stdout.close()
+            sys.stdout = stdout
+            record = {
+                'instances': count,
+                'op': op,
+                'elapsed': elapsed,
+                'error': error,
+                'keys': 0,
+                'slots': 0,
+                'nodes': 0,
+                'max_failover': 0.0,
+                'connections': sim.stat['connections'],
+                'commands': sim.stat['commands'],
+            }
+            record.update(value)
+            records.append(record)
+    finally:
+        sys.stdout = stdout
+        sim.stop()
+    return records
+
+
+def print_records(records):
+    from ltcli import color, utils
+
+    meta = [[
+        'INSTANCES', 'OP', 'RESULT', 'TIME(s)', 'KEYS', 'KEYS/s', 'SLOTS',
+        'MAX FAILOVER(s)', 'CONNECTIONS', 'COMMANDS'
+    ]]
+    for r in records:
+        rate = '-'
+        if r['keys'] and r['elapsed'] > 0:
+            rate = '{:.0f}'.format(r['keys'] / r['elapsed'])
+        max_failover = '-'
+        if r['max_failover']:
+            max_failover = '{:.2f}'.format(r['max_failover'])
+        meta.append([
+            r['instances'],
+            r['op'],
+            color.green('OK') if r['error'] is None else color.red('FAIL'),
+            '{:.2f}'.format(r['elapsed']),
+            r['keys'] or '-',
+            rate,
+            r['slots'] or '-',
+            max_failover,
+            r['connections'],
+            r['commands'],
+        ])
+    utils.print_table(meta)
+    for r in records:
+        if r['error'] is not None:
+            print('{} instances, {}: {}'.format(r['instances'], r['op'],
+                                                r['error']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--masters', default='3,30,100',
+                        help='comma separated numbers of masters')
+    parser.add_argument('--replicas', type=int, default=1,
+                        help='slaves per master')
+    parser.add_argument('--keys-per-slot', type=int, default=10)
+    parser.add_argument('--migrate-slots', type=int, default=64,
+                        help='number of slots to migrate')
+    parser.add_argument('--latency', type=float, default=0.0002,
+                        help='round trip time(sec) to an instance')
+    parser.add_argument('--migrate-cost', type=float, default=0.00001,
+                        help='time(sec) to migrate a key')
+    parser.add_argument('--failover-delay', type=float, default=0.1,
+                        help='time(sec) from CLUSTER FAILOVER to promotion')
+    parser.add_argument('--ops', default=','.join(OPS),
+                        help='comma separated ops. {}'.format(OPS))
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    ops = args.ops.split(',')
+    for op in ops:
+        if op not in OPS:
+            parser.error('unknown op: {}'.format(op))
+    root = tempfile.mkdtemp(prefix='ltcli-bench-')
+    try:
+        setup_env(root)
+        from ltcli import log
+        log.stream_handler.level = log.get_log_code('error')
+        records = []
+        for masters in [int(x) for x in args.masters.split(',')]:
+            records += run(
+                masters,
+                args.replicas,
+                args.keys_per_slot,
+                args.migrate_slots,
+                args.latency,
+                args.migrate_cost,
+                args.failover_delay,
+                ops
+            )
+        print_records(records)
+        if args.json:
+            with open(args.json, 'w') as fd:
+                json.dump(records, fd, indent=2, sort_keys=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Simulated hosts for benchmark
+
+paramiko.SSHClient is replaced with FakeSSHClient, so net.get_ssh,
+net.SSHPool and everything above them run unchanged. Each host has a fake
+process table and a set of existing paths, and answers the commands ltcli
+sends (ps | grep | wc -l, kill, redis-server, mkdir, rm, [ -e ]...).
+Connect and exec cost configurable time, and are counted.
+"""
+import io
+import re
+import subprocess
+import time
+from threading import Lock
+
+import paramiko
+
+
+_sleep = time.sleep
+
+PORT_FILTER = re.compile(r"egrep '\(([^)]*)\)'")
+CONF_PORT = re.compile(r'redis-(\d+)\.conf')
+TEST_PATH = re.compile(r"\[ -[de] '([^']+)' \]")
+
+
+class Counter(object):
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.sessions = 0
+            self.execs = 0
+            self.sftp = 0
+            self.subprocess = 0
+            self.sleep = 0.0
+
+    def add(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self):
+        return {
+            'sessions': self.sessions,
+            'execs': self.execs,
+            'sftp': self.sftp,
+            'subprocess': self.subprocess,
+            'sleep': self.sleep,
+        }
+
+
+class FakeHost(object):
+    """Process table and files of a host"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = Lock()
+        self.procs = {}
+        self.paths = set()
+        self._next_pid = 1000
+
+    def exists(self, path):
+        path = path.rstrip('/')
+        if path in self.paths:
+            return True
+        prefix = path + '/'
+        return any(p.startswith(prefix) for p in self.paths)
+
+    def _ports(self, command):
+        match = PORT_FILTER.search(command)
+        if not match:
+            return set()
+        return set(int(p.strip(':')) for p in match.group(1).split('|'))
+
+    def execute(self, command):
+        """
+        :return: (exit status, stdout)
+        """
+        with self.lock:
+            if 'redis-rdb-to-slaves' in command:
+                return 0, '0\n'
+            if command.startswith('kill '):
+                for port in self._ports(command):
+                    self.procs.pop(port, None)
+                return 0, ''
+            if 'ps -ef' in command:
+                ports = self._ports(command)
+                alive = [p for p in self.procs if p in ports]
+                return 0, '{}\n'.format(len(alive))
+            if 'redis-server' in command:
+                for port in CONF_PORT.findall(command):
+                    self._next_pid += 1
+                    self.procs[int(port)] = self._next_pid
+                return 0, ''
+            tests = TEST_PATH.findall(command)
+            if tests and 'echo True' in command:
+                ok = all(self.exists(path) for path in tests)
+                return 0, '{}\n'.format(ok)
+            if command.startswith('mkdir -p'):
+                for path in command.split(';')[0].split()[2:]:
+                    self.paths.add(path.rstrip('/'))
+                return 0, ''
+            if 'rm -' in command:
+                args = command.split('rm -', 1)[1].split()[1:]
+                for path in args:
+                    path = path.replace('$SR2_REDIS_CONF', '')
+                    self.paths.discard(path)
+                return 0, ''
+            return 0, ''
+
+
+class _Stream(object):
+    def __init__(self, data=b'', channel=None):
+        self._buf = io.BytesIO(data)
+        self.channel = channel
+
+    def read(self, size=-1):
+        return self._buf.read(size)
+
+    def readline(self):
+        return self._buf.readline()
+
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+class _Channel(object):
+    def __init__(self, status, out=b'', err=b''):
+        self._status = status
+        self._out = io.BytesIO(out)
+        self._err = io.BytesIO(err)
+        self.closed = False
+
+    @staticmethod
+    def _ready(buf):
+        return buf.tell() < len(buf.getvalue())
+
+    def recv_ready(self):
+        return self._ready(self._out)
+
+    def recv(self, size):
+        return self._out.read(size)
+
+    def recv_stderr_ready(self):
+        return self._ready(self._err)
+
+    def recv_stderr(self, size):
+        return self._err.read(size)
+
+    def recv_exit_status(self):
+        return self._status
+
+    def exit_status_ready(self):
+        return True
+
+    def shutdown_write(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport(object):
+    def __init__(self, client):
+        self._client = client
+
+    def is_active(self):
+        return self._client.connected
+
+
+class FakeSFTP(object):
+    def __init__(self, hosts, host):
+        self._hosts = hosts
+        self._host = host
+
+    def _op(self):
+        self._hosts.counter.add('sftp')
+        self._hosts.wait(self._hosts.latency)
+
+    def stat(self, path):
+        self._op()
+        if not self._host.exists(path):
+            raise IOError(path)
+
+    def mkdir(self, path):
+        self._op()
+        with self._host.lock:
+            self._host.paths.add(path)
+
+    def put(self, local_path, remote_path):
+        self._op()
+        with self._host.lock:
+            self._host.paths.add(remote_path)
+
+    def putfo(self, fd, remote_path):
+        self.put(None, remote_path)
+
+    def get(self, remote_path, local_path):
+        self._op()
+
+    def listdir(self, path):
+        self._op()
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeSSHClient(object):
+    """Stand-in of paramiko.SSHClient. See SimulatedHosts"""
+
+    hosts = None
+
+    def __init__(self):
+        self.connected = False
+        self._host = None
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def load_system_host_keys(self):
+        pass
+
+    def connect(self, hostname, port=22, **kwargs):
+        hosts = self.hosts
+        host = hosts.get(hostname)
+        if host is None:
+            raise paramiko.ssh_exception.NoValidConnectionsError(
+                {(hostname, port): OSError('unknown host')}
+            )
+        hosts.counter.add('sessions')
+        # tcp handshake, key exchange and authentication
+        hosts.wait(hosts.latency * hosts.connect_round_trips)
+        self._host = host
+        self.connected = True
+
+    def exec_command(self, command):
+        hosts = self.hosts
+        hosts.counter.add('execs')
+        hosts.wait(hosts.latency + hosts.exec_cost)
+        status, out = self._host.execute(command)
+        out = out.encode('utf-8')
+        channel = _Channel(status, out)
+        stdout = _Stream(out, channel)
+        return _Stream(channel=channel), stdout, _Stream(channel=channel)
+
+    def get_transport(self):
+        return FakeTransport(self)
+
+    def open_sftp(self):
+        return FakeSFTP(self.hosts, self._host)
+
+    def close(self):
+        self.connected = False
+
+
+class _CountingPopen(subprocess.Popen):
+    counter = None
+
+    def __init__(self, *args, **kwargs):
+        self.counter.add('subprocess')
+        super(_CountingPopen, self).__init__(*args, **kwargs)
+
+
+class SimulatedHosts(object):
+    """Hosts answering ssh of ltcli in process
+
+    ex)
+        hosts = SimulatedHosts(['10.0.0.1', '10.0.0.2'], latency=0.001)
+        with hosts:
+            Cluster().start()
+        print(hosts.counter.to_dict())
+    """
+
+    def __init__(self, names, latency=0.001, exec_cost=0.002,
+                 connect_round_trips=4):
+        """
+        :param names: host names (use ip address, they are not resolved)
+        :param latency: round trip time(sec) between ltcli and a host
+        :param exec_cost: time(sec) to run a command on a host
+        :param connect_round_trips: round trips to open a ssh session
+        """
+        self.hosts = dict((name, FakeHost(name)) for name in names)
+        self.latency = latency
+        self.exec_cost = exec_cost
+        self.connect_round_trips = connect_round_trips
+        self.counter = Counter()
+        self._saved = None
+
+    def get(self, name):
+        return self.hosts.get(name)
+
+    def wait(self, sec):
+        if sec > 0:
+            _sleep(sec)
+
+    def add_paths(self, paths):
+        for host in self.hosts.values():
+            host.paths.update(paths)
+
+    def alive(self):
+        return sum(len(host.procs) for host in self.hosts.values())
+
+    def __enter__(self):
+        self._saved = (paramiko.SSHClient, subprocess.Popen)
+        FakeSSHClient.hosts = self
+        _CountingPopen.counter = self.counter
+        paramiko.SSHClient = FakeSSHClient
+        subprocess.Popen = _CountingPopen
+        return self
+
+    def __exit__(self, except_type, except_obj, tb):
+        paramiko.SSHClient, subprocess.Popen = self._saved
+        FakeSSHClient.hosts = None
+        return False
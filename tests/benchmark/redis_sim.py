@@ -0,0 +1,549 @@
+"""In process simulator of a redis cluster. Python 3.5 or later
+
+Each instance is an asyncio RESP server on 127.0.0.1, all served by one
+event loop on a background thread, so hundreds of instances run on one
+box. It answers the commands ltcli and redistrib2 send to build, migrate
+and fail over a cluster:
+
+    PING, INFO, ROLE, DBSIZE, BGSAVE, CONFIG GET/SET, MIGRATE,
+    CLUSTER NODES/INFO/MYID/MEET/ADDSLOTS/SETSLOT/GETKEYSINSLOT/
+    COUNTKEYSINSLOT/REPLICATE/FAILOVER/FORGET/RESET
+
+Gossip is not simulated. A node sees slots of all nodes it has met as
+soon as they change. CLUSTER FAILOVER returns at once and the slave is
+promoted after failover_delay.
+
+    sim = ClusterSimulator(6, latency=0.0005)
+    sim.start()
+    try:
+        command.create(sim.addrs[:3])
+    finally:
+        sim.stop()
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+
+import hiredis
+
+
+SLOT_COUNT = 16384
+HOST = '127.0.0.1'
+
+
+class Status(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+def encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, Status):
+        return '+{}\r\n'.format(reply).encode()
+    if isinstance(reply, Error):
+        return '-{}\r\n'.format(reply).encode()
+    if isinstance(reply, int):
+        return ':{}\r\n'.format(reply).encode()
+    if isinstance(reply, (list, tuple)):
+        items = [encode(i) for i in reply]
+        return b''.join(['*{}\r\n'.format(len(items)).encode()] + items)
+    if isinstance(reply, str):
+        reply = reply.encode()
+    return b''.join([
+        '${}\r\n'.format(len(reply)).encode(),
+        reply,
+        b'\r\n',
+    ])
+
+
+OK = Status('OK')
+
+
+class SimNode(object):
+    """An instance of cluster"""
+
+    def __init__(self, sim, port):
+        self.sim = sim
+        self.host = HOST
+        self.port = port
+        self.node_id = os.urandom(20).hex()
+        self.known = set([self.node_id])
+        self.master_id = None
+        self.migrating = {}
+        self.importing = {}
+        self.keys = {}
+        self.epoch = 0
+        self.last_save = int(time.time())
+        self.config = {
+            'dir': '/tmp',
+            'dbfilename': 'dump-{}.rdb'.format(port),
+            'cluster-enabled': 'yes',
+            'maxmemory': '0',
+        }
+
+    @property
+    def addr(self):
+        return '{}:{}'.format(self.host, self.port)
+
+    @property
+    def master(self):
+        return self.master_id is None
+
+    def key_count(self):
+        return sum(len(keys) for keys in self.keys.values())
+
+    # commands
+
+    def cmd_ping(self, *args):
+        return Status('PONG')
+
+    def cmd_dbsize(self):
+        return self.key_count()
+
+    def cmd_bgsave(self):
+        self.last_save = int(time.time())
+        return Status('Background saving started')
+
+    def cmd_role(self):
+        if self.master:
+            slaves = [
+                [n.host, str(n.port), '0'] for n in self.sim.slaves_of(self)
+            ]
+            return ['master', 0, slaves]
+        master = self.sim.nodes[self.master_id]
+        return ['slave', master.host, master.port, 'connected', 0]
+
+    def cmd_info(self, *section):
+        role = 'master' if self.master else 'slave'
+        lines = [
+            '# Server',
+            'redis_version:5.0.0',
+            'tcp_port:{}'.format(self.port),
+            '# Replication',
+            'role:{}'.format(role),
+            'connected_slaves:{}'.format(len(self.sim.slaves_of(self))),
+            '# Persistence',
+            'loading:0',
+            'rdb_bgsave_in_progress:0',
+            'rdb_last_save_time:{}'.format(self.last_save),
+            'rdb_last_bgsave_status:ok',
+            '# Cluster',
+            'cluster_enabled:1',
+            '# Keyspace',
+            'db0:keys={},expires=0,avg_ttl=0'.format(self.key_count()),
+        ]
+        return '\r\n'.join(lines) + '\r\n'
+
+    def cmd_config(self, sub, *args):
+        sub = sub.lower()
+        if sub == 'get':
+            value = self.config.get(args[0])
+            return [] if value is None else [args[0], value]
+        if sub == 'set':
+            self.config[args[0]] = args[1]
+            return OK
+        return Error('ERR CONFIG subcommand must be one of GET, SET')
+
+    async def cmd_migrate(self, host, port, key, db, timeout, *options):
+        options = list(options)
+        keys = [key] if key else []
+        if 'KEYS' in [o.upper() for o in options]:
+            i = [o.upper() for o in options].index('KEYS')
+            keys = options[i + 1:]
+        target = self.sim.by_addr.get('{}:{}'.format(host, port))
+        if target is None:
+            return Error('IOERR error or timeout connecting to the client')
+        moved = 0
+        for name in keys:
+            slot = self.sim.key_slot.get(name)
+            if slot is None or name not in self.keys.get(slot, {}):
+                continue
+            del self.keys[slot][name]
+            target.keys.setdefault(slot, {})[name] = None
+            moved += 1
+        if not moved:
+            return Status('NOKEY')
+        self.sim.stat['migrated'] += moved
+        if self.sim.migrate_cost:
+            await asyncio.sleep(self.sim.migrate_cost * moved)
+        return OK
+
+    async def cmd_cluster(self, sub, *args):
+        handler = getattr(self, 'cluster_' + sub.lower(), None)
+        if handler is None:
+            return Error('ERR Unknown subcommand or wrong number of arguments')
+        ret = handler(*args)
+        if asyncio.iscoroutine(ret):
+            ret = await ret
+        return ret
+
+    def cluster_myid(self):
+        return self.node_id
+
+    def cluster_info(self):
+        assigned = self.sim.assigned(self.known)
+        state = 'ok' if assigned == SLOT_COUNT else 'fail'
+        masters = [
+            i for i in self.known if self.sim.slot_ranges().get(i)
+        ]
+        lines = [
+            'cluster_state:{}'.format(state),
+            'cluster_slots_assigned:{}'.format(assigned),
+            'cluster_slots_ok:{}'.format(assigned),
+            'cluster_slots_pfail:0',
+            'cluster_slots_fail:0',
+            'cluster_known_nodes:{}'.format(len(self.known)),
+            'cluster_size:{}'.format(len(masters)),
+            'cluster_current_epoch:{}'.format(self.sim.epoch),
+            'cluster_my_epoch:{}'.format(self.epoch),
+        ]
+        return '\r\n'.join(lines) + '\r\n'
+
+    def cluster_nodes(self):
+        ranges = self.sim.slot_ranges()
+        lines = []
+        for node_id in sorted(self.known):
+            node = self.sim.nodes[node_id]
+            flags = ['master' if node.master else 'slave']
+            if node is self:
+                flags.insert(0, 'myself')
+            fields = [
+                node.node_id,
+                '{}@{}'.format(node.addr, node.port + 10000),
+                ','.join(flags),
+                node.master_id or '-',
+                '0',
+                str(int(time.time() * 1000)),
+                str(node.epoch),
+                'connected',
+            ]
+            fields += ranges.get(node_id, [])
+            if node is self:
+                for slot, dst in sorted(self.migrating.items()):
+                    fields.append('[{}->-{}]'.format(slot, dst))
+                for slot, src in sorted(self.importing.items()):
+                    fields.append('[{}-<-{}]'.format(slot, src))
+            lines.append(' '.join(fields))
+        return '\n'.join(lines) + '\n'
+
+    def cluster_meet(self, host, port, *args):
+        other = self.sim.by_addr.get('{}:{}'.format(host, port))
+        if other is not None:
+            self.sim.meet(self, other)
+        return OK
+
+    def cluster_forget(self, node_id):
+        if node_id == self.node_id:
+            return Error("ERR I tried hard but I can't forget myself...")
+        if node_id not in self.known:
+            return Error('ERR Unknown node {}'.format(node_id))
+        self.known.discard(node_id)
+        return OK
+
+    def cluster_addslots(self, *slots):
+        slots = [int(s) for s in slots]
+        for slot in slots:
+            if self.sim.owner[slot] is not None:
+                return Error('ERR Slot {} is already busy'.format(slot))
+        for slot in slots:
+            self.sim.set_owner(slot, self.node_id)
+        return OK
+
+    def cluster_setslot(self, slot, sub, node_id=None):
+        slot = int(slot)
+        sub = sub.lower()
+        owner = self.sim.owner[slot]
+        if sub == 'importing':
+            if owner == self.node_id:
+                msg = "ERR I'm already the owner of hash slot {}"
+                return Error(msg.format(slot))
+            self.importing[slot] = node_id
+            return OK
+        if sub == 'migrating':
+            if owner != self.node_id:
+                msg = "ERR I'm not the owner of hash slot {}"
+                return Error(msg.format(slot))
+            self.migrating[slot] = node_id
+            return OK
+        if sub == 'stable':
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+            return OK
+        if sub == 'node':
+            if node_id not in self.sim.nodes:
+                return Error('ERR Unknown node {}'.format(node_id))
+            if (owner == self.node_id and node_id != self.node_id
+                    and self.keys.get(slot)):
+                msg = ("ERR Can't assign hashslot {} to a different node "
+                       "while I still hold keys for this hash slot.")
+                return Error(msg.format(slot))
+            self.sim.set_owner(slot, node_id)
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+            return OK
+        return Error('ERR Invalid CLUSTER SETSLOT action or number of '
+                     'arguments')
+
+    def cluster_getkeysinslot(self, slot, count):
+        keys = self.keys.get(int(slot), {})
+        return list(itertools.islice(keys, int(count)))
+
+    def cluster_countkeysinslot(self, slot):
+        return len(self.keys.get(int(slot), {}))
+
+    def cluster_replicate(self, node_id):
+        master = self.sim.nodes.get(node_id)
+        if master is None or node_id not in self.known:
+            return Error('ERR Unknown node {}'.format(node_id))
+        if not master.master:
+            return Error('ERR I can only replicate a master, not a replica.')
+        if self.sim.slot_ranges().get(self.node_id) or self.key_count():
+            return Error('ERR To set a master the node must be empty and '
+                         'without assigned slots.')
+        self.master_id = node_id
+        return OK
+
+    def cluster_failover(self, *options):
+        if self.master:
+            return Error('ERR You should send CLUSTER FAILOVER to a slave')
+        self.sim.schedule_failover(self)
+        return OK
+
+    def cluster_reset(self, *options):
+        if self.master and self.key_count():
+            return Error("ERR CLUSTER RESET can't be called with master "
+                         "nodes containing keys")
+        for slot, owner in enumerate(self.sim.owner):
+            if owner == self.node_id:
+                self.sim.set_owner(slot, None)
+        for node_id in self.known:
+            self.sim.nodes[node_id].known.discard(self.node_id)
+        self.known = set([self.node_id])
+        self.master_id = None
+        self.migrating = {}
+        self.importing = {}
+        return OK
+
+
+class ClusterSimulator(object):
+    """Instances of a cluster served on a background event loop"""
+
+    def __init__(self, count, latency=0.0, migrate_cost=0.0,
+                 failover_delay=0.1):
+        """
+        :param count: number of instances
+        :param latency: round trip time(sec) added to each reply
+        :param migrate_cost: time(sec) to migrate a key
+        :param failover_delay: time(sec) from CLUSTER FAILOVER to promotion
+        """
+        self.count = count
+        self.latency = latency
+        self.migrate_cost = migrate_cost
+        self.failover_delay = failover_delay
+        self.nodes = {}
+        self.by_addr = {}
+        self.owner = [None] * SLOT_COUNT
+        self.key_slot = {}
+        self.epoch = 0
+        self.stat = {}
+        self.reset_stat()
+        self._ranges = None
+        self._ordered = []
+        self._servers = []
+        self._writers = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def addrs(self):
+        """list of (host, port) in start order"""
+        return [(node.host, node.port) for node in self._ordered]
+
+    # state. called on the loop
+
+    def reset_stat(self):
+        self.stat.update({'connections': 0, 'commands': 0, 'migrated': 0})
+
+    def slaves_of(self, master):
+        return [
+            n for n in self.nodes.values() if n.master_id == master.node_id
+        ]
+
+    def set_owner(self, slot, node_id):
+        self.owner[slot] = node_id
+        self._ranges = None
+
+    def assigned(self, node_ids):
+        return sum(1 for owner in self.owner if owner in node_ids)
+
+    def slot_ranges(self):
+        """dict {node id: list of 'begin-end'}"""
+        if self._ranges is not None:
+            return self._ranges
+        ranges = {}
+        begin = 0
+        for slot in range(1, SLOT_COUNT + 1):
+            if slot < SLOT_COUNT and self.owner[slot] == self.owner[begin]:
+                continue
+            owner = self.owner[begin]
+            if owner is not None:
+                end = slot - 1
+                text = str(begin) if begin == end else '{}-{}'.format(begin,
+                                                                      end)
+                ranges.setdefault(owner, []).append(text)
+            begin = slot
+        self._ranges = ranges
+        return ranges
+
+    def meet(self, node, other):
+        known = node.known | other.known
+        for node_id in known:
+            self.nodes[node_id].known = set(known)
+
+    def schedule_failover(self, slave):
+        self._loop.call_later(self.failover_delay, self._promote, slave)
+
+    def _promote(self, slave):
+        old = self.nodes.get(slave.master_id)
+        if old is None:
+            return
+        for slot, owner in enumerate(self.owner):
+            if owner == old.node_id:
+                self.set_owner(slot, slave.node_id)
+        slave.keys, old.keys = old.keys, {}
+        for node in self.slaves_of(old):
+            node.master_id = slave.node_id
+        slave.master_id = None
+        old.master_id = slave.node_id
+        self.epoch += 1
+        slave.epoch = self.epoch
+
+    def _fill(self, keys_per_slot):
+        for slot, owner in enumerate(self.owner):
+            if owner is None:
+                continue
+            keys = self.nodes[owner].keys.setdefault(slot, {})
+            for i in range(keys_per_slot):
+                name = 'key:{}:{}'.format(slot, i)
+                keys[name] = None
+                self.key_slot[name] = slot
+        return keys_per_slot * sum(1 for o in self.owner if o is not None)
+
+    # server
+
+    async def _dispatch(self, node, request):
+        args = [a.decode() for a in request]
+        handler = getattr(node, 'cmd_' + args[0].lower(), None)
+        self.stat['commands'] += 1
+        if handler is None:
+            return Error("ERR unknown command '{}'".format(args[0]))
+        try:
+            ret = handler(*args[1:])
+            if asyncio.iscoroutine(ret):
+                ret = await ret
+            return ret
+        except (TypeError, ValueError, IndexError) as ex:
+            return Error('ERR {}'.format(ex))
+
+    async def _serve(self, node, reader, writer):
+        self.stat['connections'] += 1
+        self._writers.add(writer)
+        parser = hiredis.Reader()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                parser.feed(data)
+                out = []
+                while True:
+                    request = parser.gets()
+                    if request is False:
+                        break
+                    out.append(encode(await self._dispatch(node, request)))
+                if not out:
+                    continue
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(b''.join(out))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _start_servers(self):
+        for _ in range(self.count):
+            holder = []
+            server = await asyncio.start_server(
+                lambda r, w, holder=holder: self._serve(holder[0], r, w),
+                HOST,
+                0,
+                backlog=1024
+            )
+            port = server.sockets[0].getsockname()[1]
+            node = SimNode(self, port)
+            holder.append(node)
+            self.nodes[node.node_id] = node
+            self.by_addr[node.addr] = node
+            self._ordered.append(node)
+            self._servers.append(server)
+
+    def _run_loop(self, started):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start_servers())
+        started.set()
+        self._loop.run_forever()
+        for server in self._servers:
+            server.close()
+        # handlers of open connections end with EOF
+        for writer in list(self._writers):
+            writer.close()
+        if hasattr(asyncio, 'all_tasks'):
+            tasks = asyncio.all_tasks(self._loop)
+        else:
+            tasks = asyncio.Task.all_tasks(self._loop)
+        self._loop.run_until_complete(
+            asyncio.gather(*tasks, return_exceptions=True)
+        )
+        self._loop.close()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_loop,
+            args=(started,)
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def call(self, func, *args):
+        """Run func on the loop and return its result"""
+        async def _call():
+            return func(*args)
+        future = asyncio.run_coroutine_threadsafe(_call(), self._loop)
+        return future.result()
+
+    def fill(self, keys_per_slot):
+        """Put keys to owner of each slot
+
+        :return: number of keys
+        """
+        return self.call(self._fill, keys_per_slot)
+
+    def node(self, host, port):
+        return self.by_addr['{}:{}'.format(host, port)]
@@ -0,0 +1,6 @@
+"""Environment needed to import ltcli"""
+import os
+import tempfile
+
+os.environ.setdefault('FBPATH', tempfile.mkdtemp(prefix='ltcli-test-'))
+os.environ.setdefault('LANG', 'C.UTF-8')
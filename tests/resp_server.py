@@ -0,0 +1,68 @@
+"""Local RESP server answering commands with a function, for tests"""
+import socket
+import threading
+
+import hiredis
+
+
+def encode(value):
+    """RESP of str, bytes, int, list or Exception"""
+    if isinstance(value, Exception):
+        return '-{}\r\n'.format(value).encode('utf-8')
+    if isinstance(value, int):
+        return ':{}\r\n'.format(value).encode('utf-8')
+    if isinstance(value, list):
+        head = '*{}\r\n'.format(len(value)).encode('utf-8')
+        return head + b''.join(encode(item) for item in value)
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return b'$' + str(len(value)).encode('utf-8') + b'\r\n' + value + b'\r\n'
+
+
+class RespServer(object):
+    """Serve on 127.0.0.1 with a thread per connection
+
+    :param handler: function(list of str args) returning reply value
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (OSError, socket.error):
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        reader = hiredis.Reader(encoding='utf-8')
+        try:
+            while True:
+                data = conn.recv(16384)
+                if not data:
+                    return
+                reader.feed(data)
+                command = reader.gets()
+                while command is not False:
+                    conn.sendall(encode(self.handler(command)))
+                    command = reader.gets()
+        except (OSError, socket.error):
+            return
+        finally:
+            conn.close()
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,38 @@
+from ltcli import agent_server
+
+
+TCP_TABLE = '''\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:18EB 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 12345 1
+   1: 0100007F:0016 0100007F:D3A2 01 00000000:00000000 00:00000000 00000000     0        0 23456 1
+'''
+
+NETSTAT = '''\
+Active Internet connections (including servers)
+Proto Recv-Q Send-Q  Local Address          Foreign Address        (state)
+tcp4       0      0  *.18100                *.*                    LISTEN
+tcp46      0      0  *.22                   *.*                    LISTEN
+tcp4       0      0  127.0.0.1.5432         *.*                    LISTEN
+tcp        0      0 0.0.0.0:6379            0.0.0.0:*              LISTEN
+tcp6       0      0 :::6380                 :::*                   LISTEN
+tcp4       0      0  10.0.0.1.22            10.0.0.2.55555         ESTABLISHED
+udp4       0      0  *.68                   *.*
+'''
+
+
+def test_parse_tcp_table():
+    assert agent_server.parse_tcp_table(TCP_TABLE) == {6379: (1000, 12345)}
+
+
+def test_parse_netstat_listen():
+    ports = agent_server.parse_netstat_listen(NETSTAT)
+    assert ports == set([18100, 22, 5432, 6379, 6380])
+
+
+def test_parse_socket_owners():
+    lines = [
+        '/proc/123/fd socket:[4567]',
+        '/proc/124/fd pipe:[1]',
+        'garbage',
+    ]
+    assert agent_server.parse_socket_owners(lines) == {4567: 123}
@@ -0,0 +1,192 @@
+import socket
+import threading
+import time
+
+import hiredis
+import pytest
+
+try:
+    import asyncio
+    from ltcli import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+pytestmark = pytest.mark.skipif(aio is None, reason='python 3 only')
+
+
+class _RedisServer(object):
+    """Answer PING, ECHO and SLEEP <sec> on a local port"""
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def _reply(command):
+        name = command[0].lower()
+        if name == b'ping':
+            return b'+PONG\r\n'
+        if name == b'echo':
+            return b'$%d\r\n%s\r\n' % (len(command[1]), command[1])
+        if name == b'sleep':
+            time.sleep(float(command[1]))
+            return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
+
+    def _serve(self, conn):
+        reader = hiredis.Reader()
+        with conn:
+            while True:
+                try:
+                    data = conn.recv(16384)
+                except OSError:
+                    return
+                if not data:
+                    return
+                reader.feed(data)
+                command = reader.gets()
+                while command is not False:
+                    conn.sendall(self._reply(command))
+                    command = reader.gets()
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def server():
+    server = _RedisServer()
+    yield server
+    server.close()
+
+
+def test_gather_keeps_order_and_limit():
+    running = [0, 0]
+
+    async def _work(i):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01 * (5 - i))
+        running[0] -= 1
+        if i == 3:
+            raise ValueError(i)
+        return i * 10
+
+    results = aio.run(aio.gather(_work, list(range(5)), limit=2))
+    assert [r.args for r in results] == [(i,) for i in range(5)]
+    assert [r.value for r in results] == [0, 10, 20, None, 40]
+    assert isinstance(results[3].error, ValueError)
+    assert running[1] == 2
+
+
+def test_gather_timeout():
+    async def _work(sec):
+        await asyncio.sleep(sec)
+        return sec
+
+    results = aio.run(aio.gather(_work, [0, 1], timeout=0.1))
+    assert results[0].ok and results[0].value == 0
+    assert isinstance(results[1].error, asyncio.TimeoutError)
+
+
+def test_pool_reuses_connection(server):
+    async def _main():
+        pool = aio.RedisPool(timeout=1)
+        try:
+            for _ in range(3):
+                assert await pool.execute('127.0.0.1', server.port,
+                                          'ping') == 'PONG'
+            return await pool.execute_bulk(
+                '127.0.0.1', server.port, [['echo', 'a'], ['unknown']]
+            )
+        finally:
+            pool.close()
+
+    replies = aio.run(_main())
+    assert replies[0] == 'a'
+    assert isinstance(replies[1], hiredis.ReplyError)
+    assert server.connections == 1
+
+
+def test_pool_timeout_drops_connection(server):
+    async def _main():
+        pool = aio.RedisPool(timeout=0.1)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.execute('127.0.0.1', server.port, 'sleep', 0.5)
+            # reply of timed out command must not be read by next command
+            return await pool.execute('127.0.0.1', server.port, 'echo', 'b')
+        finally:
+            pool.close()
+
+    assert aio.run(_main()) == 'b'
+    assert server.connections == 2
+
+
+def test_execute_all(server):
+    addrs = [('127.0.0.1', server.port), ('127.0.0.1', 1)]
+    results = aio.execute_all(addrs, ['echo', 'x'], timeout=1)
+    assert results[0].value == 'x'
+    assert not results[1].ok
+
+
+def test_task_graph_runs_after_deps():
+    order = []
+
+    def _task(name, sec=0, error=None):
+        async def _run():
+            await asyncio.sleep(sec)
+            if error is not None:
+                raise error
+            order.append(name)
+            return name
+        return _run
+
+    graph = aio.TaskGraph(limit=4)
+    graph.add('a', _task('a', 0.02))
+    graph.add('b', _task('b'))
+    graph.add('c', _task('c'), deps=['a', 'b'])
+    graph.add('d', _task('d', error=ValueError('d')), deps=['b'])
+    graph.add('e', _task('e'), deps=['d'])
+    results = aio.run(graph.run())
+    assert order == ['b', 'a', 'c']
+    assert results['c'].value == 'c'
+    assert isinstance(results['d'].error, ValueError)
+    # not run, failed with error of dependency
+    assert results['e'].error is results['d'].error
+
+
+def test_task_graph_timeout():
+    async def _slow():
+        await asyncio.sleep(1)
+
+    graph = aio.TaskGraph()
+    graph.add('slow', _slow)
+    results = aio.run(graph.run(timeout=0.1))
+    assert isinstance(results['slow'].error, asyncio.TimeoutError)
+
+
+def test_run_graph_calls_blocking_functions():
+    def _build(graph, adapter):
+        graph.add('sleep', lambda: adapter.call(time.sleep, 0.01))
+        graph.add('add', lambda: adapter.call(sum, [1, 2]), deps=['sleep'])
+
+    results = aio.run_graph(_build)
+    assert results['add'].value == 3
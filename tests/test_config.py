@@ -0,0 +1,42 @@
+import pytest
+
+from ltcli import config
+from ltcli.exceptions import PropsKeyError
+
+
+@pytest.fixture
+def props_path(tmp_path, monkeypatch):
+    path = tmp_path / 'redis.properties'
+    monkeypatch.setenv('USER', 'ltdb')
+    monkeypatch.setattr(config, 'get_path_of_fb', lambda cluster_id: {
+        'redis_properties': str(path),
+        'sr2_redis_lib': str(tmp_path / 'lib'),
+    })
+    config._instance_tables.clear()
+    yield path
+    config._instance_tables.clear()
+
+
+def test_instance_table_without_props(props_path):
+    table = config.get_instance_table(1)
+    assert table.master_hosts == ()
+    assert table.addrs() == []
+    assert table.instances() == []
+
+
+def test_instance_table_without_data_paths(props_path):
+    props = {
+        'sr2_redis_master_hosts': ['127.0.0.1'],
+        'sr2_redis_master_ports': [18100],
+    }
+    table = config.InstanceTable(1, props, 'ltdb')
+    # hosts and ports do not need paths
+    assert table.addrs() == [('127.0.0.1', 18100)]
+    with pytest.raises(PropsKeyError):
+        table.paths(18100)
+    props['sr2_redis_data'] = '/sata_ssd/ssd_'
+    props['sr2_flash_db_path'] = '/sata_ssd/ssd_'
+    table = config.InstanceTable(1, props, 'ltdb')
+    instance = table.get('127.0.0.1', 18100)
+    assert instance.role == 'master'
+    assert instance.redis_data == table.paths(18100).redis_data
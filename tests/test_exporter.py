@@ -0,0 +1,49 @@
+import threading
+
+from six.moves.urllib.request import urlopen
+
+from ltcli.exporter import Exporter
+from tests.resp_server import RespServer
+
+
+SCRAPES = 50
+
+
+def _reply(args):
+    if args[0].lower() == 'cluster':
+        return 'cluster_state:ok\r\ncluster_slots_ok:16384\r\n'
+    lines = ['# {}'.format(args[1]), 'role:master', 'used_memory:1024']
+    # large reply, so that kept replies would show
+    lines += ['padding_{}:{}'.format(i, 'x' * 40) for i in range(500)]
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def test_repeated_scrapes_keep_connection_bounded():
+    server = RespServer(_reply)
+    exporter = Exporter(
+        [('master', 'localhost', '127.0.0.1', server.port)],
+        1,
+        port=0,
+        min_interval=0
+    )
+    port = exporter.server.server_address[1]
+    thread = threading.Thread(target=exporter.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:{}/metrics'.format(port)
+        for _ in range(SCRAPES):
+            body = urlopen(url).read().decode('utf-8')
+            assert 'ltcli_redis_up' in body
+        pool = exporter.cache.collector.pool
+        conns = [c for idle in pool._idle.values() for c in idle]
+        assert len(conns) == 1
+        assert conns[0].received_bytes > 1024 * 1024
+        for value in vars(conns[0]).values():
+            if isinstance(value, (bytes, str)):
+                assert len(value) < 64 * 1024
+        assert server.connections == 1
+    finally:
+        exporter.shutdown()
+        thread.join(5)
+        server.close()
@@ -0,0 +1,7 @@
+from ltcli.failover import split_addr
+
+
+def test_split_addr():
+    assert split_addr('10.0.0.1:18100') == ('10.0.0.1', 18100)
+    assert split_addr('10.0.0.1:18100@28100') == ('10.0.0.1', 18100)
+    assert split_addr('::1:18100') == ('::1', 18100)
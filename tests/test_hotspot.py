@@ -0,0 +1,75 @@
+import pytest
+
+from ltcli.exceptions import ClusterRedisError
+from ltcli.hotspot import (
+    MAX_WEIGHT,
+    SLOT_COUNT,
+    WEIGHT_SCALE,
+    HotspotReport,
+    NodeLoad,
+)
+
+
+class _Node(object):
+    def __init__(self, node_id, slots):
+        self.node_id = node_id
+        self.host = '127.0.0.1'
+        self.port = 18100
+        self.assigned_slots = slots
+
+
+def _loads(*specs):
+    """
+    :param specs: list of (node id, number of slots, ops)
+    """
+    loads = []
+    start = 0
+    for node_id, count, ops in specs:
+        load = NodeLoad(_Node(node_id, range(start, start + count)))
+        load.ops = ops
+        loads.append(load)
+        start += count
+    return loads
+
+
+def test_weights_even_load():
+    half = SLOT_COUNT // 2
+    report = HotspotReport(_loads(('a', half, 100), ('b', half, 100)), 1)
+    assert report.weights() == {'a': WEIGHT_SCALE, 'b': WEIGHT_SCALE}
+
+
+def test_weights_hot_node_gets_less():
+    half = SLOT_COUNT // 2
+    report = HotspotReport(_loads(('a', half, 300), ('b', half, 100)), 1)
+    weights = report.weights()
+    assert weights['a'] < WEIGHT_SCALE < weights['b']
+    assert report.node_skew() == 1.5
+
+
+def test_weights_idle_and_empty_node():
+    half = SLOT_COUNT // 2
+    report = HotspotReport(
+        _loads(('a', half, 100), ('b', half, 0), ('c', 0, 0)),
+        1
+    )
+    weights = report.weights()
+    assert weights['b'] == MAX_WEIGHT
+    assert weights['c'] == WEIGHT_SCALE
+    assert weights['a'] <= MAX_WEIGHT
+
+
+def test_load_share_by_keys_without_ops():
+    report = HotspotReport(_loads(('a', 10, 0), ('b', 10, 0)), 1)
+    report.loads[0].slot_keys = {0: 30}
+    report.loads[1].slot_keys = {10: 10}
+    assert report.load_share(report.loads[0]) == 0.75
+    assert report.hot_slots(1) == [(0, 30, '127.0.0.1:18100')]
+
+
+def test_weights_refused_with_failed_node():
+    half = SLOT_COUNT // 2
+    report = HotspotReport(_loads(('a', half, 100), ('b', half, 0)), 1)
+    report.loads[1].error = IOError('timeout')
+    assert report.failed() == ['127.0.0.1:18100']
+    with pytest.raises(ClusterRedisError):
+        report.weights()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import time
+
+from ltcli import net
+
+
+class _Channel(object):
+    """Channel of which output is given in chunks"""
+
+    def __init__(self, out=(), err=(), status=0, endless=False):
+        self.out = list(out)
+        self.err = list(err)
+        self.status = status
+        self.endless = endless
+
+    def recv_ready(self):
+        return self.endless or bool(self.out)
+
+    def recv(self, size):
+        if self.endless:
+            return b'line\n'
+        return self.out.pop(0)
+
+    def recv_stderr_ready(self):
+        return bool(self.err)
+
+    def recv_stderr(self, size):
+        return self.err.pop(0)
+
+    def exit_status_ready(self):
+        return not self.endless
+
+    def recv_exit_status(self):
+        return self.status
+
+
+def _lines(text):
+    ret = []
+    buf = net._LineBuffer(ret.append, max_line=4)
+    buf.feed(text)
+    buf.flush()
+    return ret
+
+
+def test_line_buffer():
+    assert _lines(u'a\r\nb\n\nc') == [u'a', u'b', u'', u'c']
+    # line being received is not kept longer than max_line
+    assert _lines(u'0123456789') == [u'0123', u'4567', u'89']
+
+
+def test_line_buffer_joins_chunks():
+    ret = []
+    buf = net._LineBuffer(ret.append)
+    buf.feed(u'ab')
+    buf.feed(u'c\nd')
+    assert ret == [u'abc']
+    buf.flush()
+    assert ret == [u'abc', u'd']
+
+
+def test_read_channel_decodes_split_chars():
+    text = u'가나\n'.encode('utf-8')
+    channel = _Channel(out=[text[:2], text[2:]], err=[b'e'], status=3)
+    out = []
+    err = []
+    status = net._read_channel(channel, out.append, err.append)
+    assert status == 3
+    assert u''.join(out) == u'가나\n'
+    assert err == [u'e']
+
+
+def test_read_channel_times_out_on_endless_output():
+    received = []
+    start = time.time()
+    status = net._read_channel(
+        _Channel(endless=True),
+        received.append,
+        received.append,
+        timeout=0.2
+    )
+    assert status is None
+    assert received
+    assert time.time() - start < 2
@@ -0,0 +1,24 @@
+from ltcli.rolling import Shard, make_waves
+
+
+def test_make_waves():
+    shards = [
+        Shard('m1', ['s1a', 's1b']),
+        Shard('m2', ['s2a']),
+        Shard('m3', []),
+    ]
+    slave_waves, master_waves = make_waves(shards)
+    # at most one instance of a shard in a wave
+    assert slave_waves == [['s1a'], ['s2a'], ['s1b']]
+    assert master_waves == [[('m1', 's1a')], [('m2', 's2a')]]
+
+
+def test_make_waves_width():
+    shards = [Shard('m{}'.format(i), ['s{}'.format(i)]) for i in range(5)]
+    slave_waves, master_waves = make_waves(shards, width=2)
+    assert slave_waves == [['s0', 's1'], ['s2', 's3'], ['s4']]
+    assert [len(wave) for wave in master_waves] == [2, 2, 1]
+
+
+def test_make_waves_empty():
+    assert make_waves([]) == ([], [])
@@ -0,0 +1,37 @@
+from ltcli.scan import ClusterScanner
+from tests.resp_server import RespServer
+
+
+PAGES = 300
+KEYS_PER_PAGE = 100
+
+
+def _scan(args):
+    assert args[0].lower() == 'scan'
+    page = int(args[1])
+    cursor = page + 1 if page + 1 < PAGES else 0
+    keys = ['key:{}:{}:{}'.format(page, i, 'x' * 40)
+            for i in range(KEYS_PER_PAGE)]
+    return [str(cursor), keys]
+
+
+def test_scan_keeps_connection_bounded():
+    server = RespServer(_scan)
+    scanner = ClusterScanner([('master', 'localhost', '127.0.0.1',
+                               server.port)])
+    try:
+        count = sum(1 for _ in scanner.keys())
+        assert count == PAGES * KEYS_PER_PAGE
+        assert scanner.errors == {}
+        conns = [c for idle in scanner.pool._idle.values() for c in idle]
+        assert len(conns) == 1
+        conn = conns[0]
+        # megabytes were received, but no reply is kept
+        assert conn.received_bytes > 1024 * 1024
+        for value in vars(conn).values():
+            if isinstance(value, (bytes, str)):
+                assert len(value) < 64 * 1024
+        assert server.connections == 1
+    finally:
+        scanner.close()
+        server.close()
@@ -0,0 +1,85 @@
+import calendar
+
+import pytest
+
+from ltcli import server_log
+
+
+LINE = '1234:M 19 Oct 2026 12:30:05.123 * Ready to accept connections'
+
+
+def test_parse_time():
+    ts = calendar.timegm((2026, 10, 19, 12, 30, 5, 0, 0, 0))
+    assert server_log.parse_time(LINE) == pytest.approx(ts + 0.123)
+    assert server_log.parse_time('  continued line') is None
+    assert server_log.parse_time('1:M 19 Foo 2026 12:30:05 x') is None
+
+
+def test_level_of():
+    assert server_log.level_of(LINE) == '*'
+    assert server_log.level_of('no level') is None
+
+
+def test_parse_time_option():
+    parse = server_log.parse_time_option
+    assert parse(None) is None
+    assert parse('20261019') == '20261019000000'
+    assert parse('20261019-1230', end=True) == '20261019123099'
+    assert parse('20261019-123005', end=True) == '20261019123005'
+    for value in ['2026', '20261340', '20261019-2560', '2026101x']:
+        with pytest.raises(ValueError):
+            parse(value, end=True)
+
+
+def test_select_log_dirs():
+    backups = ['20261001-000000', '20261010-000000', '20261020-000000']
+    select = server_log.select_log_dirs
+    assert select('/log', backups) == [
+        '/log/backup/20261001-000000',
+        '/log/backup/20261010-000000',
+        '/log/backup/20261020-000000',
+        '/log',
+    ]
+    # 20261010 backup has logs from 20261001 to 20261010
+    assert select('/log', backups, since='20261005000000',
+                  until='20261006000000') == ['/log/backup/20261010-000000']
+    # a day of margin
+    assert select('/log', backups, since='20261010120000') == [
+        '/log/backup/20261010-000000',
+        '/log/backup/20261020-000000',
+        '/log',
+    ]
+    assert select('/log', backups, until='20261019999999') == [
+        '/log/backup/20261001-000000',
+        '/log/backup/20261010-000000',
+        '/log/backup/20261020-000000',
+        '/log',
+    ]
+    assert select('/log', [], since='20261005000000') == ['/log']
+
+
+def test_log_merger_orders_by_time():
+    merger = server_log.LogMerger(delay=1.0)
+    merger.push('h2', 1, '1:M 19 Oct 2026 12:00:02.000 * b', received=10)
+    merger.push('h1', 2, '1:M 19 Oct 2026 12:00:01.000 * a', received=10)
+    # line without time follows previous line of its log
+    merger.push('h1', 2, 'continued', received=10)
+    merger.push('h1', 2, '1:M 19 Oct 2026 12:00:03.000 * c', received=11)
+    assert merger.pop_ready(now=10.5) == []
+    assert merger.pop_ready(now=11) == [
+        ('h1', 2, '1:M 19 Oct 2026 12:00:01.000 * a'),
+        ('h1', 2, 'continued'),
+        ('h2', 1, '1:M 19 Oct 2026 12:00:02.000 * b'),
+    ]
+    assert merger.flush() == [('h1', 2, '1:M 19 Oct 2026 12:00:03.000 * c')]
+    assert merger.flush() == []
+
+
+def test_grep_result():
+    result = server_log.GrepResult('h1')
+    result.feed('M\t/log/servers-0-18100.log\t' + LINE)
+    result.feed('C\t/log/servers-0-18100.log\t3')
+    result.feed('C\t/log/backup/x/servers-0-18100.log.gz\t2')
+    result.feed('broken')
+    assert result.counts == {18100: 5}
+    assert [line[2:] for line in result.lines] == [(18100, LINE)]